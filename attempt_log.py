@@ -0,0 +1,354 @@
+"""Columnar, append-only log of every graded answer, with fast statistics.
+
+Attempts are written into fixed-size chunks, one NumPy memmap (.npy) file per
+column per chunk, so recording an attempt is a handful of array assignments
+and analysing millions of attempts is a few vectorized passes over the
+columns.  Columns:
+
+    time     float64   seconds since the epoch
+    mode     uint8     index into `MODES`
+    key      int8      pitch class of the tonic (C=0)
+    minor    bool
+    target   int16[MAX_NOTES]  correct notes (mingus ints), -1 padded
+    answer   int16[MAX_NOTES]  the user's notes (mingus ints), -1 padded
+    correct  bool
+    latency  float32   seconds from the question sounding to the answer
+
+Usage:
+    $ python attempt_log.py stats [LOG_DIRECTORY]
+    $ python attempt_log.py benchmark --rows 5000000
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import os
+import time
+import glob
+import argparse
+import threading
+
+# Internal Dependencies
+from grading import align_batch
+from notenames import PITCH_CLASSES
+
+# External Dependencies
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+MODES = ['random_notes', 'interval', 'single_chord', 'progression',
+         'chord_tone', 'sight_singing']
+MAX_NOTES = 16
+CHUNK_ROWS = 2 ** 16
+DEGREE_NAMES = ['1', '2b', '2', '3b', '3', '4', '5b', '5', '6b', '6', '7b',
+                '7']
+
+_COLUMNS = [('time', np.float64, ()),
+            ('mode', np.uint8, ()),
+            ('key', np.int8, ()),
+            ('minor', np.bool_, ()),
+            ('target', np.int16, (MAX_NOTES,)),
+            ('answer', np.int16, (MAX_NOTES,)),
+            ('correct', np.bool_, ()),
+            ('latency', np.float32, ())]
+_FILL = {'target': -1, 'answer': -1, 'latency': np.nan}
+
+
+def key2pitch_class(key):
+    """Returns `(pitch class of tonic, minor)` for a key like 'Eb' or 'c#'."""
+    return PITCH_CLASSES[key], key[0] == key[0].lower()
+
+
+class AttemptLog(object):
+    """An append-only attempt log stored in the directory `path`.
+
+    `record_attempt` matches the interface expected of `Session.recorders`.
+    """
+    def __init__(self, path, chunk_rows=CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self._lock = threading.Lock()
+        if not os.path.exists(path):
+            os.makedirs(path)
+        chunks = self._chunk_numbers()
+        self._chunk = chunks[-1] if chunks else 0
+        self._columns = self._open_chunk(self._chunk)
+        self._row = int(np.count_nonzero(self._columns['time']))
+
+    def _chunk_numbers(self):
+        files = glob.glob(os.path.join(self.path, 'chunk*.time.npy'))
+        return sorted(int(os.path.basename(f)[5:11]) for f in files)
+
+    def _column_file(self, chunk, name):
+        return os.path.join(self.path, 'chunk{:06d}.{}.npy'.format(chunk, name))
+
+    def _open_chunk(self, chunk, mode='r+'):
+        columns = {}
+        for name, dtype, shape in _COLUMNS:
+            filename = self._column_file(chunk, name)
+            if os.path.exists(filename):
+                columns[name] = np.load(filename, mmap_mode=mode)
+            else:
+                columns[name] = open_memmap(filename, mode='w+', dtype=dtype,
+                                            shape=(self.chunk_rows,) + shape)
+                if name in _FILL:
+                    columns[name][:] = _FILL[name]
+        return columns
+
+    def _next_chunk(self):
+        self.flush()
+        self._chunk += 1
+        self._columns = self._open_chunk(self._chunk)
+        self._row = 0
+
+    def record_attempt(self, mode, key, target, answer, correct,
+                       latency=None, timestamp=None):
+        """Appends one attempt.  `key` is a key name (lower case for minor),
+        `target` and `answer` lists of ints (notes beyond `MAX_NOTES` are
+        dropped)."""
+        tonic, minor = key2pitch_class(key)
+        with self._lock:
+            if self._row == self.chunk_rows:
+                self._next_chunk()
+            c, k = self._columns, self._row
+            c['time'][k] = time.time() if timestamp is None else timestamp
+            c['mode'][k] = MODES.index(mode)
+            c['key'][k] = tonic
+            c['minor'][k] = minor
+            target = list(target)[:MAX_NOTES]
+            answer = list(answer)[:MAX_NOTES]
+            c['target'][k, :len(target)] = target
+            c['answer'][k, :len(answer)] = answer
+            c['correct'][k] = correct
+            if latency is not None:
+                c['latency'][k] = latency
+            self._row += 1
+
+    def append_columns(self, columns):
+        """Appends many attempts at once.  `columns` is a dictionary of
+        arrays, one per column, as returned by `load()`."""
+        n = len(columns['time'])
+        start = 0
+        with self._lock:
+            while start < n:
+                if self._row == self.chunk_rows:
+                    self._next_chunk()
+                count = min(n - start, self.chunk_rows - self._row)
+                for name, _, _ in _COLUMNS:
+                    if name in columns:
+                        self._columns[name][self._row:self._row + count] = \
+                            columns[name][start:start + count]
+                self._row += count
+                start += count
+
+    def flush(self):
+        for column in self._columns.values():
+            column.flush()
+
+    def __len__(self):
+        chunks = self._chunk_numbers()
+        return (len(chunks) - 1) * self.chunk_rows + self._row
+
+    def load(self):
+        """Returns a dictionary of (read-only) column arrays holding every
+        attempt logged."""
+        self.flush()
+        chunks = self._chunk_numbers()
+        parts = dict((name, []) for name, _, _ in _COLUMNS)
+        for chunk in chunks:
+            columns = self._open_chunk(chunk, mode='r')
+            rows = self.chunk_rows if chunk != chunks[-1] else self._row
+            for name in parts:
+                parts[name].append(columns[name][:rows])
+        return dict((name, np.concatenate(arrays) if len(arrays) > 1
+                     else arrays[0]) for name, arrays in parts.items())
+
+    def close(self):
+        self.flush()
+
+
+def stats(columns):
+    """Computes answer statistics from attempt log `columns`.  Answers are
+    aligned to the correct notes (see `grading.align_batch`), so a missed or
+    extra note doesn't shift the rest of the answer.
+
+    Returns a dictionary with:
+        confusion: 12x12 counts of (target, answer) semitones above the
+            tonic, over all aligned pairs of notes.
+        degree_attempts/degree_correct: per semitone above the tonic.
+        octave_attempts/octave_correct: per octave (register) of the target.
+        interval_attempts/interval_correct: per melodic interval (-24 to 24
+            semitones, index 0 is -24) into the target note.
+        mode_attempts/mode_correct: whole questions, per game mode.
+        missed/extra: per game mode, the correct notes missing from answers
+            and the answered notes that were extra.
+    """
+    # only look at as many note positions as were ever used
+    width = np.flatnonzero(((columns['target'] >= 0) |
+                            (columns['answer'] >= 0)).any(axis=0))
+    width = width[-1] + 1 if len(width) else 1
+    target = columns['target'][:, :width].astype(np.int16)
+    answer = columns['answer'][:, :width].astype(np.int16)
+    alignment = align_batch(target, answer)
+    partners = alignment['partners']
+    answer = np.take_along_axis(answer, np.maximum(partners, 0), axis=1)
+    tonic = columns['key'].astype(np.int16)[:, None]
+
+    has_target = target >= 0
+    answered = has_target & (partners >= 0) & (answer >= 0)
+    target_rel = (target - tonic) % 12
+    answer_rel = (answer - tonic) % 12
+    hit = alignment['credit']
+
+    out = {}
+    out['confusion'] = np.bincount(
+        (12 * target_rel + answer_rel)[answered],
+        minlength=144).reshape(12, 12)
+    out['degree_attempts'], out['degree_correct'] = _counts(
+        target_rel, hit, has_target, 12)
+
+    octave = np.clip(target // 12, 0, 10)
+    out['octave_attempts'], out['octave_correct'] = _counts(
+        octave, hit, has_target, 11)
+
+    steps = target[:, 1:] - target[:, :-1]
+    has_step = has_target[:, 1:] & has_target[:, :-1] & (np.abs(steps) <= 24)
+    out['interval_attempts'], out['interval_correct'] = _counts(
+        steps + 24, hit[:, 1:], has_step, 49)
+
+    mode = columns['mode']
+    out['mode_attempts'], out['mode_correct'] = _counts(
+        mode, columns['correct'], slice(None), len(MODES))
+    out['missed'] = np.bincount(mode, alignment['deletions'],
+                                minlength=len(MODES)).astype(int)
+    out['extra'] = np.bincount(mode, alignment['insertions'],
+                               minlength=len(MODES)).astype(int)
+    return out
+
+
+def _counts(x, hit, mask, size):
+    """Returns the counts of each value of `x[mask]` and of `x[mask & hit]`
+    (one `bincount` instead of two)."""
+    both = np.bincount((2 * x.astype(np.intp) + hit)[mask],
+                       minlength=2 * size).reshape(size, 2)
+    return both.sum(axis=1), both[:, 1]
+
+
+def _accuracy(correct, attempts):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(attempts > 0, correct / attempts, np.nan)
+
+
+def print_stats(columns):
+    """Prints a summary of `stats(columns)`."""
+    s = stats(columns)
+    print("Attempts:", len(columns['time']))
+
+    print("\nBy game mode:")
+    for k, m in enumerate(MODES):
+        if s['mode_attempts'][k]:
+            print("  {:>13}: {:7.2%} of {} ({} notes missed, {} extra)"
+                  "".format(m, s['mode_correct'][k] / s['mode_attempts'][k],
+                            s['mode_attempts'][k], s['missed'][k],
+                            s['extra'][k]))
+
+    print("\nBy scale degree:")
+    accuracy = _accuracy(s['degree_correct'], s['degree_attempts'])
+    for k, name in enumerate(DEGREE_NAMES):
+        if s['degree_attempts'][k]:
+            print("  {:>3}: {:7.2%} of {}".format(name, accuracy[k],
+                                                  s['degree_attempts'][k]))
+
+    print("\nBy octave:")
+    accuracy = _accuracy(s['octave_correct'], s['octave_attempts'])
+    for k in np.flatnonzero(s['octave_attempts']):
+        print("  {:>3}: {:7.2%} of {}".format(k, accuracy[k],
+                                              s['octave_attempts'][k]))
+
+    print("\nBy interval (semitones):")
+    accuracy = _accuracy(s['interval_correct'], s['interval_attempts'])
+    for k in np.flatnonzero(s['interval_attempts']):
+        print("  {:>+3}: {:7.2%} of {}".format(k - 24, accuracy[k],
+                                               s['interval_attempts'][k]))
+
+    print("\nConfusion (rows: correct degree, columns: answered degree):")
+    print("     " + "".join("{:>7}".format(x) for x in DEGREE_NAMES))
+    for name, row in zip(DEGREE_NAMES, s['confusion']):
+        print("  {:>3}".format(name) + "".join("{:>7}".format(x) for x in row))
+
+
+def synthetic_columns(rows, notes_per_phrase=3, seed=0):
+    """Returns `rows` random attempts (about 70% of notes answered
+    correctly) as columns, for benchmarking."""
+    rng = np.random.RandomState(seed)
+    target = np.full((rows, MAX_NOTES), -1, dtype=np.int16)
+    target[:, :notes_per_phrase] = rng.randint(28, 84, (rows, notes_per_phrase))
+    answer = target.copy()
+    wrong = rng.random_sample((rows, notes_per_phrase)) > 0.7
+    answer[:, :notes_per_phrase][wrong] += rng.randint(1, 12, wrong.sum())
+    return {'time': time.time() + np.arange(rows, dtype=np.float64),
+            'mode': rng.randint(0, len(MODES), rows).astype(np.uint8),
+            'key': rng.randint(0, 12, rows).astype(np.int8),
+            'minor': rng.random_sample(rows) < 0.5,
+            'target': target,
+            'answer': answer,
+            'correct': ~wrong.any(axis=1),
+            'latency': rng.random_sample(rows).astype(np.float32)}
+
+
+def benchmark(rows=1000000, path=None):
+    """Times logging and analysing `rows` synthetic attempts.  Returns a
+    dictionary of timings in seconds."""
+    import tempfile
+    import shutil
+    directory = path or tempfile.mkdtemp()
+    try:
+        log = AttemptLog(directory)
+        columns = synthetic_columns(rows)
+        results = {'rows': rows}
+
+        start = time.time()
+        log.append_columns(columns)
+        log.flush()
+        results['append_columns'] = time.time() - start
+
+        start = time.time()
+        for k in range(1000):
+            log.record_attempt('random_notes', 'C', [48, 52, 55],
+                               [48, 52, 55], True, 1.)
+        results['record_attempt'] = (time.time() - start) / 1000
+
+        start = time.time()
+        loaded = log.load()
+        results['load'] = time.time() - start
+
+        start = time.time()
+        stats(loaded)
+        results['stats'] = time.time() - start
+        log.close()
+        return results
+    finally:
+        if path is None:
+            shutil.rmtree(directory)
+
+
+def get_user_args():
+    parser = argparse.ArgumentParser(description="Attempt log statistics.")
+    parser.add_argument('command', choices=['stats', 'benchmark'])
+    parser.add_argument('path', nargs='?', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'saved_games',
+        'attempt_log'))
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help="number of synthetic attempts to benchmark with")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_user_args()
+    if args.command == 'stats':
+        print_stats(AttemptLog(args.path).load())
+    else:
+        for k, v in sorted(benchmark(args.rows).items()):
+            print("{:>15}: {}".format(k, v))
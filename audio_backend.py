@@ -0,0 +1,212 @@
+"""Audio backends.
+
+All playback goes through the current backend (see `get_backend()`) rather
+than through `mingus.midi.fluidsynth` directly.  The default backend plays
+through FluidSynth; `NullBackend` plays nothing, instead recording note
+events with virtual timestamps and returning instantly, so the game can run
+(and be tested or benchmarked) without an audio device."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import time
+import threading
+from collections import namedtuple
+
+try:
+    monotonic = time.monotonic
+except AttributeError:  # python 2
+    monotonic = time.time
+
+
+class NoteEvent(namedtuple('NoteEvent', 'time on note channel velocity')):
+    """A note-on (`on=True`) or note-off event recorded by `NullBackend`.
+    `note` is a MIDI note number."""
+    __slots__ = ()
+
+
+class AudioBackend(object):
+    """The interface expected of an audio backend.  Method names and
+    signatures follow `mingus.midi.fluidsynth`.  `realtime` is False for
+    backends whose `sleep()` doesn't actually wait."""
+    realtime = True
+
+    def init(self, sound_font):
+        return True
+
+    def play_Note(self, note, channel=1, velocity=100):
+        raise NotImplementedError
+
+    def stop_Note(self, note, channel=1):
+        raise NotImplementedError
+
+    def play_NoteContainer(self, nc, channel=1, velocity=100):
+        """Plays the notes in `nc` (a `NoteContainer` or list of notes)."""
+        if nc is None:
+            return True
+        return all(self.play_Note(n, channel, velocity) for n in nc)
+
+    def stop_NoteContainer(self, nc, channel=1):
+        if nc is None:
+            return True
+        return all(self.stop_Note(n, channel) for n in nc)
+
+    def play_Bar(self, bar, channel=1, bpm=120):
+        """Plays a `Bar`, blocking (in backend time) until it's done."""
+        qn_length = 60.0 / bpm
+        for nc in bar:
+            if not self.play_NoteContainer(nc[2], channel, 100):
+                return {}
+            if hasattr(nc[2], "bpm"):
+                bpm = nc[2].bpm
+                qn_length = 60.0 / bpm
+            self.sleep(qn_length * (4.0 / nc[1]))
+            self.stop_NoteContainer(nc[2], channel)
+        return {"bpm": bpm}
+
+    def now(self):
+        """Current time in seconds according to this backend's clock."""
+        return monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class FluidSynthBackend(AudioBackend):
+    """Plays through `mingus.midi.fluidsynth` (requires FluidSynth)."""
+    def __init__(self):
+        from mingus.midi import fluidsynth  # requires FluidSynth is installed
+        self.fluidsynth = fluidsynth
+
+    def init(self, sound_font):
+        return self.fluidsynth.init(sound_font)
+
+    def play_Note(self, note, channel=1, velocity=100):
+        return self.fluidsynth.play_Note(note, channel, velocity)
+
+    def stop_Note(self, note, channel=1):
+        return self.fluidsynth.stop_Note(note, channel)
+
+    def play_NoteContainer(self, nc, channel=1, velocity=100):
+        return self.fluidsynth.play_NoteContainer(nc, channel, velocity)
+
+    def stop_NoteContainer(self, nc, channel=1):
+        return self.fluidsynth.stop_NoteContainer(nc, channel)
+
+    def play_Bar(self, bar, channel=1, bpm=120):
+        return self.fluidsynth.play_Bar(bar, channel, bpm)
+
+
+class NullBackend(AudioBackend):
+    """Records note events against a virtual clock instead of playing them.
+
+    `sleep()` advances the virtual clock without waiting, so playing a phrase
+    costs no wall time.  Recorded events are kept in `events` as `NoteEvent`
+    objects (set `record=False` to only keep time)."""
+    realtime = False
+
+    def __init__(self, record=True):
+        self.record = record
+        self.clock = 0.
+        self.events = []
+
+    def play_Note(self, note, channel=1, velocity=100):
+        if self.record:
+            self.events.append(
+                NoteEvent(self.clock, True, int(note) + 12, channel, velocity))
+        return True
+
+    def stop_Note(self, note, channel=1):
+        if self.record:
+            self.events.append(
+                NoteEvent(self.clock, False, int(note) + 12, channel, 0))
+        return True
+
+    def now(self):
+        return self.clock
+
+    def sleep(self, seconds):
+        self.clock += seconds
+
+    def notes_played(self, since=0):
+        """Returns the MIDI numbers of notes started at or after virtual time
+        `since`."""
+        return [e.note for e in self.events if e.on and e.time >= since]
+
+    def reset(self):
+        self.clock = 0.
+        del self.events[:]
+
+
+class FluidSynthRenderer(object):
+    """Renders `Timeline` objects offline to 16-bit mono PCM using FluidSynth,
+    without opening an audio device.
+
+    The soundfont is loaded once; a single renderer can be shared between
+    threads (renders are serialized).
+
+    Args:
+        sound_font (str): path to a .sf2 file, e.g. `settings.SOUNDFONT`.
+        samplerate (int): output sample rate in Hz.
+        gain (float): FluidSynth gain.
+    """
+    def __init__(self, sound_font, samplerate=22050, gain=0.2):
+        from mingus.midi import pyfluidsynth  # requires FluidSynth
+        self.samplerate = samplerate
+        self.synth = pyfluidsynth.Synth(gain=gain, samplerate=samplerate)
+        self.sfid = self.synth.sfload(sound_font)
+        if self.sfid == -1:
+            raise IOError("Could not load sound font {}".format(sound_font))
+        self.synth.program_reset()
+        self._lock = threading.Lock()
+
+    def _samples(self, n):
+        import numpy as np
+        stereo = np.asarray(self.synth.get_samples(n), dtype=np.int32)
+        return (stereo.reshape(-1, 2).sum(axis=1) // 2).astype(np.int16)
+
+    def render(self, timeline, tail=0.5, channel=1):
+        """Returns the rendered `timeline` as an `int16` NumPy array, followed
+        by `tail` seconds to let the last notes ring out."""
+        import numpy as np
+        sr = self.samplerate
+        chunks = []
+        with self._lock:
+            position = 0  # in samples
+            for event in timeline.sorted_events():
+                frame = int(round(event.time * sr))
+                if frame > position:
+                    chunks.append(self._samples(frame - position))
+                    position = frame
+                for note in event.notes:
+                    if event.on:
+                        self.synth.noteon(channel, int(note) + 12,
+                                          event.velocity)
+                    else:
+                        self.synth.noteoff(channel, int(note) + 12)
+            end = int(round((timeline.duration + tail) * sr))
+            if end > position:
+                chunks.append(self._samples(end - position))
+        if not chunks:
+            return np.zeros(0, dtype=np.int16)
+        return np.concatenate(chunks)
+
+
+_backend = None
+
+
+def get_backend():
+    """Returns the current audio backend, creating a `FluidSynthBackend` if
+    none has been set."""
+    global _backend
+    if _backend is None:
+        _backend = FluidSynthBackend()
+    return _backend
+
+
+def set_backend(backend):
+    """Sets (and returns) the audio backend used for all playback."""
+    global _backend
+    _backend = backend
+    return backend
@@ -0,0 +1,630 @@
+"""Benchmark suite.
+
+Times the core of the game with fixed seeds and synthetic inputs (no audio
+or MIDI devices needed): music theory helpers, voicing, pitch detection on
+generated audio, sample-bank playback, MIDI listening with replayed events,
+and the simulated game loop.  Results are written as JSON and can be
+compared against a stored baseline.
+
+Each timing is also divided by the time of a fixed reference workload (a
+mix of interpreted Python and small NumPy calls) timed right after it, and
+baselines are compared by these relative times, so that a faster or slower
+(or busier) machine doesn't show up as a change.  Still, a baseline is best
+regenerated on the machine it's compared on; `compare()` warns if it wasn't.
+
+Usage:
+    $ python benchmarks.py --save-baseline        # on the reference version
+    $ python benchmarks.py --threshold 0.25       # after changes
+Exits with status 1 if any benchmark is slower than the baseline by more
+than the threshold (a fraction).
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import io
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import threading
+from collections import OrderedDict
+
+# Internal Dependencies
+from musictools import (Diatonic, get_diatonic, interval_offsets,
+                        voice_progression, chordname, isvalidnote, parse2note)
+from mic_listen import (PitchDetector, MultiPitchDetector, NoiseGate,
+                        FRAME_SIZE, FRAMES_PER_FFT, FSAMP, NOTE_MIN, NOTE_MAX,
+                        CALIBRATION_HOPS, number_to_freq, synthetic_audio,
+                        analysis_rate)
+from resample import PolyphaseResampler
+from multi_mic import synthetic_channels
+from tuner import Tuner, TerminalRenderer, Snapshot
+from contour import ContourRecorder, score_contour, synthetic_singing
+from midi_listen import MidiListener
+from samplebank import SampleBank, SampleBankBackend
+from timeline import Timeline
+from notenames import make_note, note_int
+from simulate import apply_game_mode_defaults
+
+# External Dependencies
+import numpy as np
+from mingus.core import progressions
+from mingus.containers import NoteContainer
+
+try:
+    perf_counter = time.perf_counter
+except AttributeError:  # python 2
+    perf_counter = time.time
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'benchmarks_baseline.json')
+KEYS = ['C', 'G', 'D', 'A', 'E', 'B', 'F#', 'Db', 'Ab', 'Eb', 'Bb', 'F',
+        'a', 'e', 'b', 'f#', 'c#', 'g#', 'eb', 'bb', 'f', 'c', 'g', 'd']
+NUMERALS = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII']
+
+benchmarks = OrderedDict()
+
+
+def benchmark(name, ops=1):
+    """Registers a benchmark.  The decorated function does any setup and
+    returns a callable, each call of which does `ops` operations."""
+    def decorator(setup):
+        benchmarks[name] = (setup, ops)
+        return setup
+    return decorator
+
+
+###############################################################################
+### musictools ################################################################
+###############################################################################
+
+@benchmark('diatonic_construct', ops=len(KEYS))
+def bench_diatonic_construct():
+    def run():
+        for key in KEYS:
+            Diatonic(key)
+    return run
+
+
+@benchmark('diatonic_cached', ops=len(KEYS))
+def bench_diatonic_cached():
+    def run():
+        for key in KEYS:
+            get_diatonic(key)
+    return run
+
+
+@benchmark('interval_offsets', ops=7 * 14)
+def bench_interval_offsets():
+    d = get_diatonic('Eb')
+    cases = [(number, root, number % 2 == 0)
+             for root in range(1, 8) for number in range(2, 16)]
+
+    def run():
+        for number, root, ascending in cases:
+            d.absolute(interval_offsets(number, root, ascending))
+    return run
+
+
+@benchmark('diatonic_interval', ops=7 * 14)
+def bench_diatonic_interval():
+    d = Diatonic('Eb')
+    cases = [(number, root, number % 2 == 0)
+             for root in d.notes for number in range(2, 16)]
+
+    def run():
+        for number, root, ascending in cases:
+            d.interval(number, root=root, ascending=ascending)
+    return run
+
+
+@benchmark('bounded_random_notes', ops=100)
+def bench_bounded_random_notes():
+    d = Diatonic('A', minor=True)
+
+    def run():
+        random.seed(0)
+        previous = None
+        for _ in range(100):
+            previous = d.bounded_random_notes('E-2', 'C-7', 12, 4,
+                                              previous)[-1]
+    return run
+
+
+@benchmark('voice_progression', ops=50)
+def bench_voice_progression():
+    rng = random.Random(0)
+    progs = [[rng.choice(NUMERALS) for _ in range(4)] for _ in range(50)]
+
+    def run():
+        for prog in progs:
+            voice_progression(prog, 'Bb')
+    return run
+
+
+@benchmark('chordname', ops=len(NUMERALS) * 2)
+def bench_chordname():
+    chords = [(NoteContainer(progressions.to_chords([x], key)[0]), x)
+              for x in NUMERALS for key in ('C', 'F#')]
+
+    def run():
+        for chord, numeral in chords:
+            chordname(chord, numeral)
+    return run
+
+
+@benchmark('parse_answers', ops=8)
+def bench_parse_answers():
+    answers = ['3', 'eb', 'F#', 'Bb-3', 'c4', '7', 'x', 'G##']
+
+    def run():
+        for answer in answers:
+            isvalidnote(answer)
+            parse2note(answer) if answer != 'x' else None
+    return run
+
+
+###############################################################################
+### pitch detection ###########################################################
+###############################################################################
+
+@benchmark('pitch_detector_hop', ops=8 * 24)
+def bench_pitch_detector_hop():
+    rng = np.random.RandomState(0)
+    notes = rng.randint(NOTE_MIN + 12, NOTE_MAX - 12, 8)
+    hops = synthetic_audio(notes).reshape(-1, FRAME_SIZE)
+    detector = PitchDetector()
+
+    def run():
+        detector.reset()
+        for hop in hops:
+            detector.process(hop)
+    return run
+
+
+@benchmark('pitch_detector_hop_bass', ops=8 * 24)
+def bench_pitch_detector_hop_bass():
+    rng = np.random.RandomState(0)
+    rate = analysis_rate(64)
+    notes = rng.randint(NOTE_MIN, 64, 8)
+    detector = PitchDetector(NOTE_MIN, 64, samplerate=rate)
+    resampler = PolyphaseResampler(FSAMP, rate)
+    hops = resampler.process(synthetic_audio(notes))
+    hops = hops[:len(hops) // detector.frame_size * detector.frame_size]
+    hops = hops.reshape(-1, detector.frame_size)
+
+    def run():
+        detector.reset()
+        for hop in hops:
+            detector.process(hop)
+    return run
+
+
+def _bench_resample_hop(rate):
+    def setup():
+        rng = np.random.RandomState(0)
+        chunk = int(round(FRAME_SIZE * rate / FSAMP))
+        hops = (3000 * rng.randn(32, chunk)).astype(np.int16)
+        resampler = PolyphaseResampler(rate, FSAMP)
+
+        def run():
+            for hop in hops:
+                resampler.process(hop)
+        return run
+    return setup
+
+
+for _rate in [44100, 48000]:
+    benchmark('resample_hop_{}'.format(_rate),
+              ops=32)(_bench_resample_hop(_rate))
+
+
+def _room_noise(hops=64, rms=200, seed=0):
+    rng = np.random.RandomState(seed)
+    return (rms * rng.randn(hops, FRAME_SIZE)).astype(np.int16)
+
+
+@benchmark('pitch_detector_idle_hop', ops=64)
+def bench_pitch_detector_idle_hop():
+    hops = _room_noise()
+    gate = NoiseGate()
+    detector = PitchDetector(gate=gate)
+    for hop in hops:  # calibrate
+        detector.process(hop)
+
+    def run():
+        for hop in hops:
+            detector.process(hop)
+    return run
+
+
+def idle_cpu(hops=200, seed=0):
+    """Returns the fraction of a CPU used analysing a noisy room while
+    waiting for an answer, with a calibrated `NoiseGate` and with the old
+    fixed threshold."""
+    noise = _room_noise(hops, seed=seed)
+    results = OrderedDict()
+    for name, gate in [('gated', NoiseGate()), ('fixed_threshold', None)]:
+        detector = PitchDetector(gate=gate)
+        for hop in noise[:FRAMES_PER_FFT]:  # calibrate, fill the buffer
+            detector.process(hop)
+        start = time.process_time()
+        for hop in noise:
+            detector.process(hop)
+        cpu = time.process_time() - start
+        results[name] = cpu / (hops * FRAME_SIZE / FSAMP)
+    return results
+
+
+def _bench_multi_pitch_hop(channels):
+    def setup():
+        _, hops = synthetic_channels(channels, hops_per_note=8)
+        detector = MultiPitchDetector(channels)
+
+        def run():
+            detector.reset()
+            for hop in hops:
+                detector.process(hop)
+        return run
+    return setup
+
+
+for _channels in [1, 4, 16]:
+    benchmark('multi_pitch_hop_{}'.format(_channels),
+              ops=32)(_bench_multi_pitch_hop(_channels))
+
+
+@benchmark('tuner_hop', ops=64)
+def bench_tuner_hop():
+    rng = np.random.RandomState(0)
+    tuner = Tuner(rate=FSAMP)
+    resampler = PolyphaseResampler(FSAMP, tuner.detector.samplerate)
+    audio = np.concatenate([_room_noise(CALIBRATION_HOPS).ravel(),
+                            synthetic_audio(rng.uniform(52, 84, 8), 8)])
+    hops = resampler.process(audio)
+    size = tuner.detector.frame_size
+    hops = hops[:len(hops) // size * size].reshape(-1, size)
+    for hop in hops[:CALIBRATION_HOPS + FRAMES_PER_FFT]:  # calibrate, fill
+        tuner.analyze(hop)
+    hops = hops[-64:]
+
+    def run():
+        for hop in hops:
+            tuner.analyze(hop)
+    return run
+
+
+@benchmark('tuner_render_frame', ops=2 * 64)
+def bench_tuner_render_frame():
+    rng = np.random.RandomState(0)
+    midi = rng.uniform(NOTE_MIN, NOTE_MAX, 64)
+    snapshots = [Snapshot(k, 0., 0., 1000., number_to_freq(m), m,
+                          100 * (m - round(m)), None)
+                 for k, m in enumerate(midi)]
+    needle = TerminalRenderer(stream=io.StringIO())
+    trace = TerminalRenderer(trace=True, stream=io.StringIO())
+
+    def run():
+        for renderer in (needle, trace):
+            renderer.stream.seek(0)
+            for snapshot in snapshots:
+                renderer.render(snapshot)
+    return run
+
+
+def _sung_phrase(seconds=30, bpm=120, seed=0):
+    random.seed(seed)
+    notes = get_diatonic('C').bounded_random_notes('C-3', 'C-5', 7,
+                                                    seconds * bpm // 60)
+    return notes, synthetic_singing([note_int(x) + 12 for x in notes], bpm,
+                                    seed=seed)
+
+
+@benchmark('contour_record_hop', ops=128)
+def bench_contour_record_hop():
+    _, audio = _sung_phrase(seconds=4)
+    recorder = ContourRecorder(48, 72)
+    audio = audio[:recorder.hop * 128]
+
+    def run():
+        recorder.reset()
+        for k in range(0, len(audio), FRAME_SIZE):
+            recorder.process(audio[k:k + FRAME_SIZE])
+    return run
+
+
+@benchmark('contour_score_30s', ops=1)
+def bench_contour_score_30s():
+    notes, audio = _sung_phrase()
+    recorder = ContourRecorder(48, 72)
+    recorder.process(audio)
+    contour = recorder.contour()
+
+    def run():
+        score_contour(contour, notes, 120)
+    return run
+
+
+def pitch_detector_accuracy(n_notes=20, seed=0):
+    """Returns the fraction of synthetic notes whose pitch is detected
+    correctly by the end of the note."""
+    rng = np.random.RandomState(seed)
+    notes = rng.randint(NOTE_MIN + 12, NOTE_MAX - 12, n_notes)
+    hops = synthetic_audio(notes, seed=seed).reshape(len(notes), -1,
+                                                     FRAME_SIZE)
+    detector = PitchDetector()
+    correct = 0
+    for note, note_hops in zip(notes, hops):
+        for hop in note_hops:
+            detected = detector.process(hop)
+        correct += detected is not None and int(round(detected[1])) == note
+    return correct / n_notes
+
+
+###############################################################################
+### playback ##################################################################
+###############################################################################
+
+def _random_phrases(n, notes_per_phrase=4, seed=0):
+    rng = random.Random(seed)
+    return [Timeline(bpm=120).add_phrase(
+        [make_note(rng.randint(NOTE_MIN, NOTE_MAX - 12) - 12)
+         for _ in range(notes_per_phrase)]) for _ in range(n)]
+
+
+@benchmark('samplebank_render', ops=20)
+def bench_samplebank_render():
+    bank = SampleBank.additive()
+    phrases = _random_phrases(20)
+
+    def run():
+        for tl in phrases:
+            bank.render(tl)
+    return run
+
+
+@benchmark('samplebank_mix_block', ops=100)
+def bench_samplebank_mix_block():
+    backend = SampleBankBackend(SampleBank.additive(44100), output=False)
+    backend.init()
+    chord = NoteContainer([make_note(x) for x in (48, 52, 55, 60)])
+
+    def run():
+        backend.play_NoteContainer(chord)
+        for _ in range(100):
+            backend.mix()
+        backend.stop_NoteContainer(chord)
+    return run
+
+
+###############################################################################
+### MIDI ######################################################################
+###############################################################################
+
+class ReplayMidiIn(object):
+    """Stands in for an rtmidi input port, delivering `events` (a list of
+    `(message, deltatime)` tuples) to the callback from a background
+    thread, over and over until closed."""
+    def __init__(self, events):
+        self.events = events
+        self._callback = None
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def set_callback(self, callback):
+        self._callback = callback
+        self._thread.start()
+
+    def _run(self):
+        while not self._closed.is_set():
+            for event in self.events:
+                self._callback(event)
+            time.sleep(0)
+
+    def close_port(self):
+        self._closed.set()
+        self._thread.join()
+
+
+@benchmark('midi_listen', ops=1)
+def bench_midi_listen():
+    rng = random.Random(0)
+    events = []
+    for _ in range(8):
+        note = rng.randint(40, 90)
+        events += [([0x90, note, 100], 0.001), ([0x80, note, 0], 0.001)]
+    listener = MidiListener('replay', always_recording=False,
+                            midiin=ReplayMidiIn(events))
+
+    def run():
+        del listener.history[:]
+        listener.listen(duration=5, num_notes=4)
+    run.close = listener.close
+    return run
+
+
+###############################################################################
+### game loop #################################################################
+###############################################################################
+
+def _bench_game_loop(mode):
+    def setup():
+        from simulate import simulate
+
+        def run():
+            simulate(mode, questions=100, seed=0)
+        return run
+    return setup
+
+
+for _mode in ['random_notes', 'interval', 'single_chord', 'progression',
+              'chord_tone']:
+    benchmark('game_loop_' + _mode, ops=100)(_bench_game_loop(_mode))
+
+
+###############################################################################
+### running and comparing #####################################################
+###############################################################################
+
+REFERENCE_LOOPS = 20
+
+
+def cpu_name():
+    """Returns the processor's model name, if it can be found."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except (IOError, OSError):  # not Linux
+        pass
+    return platform.processor()
+
+
+def reference_workload():
+    """The fixed workload that benchmarks are timed relative to."""
+    rng = np.random.RandomState(0)
+    x = rng.randn(FRAME_SIZE)
+    counts = {}
+    for k in range(2000):
+        counts[k % 7] = counts.get(k % 7, 0) + k
+    for _ in range(4):
+        np.abs(np.fft.rfft(x * np.hanning(FRAME_SIZE))).argmax()
+    return counts
+
+
+def _time_reference():
+    start = perf_counter()
+    for _ in range(REFERENCE_LOOPS):
+        reference_workload()
+    return (perf_counter() - start) / REFERENCE_LOOPS
+
+
+def run_benchmarks(names=None, repeat=7, min_time=0.05):
+    """Runs the benchmarks (all, or those in `names`).  Each is timed
+    `repeat` times (each time looping for at least `min_time` seconds, then
+    timing `reference_workload()`).  Returns a dictionary of results, times
+    being seconds per operation, and 'relative' the fastest time divided by
+    the fastest reference time (the fastest being the least disturbed by
+    anything else running)."""
+    apply_game_mode_defaults()
+    results = OrderedDict()
+    for name, (setup, ops) in benchmarks.items():
+        if names and name not in names:
+            continue
+        random.seed(0)
+        np.random.seed(0)
+        run = setup()
+        run()  # warm up
+
+        # calibrate the number of loops per timing
+        loops = 1
+        while True:
+            start = perf_counter()
+            for _ in range(loops):
+                run()
+            if perf_counter() - start >= min_time or loops >= 1 << 16:
+                break
+            loops *= 2
+
+        times, reference = [], []
+        for _ in range(repeat):
+            start = perf_counter()
+            for _ in range(loops):
+                run()
+            times.append((perf_counter() - start) / (loops * ops))
+            reference.append(_time_reference())
+        if hasattr(run, 'close'):
+            run.close()
+        times.sort()
+        results[name] = OrderedDict([('median', times[len(times) // 2]),
+                                     ('min', times[0]),
+                                     ('max', times[-1]),
+                                     ('relative', times[0] / min(reference)),
+                                     ('loops', loops),
+                                     ('ops', ops)])
+    return OrderedDict([
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('machine', platform.machine()),
+        ('cpu', cpu_name()),
+        ('pitch_detector_accuracy', pitch_detector_accuracy()),
+        ('idle_cpu', idle_cpu()),
+        ('benchmarks', results)])
+
+
+def compare(results, baseline, threshold=0.25):
+    """Compares relative times (see `run_benchmarks()`) with `baseline` (a
+    previous result of `run_benchmarks()`), warning if it was run on another
+    machine or Python or numpy version.  Returns a list of `(name, baseline
+    seconds, seconds, ratio)` for benchmarks that got slower by more than
+    `threshold`."""
+    for field in ('machine', 'cpu', 'python', 'numpy'):
+        if baseline.get(field) != results.get(field):
+            print("Warning: the baseline was run with {} {}, not {}; "
+                  "regenerate it with --save-baseline on this machine."
+                  "".format(field, baseline.get(field), results.get(field)))
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        before = baseline['benchmarks'].get(name)
+        if before is None or 'relative' not in before:
+            continue
+        ratio = result['relative'] / before['relative']
+        if ratio > 1 + threshold:
+            regressions.append((name, before['median'], result['median'],
+                                ratio))
+    return regressions
+
+
+def get_user_args():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite.")
+    parser.add_argument('names', nargs='*',
+                        help="benchmarks to run (default: all)")
+    parser.add_argument('--list', action='store_true',
+                        help="list the benchmarks and exit")
+    parser.add_argument('--output', help="also write the results here")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help="baseline results to compare with")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="save the results as the baseline")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed slowdown relative to the baseline")
+    parser.add_argument('--repeat', type=int, default=7)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_user_args()
+    if args.list:
+        print("\n".join(benchmarks))
+        sys.exit()
+
+    results = run_benchmarks(args.names, repeat=args.repeat)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("Saved baseline to", args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for name, before, after, ratio in regressions:
+            print("REGRESSION {}: {:.3g}s -> {:.3g}s per op ({:.0%} slower "
+                  "relative to the reference workload)"
+                  "".format(name, before, after, ratio - 1))
+        if regressions:
+            sys.exit(1)
+        print("No regressions beyond {:.0%}.".format(args.threshold))
+    else:
+        print("No baseline at {} to compare with.".format(args.baseline))
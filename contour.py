@@ -0,0 +1,457 @@
+"""Sight-singing: recording the pitch contour of a sung phrase and scoring it
+against the phrase asked for.
+
+`MicListener` only reports each change of (rounded) note, which loses how a
+note was sung.  A `ContourRecorder` instead keeps, for every hop of
+`CONTOUR_HOP` samples, the pitch in cents (100 times the fractional MIDI
+number, NaN if nothing was sung) and how periodic the hop was (a confidence
+from 0 to 1, from the YIN pitch estimator).
+
+`score_contour()` aligns the sung frames to the phrase's notes by dynamic
+time warping, limited to frames within `band` seconds of each note's place
+in the phrase, and reports for each note how far off it was sung (the
+median, in cents, up to octaves) and how early or late it started.  Each
+note's row of the warping is solved in one go with NumPy (a cumulative sum
+and a running minimum), so only the notes are looped over.
+
+Usage:
+    $ python contour.py     # the cost of recording and of scoring a phrase
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import time
+from collections import namedtuple
+
+# Internal Dependencies
+from mic_listen import (NoiseGate, freq_to_number, number_to_freq,
+                        device_rate, calibrate_gate, NOTE_MIN, NOTE_MAX,
+                        FSAMP, FRAME_SIZE, CALIBRATION_HOPS)
+from resample import PolyphaseResampler
+from listening import Deadline, COMPLETE, ERROR
+from timeline import duration2seconds
+from notenames import note_int
+
+# External Dependencies
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+try:
+    import pyaudio
+except ImportError:  # only needed to open the microphone
+    pyaudio = None
+
+
+CONTOUR_HOP = 256  # samples per pitch estimate (about 12ms)
+YIN_WINDOW = 1024  # samples compared with their delayed copy
+YIN_THRESHOLD = 0.15  # the first delay this aperiodic (or less) is the period
+MIN_CONFIDENCE = 0.7  # frames less periodic than this aren't scored
+END_SILENCE = 0.5  # seconds of silence that end a recording
+TOLERANCE = 50  # cents a note may be off and still count as right
+DTW_BAND = 1.  # seconds a note may be sung early or late
+MAX_COST = 200  # cents, the most one frame's pitch costs the alignment
+TIMING_COST = 200  # cents a frame costs per second outside its note's time
+
+
+class Contour(object):
+    """The pitch of each hop of a recording.
+
+    Attributes:
+        times (array): seconds from the start of the recording to the end of
+            each hop.
+        cents (array): the pitch, in cents above MIDI note 0, or NaN.
+        confidence (array): from 0 (unvoiced) to 1 (perfectly periodic).
+        status (str): why recording stopped (see `listening.py`).
+        error (Exception): what went wrong, if the status is `ERROR`.
+    """
+    def __init__(self, times, cents, confidence, status=COMPLETE, error=None):
+        self.times = np.asarray(times, dtype=float)
+        self.cents = np.asarray(cents, dtype=float)
+        self.confidence = np.asarray(confidence, dtype=float)
+        self.status = status
+        self.error = error
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def failed(self):
+        return self.status == ERROR
+
+    def voiced(self, min_confidence=MIN_CONFIDENCE):
+        """Returns the contour of just the hops at least `min_confidence`
+        periodic."""
+        keep = self.confidence >= min_confidence
+        return Contour(self.times[keep], self.cents[keep],
+                       self.confidence[keep], self.status, self.error)
+
+
+def yin(frames, samplerate, window, tau_min, tau_max,
+        threshold=YIN_THRESHOLD):
+    """Estimates the fundamental frequency of each row of `frames` (each at
+    least `window + tau_max` samples) by YIN, looking for periods from
+    `tau_min` to `tau_max` samples.  Returns `(frequencies, confidences)`.
+
+    The difference between the first `window` samples and their copy
+    delayed by each `tau` is found from the cross-correlation (by FFT) and
+    running sums of squares, then normalized by its mean over shorter
+    delays; the period is the first local minimum below `threshold` (or the
+    smallest value, if none is), refined by parabolic interpolation."""
+    frames = np.asarray(frames, dtype=np.float64)[:, :window + tau_max]
+    n_fft = 1 << int(np.ceil(np.log2(window + tau_max)))
+    spectrum = np.fft.rfft(frames, n_fft)
+    head = np.fft.rfft(frames[:, :window], n_fft)
+    corr = np.fft.irfft(head.conj() * spectrum, n_fft)[:, :tau_max + 1]
+
+    # squares[:, k] is the sum of the first k samples squared
+    squares = np.zeros((len(frames), frames.shape[1] + 1))
+    np.cumsum(frames * frames, axis=1, out=squares[:, 1:])
+    taus = np.arange(tau_max + 1)
+    energy = squares[:, window + taus] - squares[:, taus]
+    diff = np.maximum(energy[:, :1] + energy - 2 * corr, 0)
+
+    # cumulative mean normalized difference
+    total = np.cumsum(diff[:, 1:], axis=1)
+    cmnd = np.ones_like(diff)
+    cmnd[:, 1:] = diff[:, 1:] * taus[1:] / np.maximum(total, 1e-12)
+
+    d = cmnd[:, tau_min:tau_max + 1]
+    dips = (d[:, :-1] < threshold) & (d[:, :-1] <= d[:, 1:])
+    first = np.where(dips.any(axis=1), dips.argmax(axis=1), d.argmin(axis=1))
+    rows = np.arange(len(d))
+    k = np.clip(first, 1, d.shape[1] - 2)
+    a, b, c = d[rows, k - 1], d[rows, k], d[rows, k + 1]
+    curvature = a - 2 * b + c
+    offset = np.where(curvature > 0, 0.5 * (a - c) /
+                      np.where(curvature > 0, curvature, 1), 0)
+    period = tau_min + k + np.clip(offset, -1, 1)
+    confidence = np.clip(1 - d[rows, first], 0, 1)
+    return samplerate / period, confidence
+
+
+class ContourRecorder(object):
+    """Tracks the pitch of audio, a hop of `hop` samples at a time.
+
+    Args:
+        note_min, note_max (int): the range of MIDI notes expected.
+        samplerate (int): of the audio given to `process()`.
+        gate (NoiseGate, optional): decides which hops have anything to
+            analyse, e.g. a `MicListener`'s (already calibrated) gate.  By
+            default a new one: call `calibrate()` before recording, or it
+            calibrates on the first half second (and corrects itself at the
+            first pause if that was already singing).
+    """
+    def __init__(self, note_min=NOTE_MIN, note_max=NOTE_MAX,
+                 samplerate=FSAMP, hop=CONTOUR_HOP, window=YIN_WINDOW,
+                 gate=None):
+        self.samplerate = samplerate
+        self.hop = hop
+        self.window = window
+        self.tau_min = int(samplerate / number_to_freq(note_max + 1))
+        self.tau_max = int(np.ceil(samplerate / number_to_freq(note_min - 1)))
+        self.frame = window + self.tau_max
+        if gate is None:
+            gate = NoiseGate(calibration_hops=max(1, CALIBRATION_HOPS *
+                                                  FRAME_SIZE // hop))
+        self.gate = gate
+        self.reset()
+
+    def reset(self):
+        self._buf = np.zeros(self.frame - self.hop, dtype=np.float64)
+        self._times, self._cents, self._confidence = [], [], []
+        self.hops = 0
+        self.onset = self.last_voiced = None  # times of voiced hops
+
+    @property
+    def time(self):
+        """Seconds of audio processed."""
+        return self.hops * self.hop / self.samplerate
+
+    def process(self, samples):
+        """Takes the next samples (any number).  Returns how many of the
+        hops they completed were voiced."""
+        hop, frame = self.hop, self.frame
+        buf = np.concatenate([self._buf, np.asarray(samples, np.float64)])
+        count = (len(buf) - (frame - hop)) // hop
+        if count <= 0:
+            self._buf = buf
+            return 0
+        frames = as_strided(buf, (count, frame),
+                            (hop * buf.strides[0], buf.strides[0]))
+        is_open = np.array([self.gate(h) for h in frames[:, -hop:]])
+        self._buf = buf[count * hop:]
+        times = (self.hops + 1 + np.arange(count)) * hop / self.samplerate
+        self.hops += count
+
+        confidence = np.zeros(count)
+        cents = np.full(count, np.nan)
+        if is_open.any():
+            freqs, conf = yin(frames[is_open], self.samplerate, self.window,
+                              self.tau_min, self.tau_max)
+            confidence[is_open] = conf
+            cents[is_open] = 100 * freq_to_number(freqs)
+            voiced = times[confidence >= MIN_CONFIDENCE]
+            if len(voiced):
+                if self.onset is None:
+                    self.onset = voiced[0]
+                self.last_voiced = voiced[-1]
+        self._times.append(times)
+        self._cents.append(cents)
+        self._confidence.append(confidence)
+        return int((confidence >= MIN_CONFIDENCE).sum())
+
+    def contour(self, status=COMPLETE, error=None):
+        """Returns the `Contour` recorded so far."""
+        if not self._times:
+            return Contour([], [], [], status, error)
+        return Contour(np.concatenate(self._times),
+                       np.concatenate(self._cents),
+                       np.concatenate(self._confidence), status, error)
+
+    def calibrate(self, input_device_index=None, prompt=True):
+        """Asks for quiet and measures the room's noise for the gate (see
+        `mic_listen.calibrate_gate()`)."""
+        return calibrate_gate(self.gate, input_device_index, prompt)
+
+    def record(self, duration, input_device_index=None, timeout=None,
+               idle_timeout=None, cancel=None):
+        """Records from the microphone until at least `duration` seconds
+        after singing starts, once it's been silent for `END_SILENCE`
+        seconds.  See `listening.py` for `timeout`, `idle_timeout` and
+        `cancel`.  Returns the `Contour`."""
+        deadline = Deadline(timeout, idle_timeout, cancel)
+        audio = pyaudio.PyAudio()
+        try:
+            rate = device_rate(audio, input_device_index)
+            resampler = PolyphaseResampler(rate, self.samplerate)
+            chunk = int(round(self.hop * rate / self.samplerate))
+            stream = audio.open(format=pyaudio.paInt16, channels=1,
+                                rate=rate, input=True,
+                                frames_per_buffer=chunk,
+                                input_device_index=input_device_index)
+        except (IOError, OSError) as e:  # no (such) device
+            audio.terminate()
+            return self.contour(ERROR, e)
+
+        try:
+            stream.start_stream()
+            while True:
+                status = deadline.expired()
+                if status is not None:
+                    return self.contour(status)
+                samples = np.frombuffer(
+                    stream.read(chunk, exception_on_overflow=False),
+                    np.int16)
+                if self.process(resampler.process(samples)):
+                    deadline.heard()
+                if (self.onset is not None and
+                        self.time - self.onset >= duration and
+                        self.time - self.last_voiced >= END_SILENCE):
+                    return self.contour()
+        except (IOError, OSError) as e:  # e.g. the device was unplugged
+            return self.contour(ERROR, e)
+        finally:
+            stream.close()
+            audio.terminate()
+
+
+class ContourScore(namedtuple('ContourScore', 'credit cents onset_errors '
+                                              'cents_error timing_deviation '
+                                              'tempo frames')):
+    """How a phrase was sung.
+
+    Attributes:
+        credit (list): a boolean for each note, whether it was sung within
+            `TOLERANCE` cents (up to octaves).
+        cents (array): how far off each note was sung (its frames' median).
+        onset_errors (array): seconds each note started late (from the
+            start of singing, at the tempo sung; negative if early).
+        cents_error (float): the mean of `abs(cents)`.
+        timing_deviation (float): the RMS of `onset_errors`.
+        tempo (float): the tempo sung, as a fraction of the tempo asked for.
+        frames (list): the `(first, last)` sung frames aligned to each note.
+    """
+    __slots__ = ()
+
+    @property
+    def accuracy(self):
+        """The fraction of notes sung in tune."""
+        return sum(self.credit) / len(self.credit) if self.credit else 0.
+
+    @property
+    def correct(self):
+        return all(self.credit) if self.credit else False
+
+
+def _folded(cents):
+    """Returns `cents` moved by octaves to between -600 and 600."""
+    return (cents + 600) % 1200 - 600
+
+
+def score_contour(contour, target_notes, bpm=None, durations=None,
+                  band=DTW_BAND, tolerance=TOLERANCE,
+                  min_confidence=MIN_CONFIDENCE):
+    """Scores a sung `contour` against `target_notes` (`Note`s or note
+    ints, as from `bounded_random_notes()`), played at `bpm` with mingus
+    `durations` (quarter notes by default), as in `Timeline.add_phrase()`.
+    Returns a `ContourScore`, or None if fewer frames were sung than there
+    are notes.
+
+    Frames less than `min_confidence` periodic are left out, and the
+    phrase's timing is stretched to the time from the first frame to the
+    last.  Each frame is then aligned to one note, in order, minimizing the
+    total (confidence-weighted) difference in cents, up to octaves, plus
+    `TIMING_COST` for frames outside their note's time; frames more than
+    `band` seconds outside it are never aligned to it, unless no alignment
+    is possible otherwise."""
+    if durations is None:
+        durations = [4] * len(target_notes)
+    target = 100 * (np.array([note_int(x) for x in target_notes]) + 12.)
+    lengths = np.array([duration2seconds(d, bpm) for d in durations])
+    onsets = np.concatenate([[0.], np.cumsum(lengths)[:-1]])
+
+    sung = contour.voiced(min_confidence)
+    m, n = len(target), len(sung)
+    if n < m or not m:
+        return None
+    # compare rhythm at the singer's own tempo
+    times = sung.times - sung.times[0]
+    tempo = (onsets[-1] + lengths[-1]) / max(times[-1], 1e-3)
+    onsets, lengths = onsets / tempo, lengths / tempo
+    ends = onsets + lengths
+
+    if band is None:
+        lo, hi = np.arange(m), n - m + 1 + np.arange(m)
+    else:
+        lo = np.searchsorted(times, onsets - band)
+        hi = np.searchsorted(times, ends + band, 'right')
+        lo[0], hi[-1] = 0, n
+    lo, hi = np.maximum(lo, np.arange(m)), np.minimum(hi, n - m + 1 +
+                                                      np.arange(m))
+
+    # the cost of each frame in each note's band, one note after another
+    widths = np.maximum(hi - lo, 0)
+    offsets = np.concatenate([[0], np.cumsum(widths)])
+    notes = np.repeat(np.arange(m), widths)
+    cols = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - lo, widths)
+    t = times[cols]
+    costs = (np.minimum(np.abs(_folded(sung.cents[cols] - target[notes])),
+                        MAX_COST) * sung.confidence[cols] +
+             TIMING_COST * np.maximum(0, np.maximum(onsets[notes] - t,
+                                                    t - ends[notes])))
+    after = np.cumsum(costs)  # each cost and all those before it
+    before = after - costs
+
+    # `total[j + 1]`, for note i: the least cost of aligning frames 0..j to
+    # notes 0..i, with frame j on note i, whose frames then start at
+    # `starts[i][j - lo[i]]`:
+    #     total[j + 1] = min over k <= j of (previous[k] +
+    #                                        costs[k] + ... + costs[j])
+    # i.e. a running minimum after subtracting the cumulative costs.
+    starts = [None] * m
+    previous = np.full(n + 1, np.inf)
+    previous[0] = 0.
+    for i in range(m):
+        a, b = offsets[i], offsets[i + 1]
+        total = np.full(n + 1, np.inf)
+        if a < b:
+            start = previous[lo[i]:hi[i]] - before[a:b]
+            best = np.minimum.accumulate(start)
+            total[lo[i] + 1:hi[i] + 1] = after[a:b] + best
+            starts[i] = np.maximum.accumulate(np.where(start == best,
+                                                       cols[a:b], 0))
+        previous = total
+    if not np.isfinite(previous[n]):
+        if band is None:
+            return None
+        return score_contour(contour, target_notes, bpm, durations, None,
+                             tolerance, min_confidence)
+
+    # trace back each note's frames
+    frames = [None] * m
+    j = n - 1
+    for i in range(m - 1, -1, -1):
+        k = starts[i][j - lo[i]]
+        frames[i] = (int(k), int(j))
+        j = k - 1
+
+    # each note's median error: sort the frames by note, then by error
+    first = np.array([k for k, _ in frames])
+    counts = np.diff(np.append(first, n))
+    notes = np.repeat(np.arange(m), counts)
+    errors = _folded(sung.cents - target[notes])
+    errors = errors[np.lexsort((errors, notes))]
+    cents = (errors[first + (counts - 1) // 2] +
+             errors[first + counts // 2]) / 2
+
+    onset_errors = times[first] - onsets
+    return ContourScore(credit=[bool(x) for x in np.abs(cents) <= tolerance],
+                        cents=cents, onset_errors=onset_errors,
+                        cents_error=float(np.abs(cents).mean()),
+                        timing_deviation=float(np.sqrt(np.mean(
+                            onset_errors ** 2))),
+                        tempo=float(tempo), frames=frames)
+
+
+def synthetic_singing(midi_notes, bpm=None, samplerate=FSAMP, seed=0,
+                      detune=15, vibrato=30, timing=0.05, gap=0.05):
+    """Returns int16 audio of `midi_notes` sung (badly) as quarter notes at
+    `bpm`: each note off by up to `detune` cents, with `vibrato` cents of
+    vibrato, starting up to `timing` seconds early or late, with `gap`
+    seconds of breath before it, after half a second of room noise."""
+    rng = np.random.RandomState(seed)
+    beat = duration2seconds(4, bpm)
+    lead = int(0.5 * samplerate)
+    length = lead + int((len(midi_notes) * beat + 2 * timing) * samplerate)
+    midi = np.full(length, np.nan)
+    for k, n in enumerate(midi_notes):
+        begin = lead + int((k * beat + gap + rng.uniform(-timing, timing)) *
+                           samplerate)
+        end = lead + int(((k + 1) * beat + rng.uniform(-timing, timing)) *
+                         samplerate)
+        midi[max(begin, 0):end] = n + rng.uniform(-detune, detune) / 100
+    t = np.arange(length) / samplerate
+    voiced = ~np.isnan(midi)
+    midi = np.where(voiced, midi, 60) + vibrato / 100 * np.sin(
+        2 * np.pi * 5.5 * t)
+    phase = 2 * np.pi * np.cumsum(number_to_freq(midi)) / samplerate
+    x = sum(np.sin(k * phase) / k for k in (1, 2, 3)) * voiced
+    x += 0.02 * rng.randn(length)
+    return (3000 * x).astype(np.int16)
+
+
+def benchmark(seconds=30, bpm=120, seed=0):
+    """Sings a `seconds` long phrase of random notes (synthetically, with
+    one note a semitone off) and returns the milliseconds taken to record
+    its contour (per hop) and to score it, and the score."""
+    import random
+    from musictools import get_diatonic
+    random.seed(seed)
+    beats = int(seconds * bpm / 60)
+    notes = get_diatonic('C').bounded_random_notes('C-3', 'C-5', 7, beats)
+    sung = [note_int(x) + 12 for x in notes]
+    sung[beats // 2] += 1
+    audio = synthetic_singing(sung, bpm, seed=seed)
+
+    recorder = ContourRecorder(48, 72)
+    start = time.time()
+    for k in range(0, len(audio), FRAME_SIZE):
+        recorder.process(audio[k:k + FRAME_SIZE])
+    record_ms = 1000 * (time.time() - start) / recorder.hops
+    contour = recorder.contour()
+
+    start = time.time()
+    for _ in range(10):
+        result = score_contour(contour, notes, bpm)
+    score_ms = 100 * (time.time() - start)
+    return {'notes': beats, 'frames': len(contour),
+            'record_ms_per_hop': record_ms, 'score_ms': score_ms,
+            'accuracy': result.accuracy, 'cents_error': result.cents_error,
+            'timing_deviation': result.timing_deviation,
+            'missed': [k for k, ok in enumerate(result.credit) if not ok]}
+
+
+if __name__ == '__main__':
+    for k, v in sorted(benchmark().items()):
+        print("{:<20} {}".format(k, v))
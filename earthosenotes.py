@@ -28,22 +28,23 @@ except NameError:
 
 # Standard Library Dependencies
 import os
-import dill as pickle
-from copy import copy
+import sys
 
 # Internal Dependencies
 import settings as st
-from getch import getch
-from musictools import random_key, Diatonic
+from getch import getch, readline, KeyboardReader
+from musictools import random_key, get_diatonic
+import notenames
 from game_structure import SettingsContainer
-from new_question import new_question_rn
+from session import Session
+from new_question import new_question_rn, enable_prefetch_rn
+from new_question import rn_menu_commands, RN_HOTKEYS
 from midi_listen import MidiListener
 from mic_listen import MicListener
-
-# External Dependencies
-from mingus.midi import fluidsynth  # requires FluidSynth is installed
-import mingus.core.notes as notes
-from mingus.containers import Note
+from audio_backend import get_backend, set_backend
+from store import GameStore
+from attempt_log import AttemptLog
+import instrument
 
 
 def parentdir(path_, n=1):
@@ -56,13 +57,49 @@ def parentdir(path_, n=1):
 _saved_game_dir = os.path.join(parentdir(__file__), 'saved_games')
 if not os.path.exists(_saved_game_dir):
     os.makedirs(_saved_game_dir)
+_store = None
+
+
+def get_store():
+    """Returns the `GameStore` holding saved games and answer history."""
+    global _store
+    if _store is None:
+        _store = GameStore(os.path.join(_saved_game_dir, 'games.db'))
+        import_pickled_games(_store)
+    return _store
+
+
+def import_pickled_games(store):
+    """Moves games saved (as dill pickles) by older versions into `store`."""
+    legacy_saves = sorted(f for f in os.listdir(_saved_game_dir)
+                          if f.endswith('.p'))
+    if not legacy_saves:
+        return
+    try:
+        import dill as pickle
+    except ImportError:
+        print("Note: install dill to import your old saved games.")
+        return
+    for save_file in legacy_saves:
+        path = os.path.join(_saved_game_dir, save_file)
+        with open(path, 'rb') as data_file:
+            settings = pickle.load(data_file)
+        store.save_game(saveable_config(settings), name=save_file[:-2])
+        os.rename(path, path + '.imported')
+
+
+def new_mic_listener():
+    if st.MIC_PROCESS:
+        from mic_process import ProcessMicListener
+        return ProcessMicListener()
+    return MicListener()
 
 
 def load_listener(x):
     if x is None:
         return x
     elif x == "microphone":
-        return MicListener()
+        return new_mic_listener()
     elif x == "midi":
         return MidiListener()
     else:
@@ -70,15 +107,17 @@ def load_listener(x):
                         "save.")
 
 
-def load_game(saved_game):
-    with open(saved_game) as data_file:
-        settings = pickle.load(data_file)
-    settings.update({'listener': load_listener(settings['listener'])})
+def load_game(game_id):
+    settings = get_store().load_game(game_id)
+    settings.update({'listener': load_listener(settings['listener']),
+                     'scale': get_diatonic(settings['key'],
+                                           minor=settings['minor']),
+                     'game_id': game_id})
     return settings
 
 
 def saveable_listener(x):
-    if x is None:
+    if x is None or x in ("microphone", "midi"):
         return x
     elif isinstance(x, MicListener):
         return "microphone"
@@ -88,22 +127,23 @@ def saveable_listener(x):
         return False
 
 
+def saveable_config(settings):
+    """Returns a JSON-serializable copy of a settings dictionary.  The scale
+    is rebuilt from the key when loaded."""
+    config = dict((k, v) for k, v in settings.items()
+                  if k not in ('scale', 'game_id'))
+    config['listener'] = saveable_listener(settings['listener'])
+    return config
+
+
 def save_game(settings):
     """Saves (and returns) settings dictionary."""
-    num = len(os.listdir(_saved_game_dir)) + 1
-    new_save_file = os.path.join(_saved_game_dir, 'save{}.p'.format(num))
-
-    saveable_settings = copy(settings)
-    saveable_settings.update(
-        {'listener': saveable_listener(settings['listener'])}
-    )
-    with open(new_save_file, 'w') as outfile:
-        pickle.dump(saveable_settings, outfile)
+    settings['game_id'] = get_store().save_game(saveable_config(settings))
     return settings
 
 
 def user_input(mes='', default=None, acceptable=None, parser=str):
-    user_response = input(mes)
+    user_response = readline(mes)
     if user_response:
         user_response = parser(user_response)
     else:
@@ -130,7 +170,7 @@ def create_new_game():
         if int(x) == 0:
             return None
         elif int(x) == 1:
-            return MicListener()
+            return new_mic_listener()
         elif int(x) == 2:
             return MidiListener()
             input_method = "midi"
@@ -181,7 +221,7 @@ def create_new_game():
             return key
 
     def is_valid_note(key):
-        return notes.is_valid_note(key[0].upper() + key[1:])
+        return notenames.pitch_class(key) is not None
 
     key = user_input("Specify the key (defaults to R).  Use lower case for "
                      "minor and upper case for major (e.g. 'Cb' for Cb-Major "
@@ -190,12 +230,7 @@ def create_new_game():
                      random_key(), is_valid_note, key_parser)
 
     def is_note(x):
-        try:
-            Note(x)
-            return True
-        except:
-            print('bla')
-            return False
+        return notenames.note_int(x) is not None
 
     low = user_input("Specify the lowest note to be included (default E-2).\n"
                      #"You can use R to specify the tonic, e.g. if A is the "
@@ -208,7 +243,7 @@ def create_new_game():
 
     max_int = user_input("Specify the maximum interval between successive "
                          "notes (in semitones).  Defaults to 12.",
-                         lambda x: x > 0, int)
+                         12, lambda x: x > 0, int)
 
     if key == key.lower():
         minor = True
@@ -226,7 +261,7 @@ def create_new_game():
                 'listener': listener}
 
     settings.update({
-        'scale': Diatonic(key, minor=minor),
+        'scale': get_diatonic(key, minor=minor),
         'minor': minor,
         'sound_font': st.SOUNDFONT,
         'single_notes': chord_type == 'note',
@@ -235,8 +270,8 @@ def create_new_game():
 
 
 def game_menu():
-    saved_games = os.listdir(_saved_game_dir)
-    choices = ['New Game'] + saved_games
+    saved_games = get_store().list_games()
+    choices = ['New Game'] + [name for _, name in saved_games]
     mes = "Please select a game:\n"
     mes += '\n'.join(["{}: {}".format(k, g) for k, g in enumerate(choices)])
     selection = getch(mes)
@@ -244,25 +279,70 @@ def game_menu():
     if selection == '0':
         return create_new_game()
     try:
-        return load_game(os.path.join(_saved_game_dir, choices[int(selection)]))
-    except ValueError:
+        return load_game(saved_games[int(selection) - 1][0])
+    except (ValueError, IndexError):
         return game_menu()
 
 
 def main():
 
     # Parse command-line user arguments and initializes settings
-    fluidsynth.init(st.SOUNDFONT)  # start FluidSynth
+    if st.AUDIO_BACKEND == 'samplebank':
+        from samplebank import SampleBankBackend
+        set_backend(SampleBankBackend())
+    get_backend().init(st.SOUNDFONT)  # start FluidSynth (or render samples)
+    if st.INSTRUMENT:
+        instrument.enable(st.PROFILE_EVERY, _saved_game_dir)
 
     # Change instrument
     # fluidsynth.set_instrument(1, 14)
 
+    # Read the keyboard in the background (if it's a terminal)
+    keyboard = None
+    if sys.stdin.isatty():
+        keyboard = KeyboardReader(RN_HOTKEYS).start()
+
     # Select game
-    settings = SettingsContainer(game_menu())
+    try:
+        session = Session(SettingsContainer(game_menu()))
+    except:
+        if keyboard is not None:
+            keyboard.stop()
+        raise
+    session.keyboard = keyboard
+    session.recorders.append(get_store().recorder(session.settings.game_id))
+    attempt_log = AttemptLog(os.path.join(_saved_game_dir, 'attempt_log'))
+    session.recorders.append(attempt_log)
+    if st.PREFETCH_DEPTH:
+        enable_prefetch_rn(session, st.PREFETCH_DEPTH)
+    if isinstance(session.settings.listener, MicListener):
+        session.settings.listener.calibrate()  # before anyone sings
 
     # Play Game
-    while 1:
-        new_question_rn(settings)
+    if keyboard is not None:
+        print("Note: At any time press")
+        for mc in rn_menu_commands.values():
+            print(mc.input_description, "to", mc.description)
+    try:
+        while 1:
+            new_question_rn(session)
+    finally:
+        if keyboard is not None:
+            keyboard.stop()
+        get_store().close()
+        attempt_log.close()
+        if st.INSTRUMENT:
+            instrument.disable()
+            timings = instrument.instruments
+            timings.write_json_lines(os.path.join(_saved_game_dir,
+                                                  'timings.jsonl'))
+            with open(os.path.join(_saved_game_dir, 'metrics.prom'), 'w') as f:
+                f.write(timings.prometheus_text())
+        latency = session.latency_summary()
+        if latency['questions']:
+            print("\nAnswer-to-next-sound latency: {mean_ms:.1f}ms mean, "
+                  "{p99_ms:.1f}ms p99 over {questions} questions"
+                  "".format(**latency))
 
 
 # Play the Game!!!
@@ -3,19 +3,24 @@ from __future__ import division, absolute_import, print_function
 try: input = raw_input
 except: pass
 
-from getch import getch
 import game_structure as gs
 from musictools import (play_progression, random_progression, 
     random_key, isvalidnote, resolve_with_chords, chordname, 
-    random_chord, easy_play, play_wait, parse2note)
+    random_chord, easy_play, play_wait, parse2note, voice_progression, 
+    get_diatonic, interval_offsets)
+from markov import markov_progression, markov_sampler, adaptive_progression
+from sampler import choose, key_index, KEY_INDICES
+from timeline import Timeline
+from prefetch import QuestionPrefetcher
+from instrument import timed
+from attempt_log import AttemptLog, print_stats
+import notenames
 import settings as st
 
 # External Dependencies
-import time, random, sys
+import time, random, sys, functools
 from copy import copy
 from collections import OrderedDict
-from multiprocessing import Process
-from mingus.midi import fluidsynth  # requires FluidSynth is installed
 from mingus.core import progressions, intervals, chords as ch
 import mingus.core.notes as notes
 from mingus.containers import NoteContainer, Note, Bar
@@ -23,24 +28,94 @@ from mingus.containers import NoteContainer, Note, Bar
 
 # Decorators
 def repeat_question(func):
-   def func_wrapper(*args, **kwargs):
-       st.NEWQUESTION = False
-       return func(*args, **kwargs)
+   @functools.wraps(func)
+   def func_wrapper(session, *args, **kwargs):
+       session.new_question = False
+       return func(session, *args, **kwargs)
    return func_wrapper
 
 
 def new_question(func):
-   def func_wrapper(*args, **kwargs):
-       st.NEWQUESTION = True
-       return func(*args, **kwargs)
+   @functools.wraps(func)
+   def func_wrapper(session, *args, **kwargs):
+       session.new_question = True
+       return func(session, *args, **kwargs)
    return func_wrapper
 
 
+# The game mode settings that the menu commands change.  Each session keeps
+# its own copy (see `mode_settings()`); the rest are read from `settings`.
+SESSION_SETTINGS = ['KEY', 'BPM', 'I', 'II', 'III', 'IV', 'V', 'VI', 'VII',
+                    'NUMERALS', 'MANY_OCTAVES', 'INTERVAL_MODE']
+
+
+def mode_settings(session=None):
+    """Returns the session's game mode settings (see `SESSION_SETTINGS`),
+    copied onto `session.settings` from `settings` the first time, so that
+    changing the key or BPM of one session leaves the others alone.  Without
+    a session, returns the `settings` module."""
+    if session is None:
+        return st
+    gst = session.settings
+    if gst is None:
+        gst = session.settings = gs.SettingsContainer()
+    if not hasattr(gst, 'KEY'):
+        for name in SESSION_SETTINGS:
+            setattr(gst, name, copy(getattr(st, name)))
+    return gst
+
+
+def cadence_timeline(gst=st):
+    """Returns a `Timeline` of the cadence followed by a gap."""
+    tl = Timeline(bpm=gst.BPM)
+    tl.add_phrase(voice_progression(st.CADENCE, gst.KEY, Iup=gst.I))
+    return tl.rest()
+
+
+def arpeggiation(chord, invert=False, descending=False):
+    """Returns the notes of `chord` in the order they should be arpeggiated.
+    """
+    arpeggiation = [x for x in chord]
+    if invert:
+        arpeggiation = [arpeggiation[i] for i in invert]
+    elif descending:
+        arpeggiation.reverse()
+    return arpeggiation
+
+
+def next_question(session, prepare):
+    """Returns the `current_q_info` for a new question, taken from the 
+    session's prefetch queue if it has one, otherwise from 
+    `prepare(session)`."""
+    if session.prefetcher is not None:
+        return session.prefetcher.get()
+    return prepare(session)
+
+
+def answer_root(ans, gst=st):
+    """Returns the root (as an int) of the chord the user named with `ans` 
+    (1-7 or a root note name), or -1 if `ans` isn't understood."""
+    degree = notenames.degree(ans)
+    if degree is not None:
+        if degree > len(gst.NUMERALS):
+            return -1
+        chord = progressions.to_chords([gst.NUMERALS[degree - 1]], gst.KEY)[0]
+        return int(NoteContainer(chord)[0])
+    return notenames.note_int(ans, -1)
+
+
+def enable_prefetch(session, depth=2):
+    """Starts preparing questions for the session's current game mode in the 
+    background."""
+    session.prefetcher = QuestionPrefetcher(
+        lambda: session.current_mode.prepare(session), depth)
+    return session.prefetcher
+
+
 # Menu Command Actions
 @repeat_question
-def play_cadence():
-    play_progression(st.CADENCE, st.KEY, Iup=st.I, bpm=st.BPM)
-    play_wait()
+def play_cadence(session):
+    cadence_timeline(mode_settings(session)).play()
     # time.sleep(2 * st.DELAY)
 
 
@@ -50,76 +125,79 @@ def play_cadence():
 
 
 @repeat_question
-def set_bpm():
-    st.BPM = float(input("Enter the desired BPM: "))
+def set_bpm(session):
+    gst = mode_settings(session)
+    gst.BPM = float(session.input("Enter the desired BPM: "))
+    session.invalidate_prefetch()
 
 
 @new_question
-def toggle_triads7ths():
-    if st.I == "I7":
-        st.I, st.II, st.III, st.IV, st.V, st.VI, st.VII = \
+def toggle_triads7ths(session):
+    gst = mode_settings(session)
+    if gst.I == "I7":
+        gst.I, gst.II, gst.III, gst.IV, gst.V, gst.VI, gst.VII = \
             "I", "II", "III", "IV", "V", "VI", "VII"
     else:
-        st.I, st.II, st.III, st.IV, st.V, st.VI, st.VII = \
+        gst.I, gst.II, gst.III, gst.IV, gst.V, gst.VI, gst.VII = \
             "I7", "II7", "III7", "IV7", "V7", "VI7", "VII7"
-    st.NUMERALS = st.I, st.II, st.III, st.IV, st.V, st.VI, st.VII
+    gst.NUMERALS = gst.I, gst.II, gst.III, gst.IV, gst.V, gst.VI, gst.VII
+    session.invalidate_prefetch()
 
 
 @new_question
-def set_key(reset_score=True):
+def set_key(session, reset_score=True):
     mes = ("Enter the desired key, use upper-case for major "
            "and lower-case for minor (e.g. C or c).\n"
             "Enter R/r for a random major/minor key.")
-    newkey = input(mes)
+    newkey = session.input(mes)
+    gst = mode_settings(session)
     keys = ['A', 'Bb', 'B', 'C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab']
     if newkey == 'R':
-        st.KEY = random.choice(keys)
+        gst.KEY = random.choice(keys)
     elif newkey == 'r':
-        st.KEY = random.choice(keys).lower()
+        gst.KEY = random.choice(keys).lower()
     elif notes.is_valid_note(newkey):
-        st.KEY = newkey
+        gst.KEY = newkey
     else:
         print("Input key not understood, key unchanged.")
-    st.CURRENT_MODE.intro()
+    session.invalidate_prefetch()
+    session.current_mode.intro(session)
     if reset_score:
-        st.COUNT = 0
-        st.SCORE = 0
+        session.reset_score()
 
 
 @repeat_question
-def toggle_many_octaves():
-    st.MANY_OCTAVES = not st.MANY_OCTAVES
-    print("MANY_OCTAVE : {}".format(st.MANY_OCTAVES))
+def toggle_many_octaves(session):
+    gst = mode_settings(session)
+    gst.MANY_OCTAVES = not gst.MANY_OCTAVES
+    session.invalidate_prefetch()
+    print("MANY_OCTAVE : {}".format(gst.MANY_OCTAVES))
 
 
 @repeat_question
-def arpeggiate(invert=False, descending=False, chord=None, bpm=None, 
+def arpeggiate(session, invert=False, descending=False, chord=None, bpm=None, 
         durations=None):
     if not bpm:
-        bpm = st.BPM
+        bpm = mode_settings(session).BPM
 
     # if not delay:
     #     delay = st.DELAY/2
 
     if chord:
         pass
-    elif st.CURRENT_MODE.name in ['single_chord', 'chord_tone']:
-        chord = st.CURRENT_Q_INFO["chord"]
-    elif st.CURRENT_MODE.name in ['interval']:
-        chord = st.CURRENT_Q_INFO["interval"]
+    elif session.current_mode.name in ['single_chord', 'chord_tone']:
+        chord = session.current_q_info["chord"]
+    elif session.current_mode.name in ['interval']:
+        chord = session.current_q_info["interval"]
     else:
-        print("Arpeggiation not available in {} mode.".format(st.CURRENT_MODE))
+        print("Arpeggiation not available in {} mode."
+              "".format(session.current_mode))
         return
 
-    arpeggiation = [x for x in chord]
-    if invert:
-        arpeggiation = [arpeggiation[i] for i in invert]
-    elif descending:
-        arpeggiation.reverse()
-
     # Play
-    easy_play(arpeggiation, durations, bpm)
-    play_wait()  # play wait
+    tl = Timeline(bpm=bpm)
+    tl.add_phrase(arpeggiation(chord, invert, descending), durations)
+    return tl.rest().play()
     # bar = Bar()
     # if not durations:
     #     durations = [4]*len(arpeggiation)
@@ -131,7 +209,7 @@ def arpeggiate(invert=False, descending=False, chord=None, bpm=None,
     #     fluidsynth.play_Note(x)
     #     time.sleep(delay)
 
-def change_mode_settings(mode):
+def change_mode_settings(session, mode):
 
     if mode == "interval":
         interval_modes = \
@@ -139,32 +217,43 @@ def change_mode_settings(mode):
         mes = "Enter:\n"
         mes += "\n".join(["{} for {}".format(k, m) 
                 for k, m in enumerate(interval_modes)])
-        user_response = getch(mes)
-        st.INTERVAL_MODE = interval_modes[user_response]
+        user_response = session.getch(mes)
+        mode_settings(session).INTERVAL_MODE = interval_modes[user_response]
     else:
         pass
 
 
 def change_game_mode(new_mode):
     @new_question
-    def _change_mode():
-        st.COUNT = 0
-        st.SCORE = 0
-        if new_mode == st.CURRENT_MODE.name:
-            change_mode_settings(new_mode)
-        st.CURRENT_MODE = game_modes[new_mode]
+    def _change_mode(session):
+        session.reset_score()
+        if new_mode == session.current_mode.name:
+            change_mode_settings(session, new_mode)
+        session.current_mode = game_modes[new_mode]
+        session.invalidate_prefetch()
     return _change_mode
 
 @repeat_question
-def play_question_again():
+def play_question_again(session):
     return
 
+def quit_game(session):
+    sys.exit()
+
+@repeat_question
+def answer_stats(session):
+    for recorder in session.recorders:
+        if isinstance(recorder, AttemptLog):
+            print_stats(recorder.load())
+            return
+    print("No answers have been logged in this game.")
+
 @repeat_question
-def toggle_alt_chord_tone_res():
-    st.ALTERNATIVE_CHORD_TONE_RESOLUTION = \
-        (st.ALTERNATIVE_CHORD_TONE_RESOLUTION + 1) % 3
+def toggle_alt_chord_tone_res(session):
+    session.alternative_chord_tone_resolution = \
+        (session.alternative_chord_tone_resolution + 1) % 3
     print("Switching to chord tone resolution "
-          "option {}".format(st.ALTERNATIVE_CHORD_TONE_RESOLUTION))
+          "option {}".format(session.alternative_chord_tone_resolution))
 
     
 
@@ -193,17 +282,22 @@ menu_commands = [
                         change_game_mode('single_chord')),
     gs.MenuCommand("i", "toggle between chord tone resolutions", 
                         toggle_alt_chord_tone_res),
+    gs.MenuCommand("a", "see statistics on all your logged answers", 
+                        answer_stats),
     gs.MenuCommand("x", "quit", 
-                        sys.exit),
+                        quit_game),
     gs.MenuCommand("", "hear the chord or progression again", 
                         play_question_again,
                  input_description="Press Enter"),
 ]
 menu_commands = OrderedDict([(mc.command, mc) for mc in menu_commands])
 
+# keys that interrupt playback (not note names, which are also answers)
+HOTKEYS = [c for c in menu_commands if len(c) == 1 and c not in 'abcdefg']
+
 
 # Game Mode Intro Functions
-def intro(play_cadence=True):
+def intro(session, play_cadence=True):
     print("\n" + "~" * 20 + "\n")
 
     # List menu_commands
@@ -213,16 +307,16 @@ def intro(play_cadence=True):
     print("\n" + "-" * 10 + "\n")
 
     # Display key
-    if st.KEY == st.KEY.lower():
-        print("KEY:", st.KEY.upper(), "min")
+    gst = mode_settings(session)
+    if gst.KEY == gst.KEY.lower():
+        print("KEY:", gst.KEY.upper(), "min")
     else:
-        print("KEY:", st.KEY, "Maj")
+        print("KEY:", gst.KEY, "Maj")
     print("-" * 10)
 
     # Play cadence
     if play_cadence:
-        play_progression(st.CADENCE, st.KEY, Iup=st.I)
-        play_wait()
+        cadence_timeline(gst).play()
         # time.sleep(st.DELAY)
     # time.sleep(st.DELAY)
     return
@@ -232,8 +326,9 @@ def intro(play_cadence=True):
 ### Interval ##################################################################
 ###############################################################################
 
+@timed('grade')
 @new_question
-def eval_interval_name(user_answer, interval, diatonic):
+def eval_interval_name(session, user_answer, interval, diatonic):
     semitone_distance = int(interval[1]) - int(interval[0])
     names = ['8', '2b', '2', '3b', '3', '4', '5b', '5', '6b', '6', '7b', '7']
     correct_answer = names[semitone_distance % 12]
@@ -244,17 +339,18 @@ def eval_interval_name(user_answer, interval, diatonic):
     note_nums = [diatonic.note2degree(x) for x in interval]
     print("Interval Notes:", " ".join([str(x) for x in note_nums]))
     if user_answer == correct_answer:
-        st.SCORE += 1
+        session.score += 1
         print("Good Job!")
         print()
     else:
         print("It's ok, you'll get 'em next time.")
         print()
-    play_wait()
+    play_wait(1, bpm=mode_settings(session).BPM)
 
 
+@timed('grade')
 @new_question
-def eval_interval(ans, interval, diatonic):
+def eval_interval(session, ans, interval, diatonic):
     try:
         int(ans)
         answers = [x for x in ans]
@@ -262,14 +358,12 @@ def eval_interval(ans, interval, diatonic):
         answers = ans.split(" ")
 
     def parse_answer(ans):
-        try:
+        if ans.isdigit():
             return int(ans) % 8
-        except:
-            try:
-                note_name = ans[0].upper() + ans[1:]  # capitalize for mingus
-                return diatonic.note2degree(Note(ans))
-            except:
-                return "Err" 
+        pc = notenames.pitch_class(ans)
+        if pc is None or pc not in diatonic.base_semitones:
+            return "Err"
+        return diatonic.base_semitones.index(pc) + 1
 
     user_answers = [parse_answer(ans) for ans in answers]
     correct_answers = [diatonic.note2degree(x) for x in interval]
@@ -297,95 +391,115 @@ def eval_interval(ans, interval, diatonic):
     names = ['8', '2b', '2','3b', '3', '4', '5b', '5', '6b', '6', '7b', '7']
     print("Interval:", names[semitone_distance % 12])
 
-    if all([x == y for x, y in zip(user_answers, correct_answers)]):
-        st.SCORE += 1
+    correct = all([x == y for x, y in zip(user_answers, correct_answers)])
+    gst = mode_settings(session)
+    session.record_attempt('interval', gst.KEY, [int(x) for x in interval],
+                           [int(diatonic.degree2note(x)) if x in range(1, 8)
+                            else -1 for x in user_answers],
+                           correct)
+    session.adapt(correct)
+    if correct:
+        session.score += 1
         print("Good Job!")
         print()
     else:
         print("It's ok, you'll get 'em next time.")
         print()
-    play_wait()
+    play_wait(1, bpm=gst.BPM)
 
 
-def new_question_interval():
-    if st.NEWQUESTION:
-        if st.COUNT:
-            print("score: {} / {} = {:.2%}"
-                  "".format(st.SCORE, st.COUNT, st.SCORE/st.COUNT))
-        st.COUNT += 1
+def interval_choices(gst=st):
+    """Returns the Ioctaves, first note degrees, interval numbers and 
+    directions (ascending or not) that interval questions are picked from.
+    """
+    if gst.MANY_OCTAVES:
+        octaves = list(st.OCTAVES)
+    else:
+        octaves = [st.DEFAULT_IOCTAVE]
 
-        # Pick Ioctave
-        if st.MANY_OCTAVES:
-            Ioctave = random.choice(st.OCTAVES)
-        else:
-            Ioctave = st.DEFAULT_IOCTAVE
-
-        from musictools import Diatonic
-        diatonic = Diatonic(key=st.KEY, Ioctave=Ioctave)
-        
-        # pick first note
-        if st.FIXED_ROOT:
-            first_note = diatonic.notes[st.FIXED_ROOT - 1]
-        else:
-            first_note = random.choice(diatonic.notes)
-
-        # pick second note
-        if st.INTERVAL_MODE == 'triads':
-            number = random.choice([3, 5, 8])
-            interval = diatonic.interval(number, root=first_note, 
-                ascending=True)
-        elif st.INTERVAL_MODE == 'sevenths':
-            number = random.choice([3, 5, 7, 8])
-            interval = diatonic.interval(number, root=first_note, 
-                ascending=True)
-        elif st.INTERVAL_MODE == 'ascending':
-            number = random.choice(st.INTERVALS)
-            interval = diatonic.interval(number, root=first_note, 
-                ascending=True)
-        elif st.INTERVAL_MODE == 'descending':  # redundant for harmonic intrvls
-            number = random.choice(st.INTERVALS)
-            interval = diatonic.interval(number, root=first_note, 
-                ascending=False)
-        elif st.INTERVAL_MODE == 'mixed':  # redundant for harmonic intervals
-            number = random.choice(st.INTERVALS)
-            interval = diatonic.interval(number, root=first_note, 
-                ascending=bool(random.choice([0, 1])))
-        else:
-            raise Exception("Can't understand.  st.INTERVAL_MODE = {}"
-                            "".format(st.INTERVAL_MODE))
+    if st.FIXED_ROOT:
+        roots = [st.FIXED_ROOT]
+    else:
+        roots = list(range(1, 8))
+
+    if gst.INTERVAL_MODE == 'triads':
+        return octaves, roots, [3, 5, 8], [True]
+    elif gst.INTERVAL_MODE == 'sevenths':
+        return octaves, roots, [3, 5, 7, 8], [True]
+    elif gst.INTERVAL_MODE == 'ascending':
+        return octaves, roots, list(st.INTERVALS), [True]
+    elif gst.INTERVAL_MODE == 'descending':  # redundant for harmonic intrvls
+        return octaves, roots, list(st.INTERVALS), [False]
+    elif gst.INTERVAL_MODE == 'mixed':  # redundant for harmonic intervals
+        return octaves, roots, list(st.INTERVALS), [True, False]
+    else:
+        raise Exception("Can't understand.  INTERVAL_MODE = {}"
+                        "".format(gst.INTERVAL_MODE))
+
+
+@timed('prepare')
+def prepare_interval(session=None):
+    """Picks a new interval question (adaptively, if `session` is given).
+    Returns its `current_q_info`."""
+    gst = mode_settings(session)
+    item, sampler = choose(session, 'interval', 
+                           [KEY_INDICES] + list(interval_choices(gst)), 
+                           prefix=(key_index(gst.KEY),))
+    _, Ioctave, root, number, ascending = item
+
+    # voice the (key-independent) interval in the current key
+    diatonic = get_diatonic(gst.KEY, Ioctave)
+    interval = NoteContainer(diatonic.absolute(
+        interval_offsets(number, root, ascending, diatonic.minor)))
+
+    # change Unison intervals to P8 intervals
+    if len(interval) == 1:
+        P8 = copy(interval[0])
+        P8.octave += 1
+        interval = NoteContainer([interval[0], P8])
+
+    # Voice question
+    tl = Timeline(bpm=gst.BPM)
+    if st.HARMONIC_INTERVALS:
+        tl.add(interval)
+    else:
+        tl.add_phrase([x for x in interval])
 
-        # change Unison intervals to P8 intervals
-        if len(interval) == 1:
-            P8 = copy(interval[0])
-            P8.octave += 1
-            interval = NoteContainer([interval[0], P8])
+    return {'interval': interval,
+            'Ioctave': Ioctave,
+            'diatonic': diatonic,
+            'timeline': tl,
+            'sampler': sampler,
+            'items': [item]}
 
-        # store question info
-        st.CURRENT_Q_INFO = {'interval': interval,
-                             'Ioctave': Ioctave,
-                             'diatonic': diatonic}
 
-    else:
-        interval = st.CURRENT_Q_INFO['interval']
-        Ioctave = st.CURRENT_Q_INFO['Ioctave']
-        diatonic = st.CURRENT_Q_INFO['diatonic']
+def new_question_interval(session):
+    if session.new_question:
+        session.print_score()
+        session.count += 1
+        session.current_q_info = next_question(session, prepare_interval)
+
+    interval = session.current_q_info['interval']
+    Ioctave = session.current_q_info['Ioctave']
+    diatonic = session.current_q_info['diatonic']
 
     # Play interval
-    if st.HARMONIC_INTERVALS:
-        easy_play(interval)
-    else:
-        easy_play([x for x in interval])
+    session.mark_sound()
+    session.play(session.current_q_info['timeline'])
 
     # Request user's answer
-    ans = input("Enter 1-7 or note names separated by spaces: ").strip()
+    ans = session.input("Enter 1-7 or note names separated by "
+                        "spaces: ").strip()
 
     if ans in menu_commands:
-        menu_commands[ans].action()
+        menu_commands[ans].action(session)
     else:
         if st.NAME_INTERVAL:
-            eval_interval_name(ans, interval, diatonic)
+            eval_interval_name(session, ans, interval, diatonic)
         else:
-            eval_interval(ans, interval, diatonic)
+            eval_interval(session, ans, interval, diatonic)
+    if session.new_question:
+        session.mark_answered()
     return
 
 
@@ -394,68 +508,92 @@ def new_question_interval():
 ###############################################################################
 
 
+@timed('grade')
 @new_question
-def eval_single_chord(usr_ans, correct_numeral, root_note):
-    correct_ = False
-    if usr_ans == str(st.NUMERALS.index(correct_numeral) + 1):
-        correct_ = True
-    else:
-        try:
-            usr_note_val = int(Note(usr_ans[0].upper() + usr_ans[1:])) % 12
-            correct_note_val = int(Note(root_note)) % 12
-            if usr_note_val == correct_note_val:
-                correct_ = True
-        except:
-            pass
-    return correct_
-
-
-def new_question_single_chord():
+def eval_single_chord(session, usr_ans, correct_numeral, root_note):
+    if usr_ans == str(mode_settings(session).NUMERALS.index(correct_numeral) + 1):
+        return True
+    usr_note_val = notenames.pitch_class(usr_ans)
+    return (usr_note_val is not None and 
+            usr_note_val == notenames.pitch_class(root_note))
+
+
+def chord_choices(gst=st):
+    """Returns the octaves (None meaning the default) and numerals that
+    chords are picked from."""
+    octaves = list(st.OCTAVES) if gst.MANY_OCTAVES else [None]
+    return octaves, list(gst.NUMERALS)
+
+
+@timed('prepare')
+def prepare_single_chord(session=None):
+    """Picks a new single chord question (adaptively, if `session` is 
+    given).  Returns its `current_q_info`."""
+    # Pick random chord/octave
+    gst = mode_settings(session)
+    item, sampler = choose(session, 'single_chord',
+                           [KEY_INDICES] + list(chord_choices(gst)),
+                           prefix=(key_index(gst.KEY),))
+    numeral, chord, Ioctave = random_chord(numeral=item[2], octave=item[1],
+                                           gst=gst)
+
+    # Voice question
+    tl = Timeline(bpm=gst.BPM)
+    tl.add_phrase(voice_progression([numeral], gst.KEY, Ioctave=Ioctave))
+
+    return {'numeral': numeral,
+            'chord': chord,
+            'Ioctave': Ioctave,
+            'timeline': tl,
+            'sampler': sampler,
+            'items': [item]}
+
+
+def new_question_single_chord(session):
     # Choose new chord+octave/Progression
     # Single chord mode
-    if st.NEWQUESTION:
-        if st.COUNT:
-            print("score: {} / {} = {:.2%}".format(st.SCORE, st.COUNT, 
-                    st.SCORE/st.COUNT))
-        st.COUNT += 1
-
-        # Pick random chord/octave
-        numeral, chord, Ioctave = random_chord()
-
-        # store question info
-        st.CURRENT_Q_INFO = {'numeral': numeral,
-                             'chord': chord,
-                             'Ioctave': Ioctave}
-    else:
-        numeral = st.CURRENT_Q_INFO['numeral']
-        chord = st.CURRENT_Q_INFO['chord']
-        Ioctave = st.CURRENT_Q_INFO['Ioctave']
+    if session.new_question:
+        session.print_score()
+        session.count += 1
+        session.current_q_info = next_question(session, prepare_single_chord)
+
+    numeral = session.current_q_info['numeral']
+    chord = session.current_q_info['chord']
+    Ioctave = session.current_q_info['Ioctave']
 
     # Play chord
-    play_progression([numeral], st.KEY, Ioctave=Ioctave)
+    session.mark_sound()
+    session.play(session.current_q_info['timeline'])
 
     # Request user's answer
-    ans = getch("Enter 1-7 or root of chord: ").strip()
+    ans = session.getch("Enter 1-7 or root of chord: ").strip()
+    gst = mode_settings(session)
 
     if ans in menu_commands:
-        menu_commands[ans].action()
+        menu_commands[ans].action(session)
     else:
         if isvalidnote(ans):
-            if eval_single_chord(ans, numeral, chord[0].name):
-                st.SCORE += 1
+            correct = eval_single_chord(session, ans, numeral, chord[0].name)
+            session.record_attempt('single_chord', gst.KEY, [int(chord[0])],
+                                   [answer_root(ans, gst)], correct)
+            session.adapt(correct)
+            if correct:
+                session.score += 1
                 print("Yes!", chordname(chord, numeral))
                 if st.RESOLVE_WHEN_CORRECT:
-                    resolve_with_chords(numeral, key=st.KEY, Ioctave=Ioctave, 
-                        numerals=st.NUMERALS, bpm=st.BPM*2)
-                    play_wait()
+                    resolve_with_chords(numeral, key=gst.KEY, Ioctave=Ioctave, 
+                        numerals=gst.NUMERALS, bpm=gst.BPM*2)
+                    play_wait(1, bpm=gst.BPM)
             else:
                 print("No!", chordname(chord, numeral))
                 if st.RESOLVE_WHEN_INCORRECT:
-                    resolve_with_chords(numeral, key=st.KEY, Ioctave=Ioctave, 
-                        numerals=st.NUMERALS, bpm=st.BPM*2)
-                    play_wait()
+                    resolve_with_chords(numeral, key=gst.KEY, Ioctave=Ioctave, 
+                        numerals=gst.NUMERALS, bpm=gst.BPM*2)
+                    play_wait(1, bpm=gst.BPM)
         else:
             print("User input not understood.  Please try again.")
+    if session.new_question:
+        session.mark_answered()
     return
 
 
@@ -464,21 +602,25 @@ def new_question_single_chord():
 ###############################################################################
 
 
+@timed('grade')
 @new_question
-def eval_progression(ans, prog, prog_strums):
+def eval_progression(session, ans, prog, prog_strums):
     try:
         int(ans)
         answers = [x for x in ans]
     except:
         answers = ans.split(" ")
 
+    gst = mode_settings(session)
+    roots = [NoteContainer(progressions.to_chords([x], gst.KEY)[0])[0]
+             for x in prog]
     answers_correct = []
     for i, answer in enumerate(answers):
         try:
             correct_numeral = prog[i]
-            tmp = progressions.to_chords([correct_numeral], st.KEY)[0]
-            root = NoteContainer(tmp)[0].name
-            user_correct = eval_single_chord(answer, correct_numeral, root)
+            root = roots[i].name
+            user_correct = eval_single_chord(session, answer, correct_numeral,
+                                             root)
             print(user_correct)
             answers_correct.append(user_correct)
         except IndexError:
@@ -489,48 +631,75 @@ def eval_progression(ans, prog, prog_strums):
     print("Progression:", " ".join(prog_strums))
     print("Your answer:   ", " ".join(answers))
     print("Correct Answer:", " ".join(
-            [str(st.NUMERALS.index(x) + 1) for x in prog]))
+            [str(gst.NUMERALS.index(x) + 1) for x in prog]))
 
+    session.record_attempt('progression', gst.KEY, [int(x) for x in roots],
+                           [answer_root(x, gst) for x in answers],
+                           all(answers_correct))
+    session.adapt(answers_correct + 
+                  [False] * (len(prog) - len(answers_correct)))
     if all(answers_correct):
-        st.SCORE += 1
+        session.score += 1
         print("Good Job!")
         print()
     else:
         print("It's ok, you'll get 'em next time.")
         print()
     # time.sleep(st.DELAY)
-    play_wait()
-
-
-def new_question_progression():
-    if st.NEWQUESTION:
-        if st.COUNT:
-            print("score: {} / {} = {:.2%}".format(st.SCORE, st.COUNT, 
-                                                    st.SCORE/st.COUNT))
-        st.COUNT += 1
-        # Find random chord progression
-        prog_length = random.choice(st.PROG_LENGTHS)
-        prog, prog_strums = random_progression(prog_length, st.NUMERALS, 
-                                                st.CHORD_LENGTHS)
-
-        # store question info
-        st.CURRENT_Q_INFO = {'prog': prog,
-                             'prog_strums': prog_strums}
+    play_wait(1, bpm=gst.BPM)
+
+
+@timed('prepare')
+def prepare_progression(session=None):
+    """Picks a new progression question (adaptively, if `session` is 
+    given).  Returns its `current_q_info`."""
+    # Find random chord progression
+    gst = mode_settings(session)
+    prog_length = random.choice(st.PROG_LENGTHS)
+    if session is None:
+        prog, prog_strums = markov_progression(prog_length, gst.NUMERALS,
+                                               st.CHORD_LENGTHS)
+        sampler, items = None, None
     else:
-        prog = st.CURRENT_Q_INFO['prog']
-        prog_strums = st.CURRENT_Q_INFO['prog_strums']
+        sampler = session.sampler(('progression', tuple(gst.NUMERALS)), 
+                                  lambda: markov_sampler(gst.NUMERALS))
+        prog, prog_strums, items = adaptive_progression(
+            sampler, key_index(gst.KEY), prog_length, st.CHORD_LENGTHS)
+
+    # Voice question
+    tl = Timeline(bpm=gst.BPM)
+    tl.add_phrase(voice_progression(prog_strums, gst.KEY))
+
+    return {'prog': prog,
+            'prog_strums': prog_strums,
+            'timeline': tl,
+            'sampler': sampler,
+            'items': items}
+
+
+def new_question_progression(session):
+    if session.new_question:
+        session.print_score()
+        session.count += 1
+        session.current_q_info = next_question(session, prepare_progression)
+
+    prog = session.current_q_info['prog']
+    prog_strums = session.current_q_info['prog_strums']
 
     # Play chord/progression
-    play_progression(prog_strums, st.KEY)
+    session.mark_sound()
+    session.play(session.current_q_info['timeline'])
 
     # Request user's answer
-    ans = input("Enter your answer using root note names "
-                "or numbers 1-7 seperated by spaces: ").strip()
+    ans = session.input("Enter your answer using root note names "
+                        "or numbers 1-7 seperated by spaces: ").strip()
 
     if ans in menu_commands:
-        menu_commands[ans].action()
+        menu_commands[ans].action(session)
     else:
-        eval_progression(ans, prog, prog_strums)
+        eval_progression(session, ans, prog, prog_strums)
+    if session.new_question:
+        session.mark_answered()
 
     # # Request user's answer
     # ans = input("Enter your answer using root note names "
@@ -553,27 +722,27 @@ def new_question_progression():
 ###############################################################################
 
 
-def resolve_chord_tone(chord, tone, Ioctave):
+def resolve_chord_tone(session, chord, tone, Ioctave):
+    """Plays the chord-tone resolution (and the gap after it) as a single
+    `Timeline`."""
     # play_progression([numeral], st.KEY, Ioctave=Ioctave)
+    tl = Timeline(bpm=mode_settings(session).BPM)
 
-    if st.ALTERNATIVE_CHORD_TONE_RESOLUTION == 1:
-        fluidsynth.play_NoteContainer(chord)
-        play_wait()
-        fluidsynth.play_Note(tone)
-        play_wait()
+    if session.alternative_chord_tone_resolution == 1:
+        tl.add(chord).rest()
+        tl.add(tone).rest()
         root = chord[0]
         interval = NoteContainer([root, tone])
-        fluidsynth.play_NoteContainer(interval)
-    elif st.ALTERNATIVE_CHORD_TONE_RESOLUTION == 2:
-        fluidsynth.play_NoteContainer(chord)
-        play_wait()
+        tl.add(interval, 2)
+    elif session.alternative_chord_tone_resolution == 2:
+        tl.add(chord).rest()
         tone_idx = [x for x in chord].index(tone)
         if tone_idx == 0:
-            arpeggiate()
+            tl.add_phrase(arpeggiation(chord))
         elif tone_idx == 1:
-            arpeggiate(invert=[1, 0, 2])
+            tl.add_phrase(arpeggiation(chord, invert=[1, 0, 2]))
         elif tone_idx == 2:
-            arpeggiate(descending=True)
+            tl.add_phrase(arpeggiation(chord, descending=True))
         else:
             raise Exception("This chord tone resolutions mode is only "
                             "implemented for triads.")
@@ -583,96 +752,111 @@ def resolve_chord_tone(chord, tone, Ioctave):
         # Iup_note.octave += 1
         # fluidsynth.play_Note(Iup_note)
     else:
-        fluidsynth.play_NoteContainer(chord)
-        play_wait()
-        fluidsynth.play_Note(tone)
-        play_wait()
-        arpeggiate()  # sets NEWQUESTION = False
-
-
-def new_question_chord_tone():
-    if st.NEWQUESTION:
-        if st.COUNT:
-            print("score: {} / {} = {:.2%}".format(st.SCORE, st.COUNT, 
-                                                    st.SCORE/st.COUNT))
-        st.COUNT += 1
-
-        # Pick random chord/octave
-        numeral, chord, Ioctave = random_chord()
-
-        # Pick a random tone in the chord
-        tone = random.choice(chord)
-
-        # store question info
-        st.CURRENT_Q_INFO = {'numeral': numeral,
-                             'chord': chord,
-                             'Ioctave': Ioctave,
-                             'tone': tone}
-    else:
-        numeral = st.CURRENT_Q_INFO['numeral']
-        chord = st.CURRENT_Q_INFO['chord']
-        Ioctave = st.CURRENT_Q_INFO['Ioctave']
-        tone = st.CURRENT_Q_INFO['tone']
+        tl.add(chord).rest()
+        tl.add(tone).rest()
+        tl.add_phrase(arpeggiation(chord))
+    return tl.rest().play()
+
+
+@timed('prepare')
+def prepare_chord_tone(session=None):
+    """Picks a new chord tone question (adaptively, if `session` is 
+    given).  Returns its `current_q_info`."""
+    # Pick random chord/octave and a tone in the chord
+    gst = mode_settings(session)
+    item, sampler = choose(session, 'chord_tone',
+                           [KEY_INDICES] + list(chord_choices(gst)) + 
+                           [list(range(len(st.TONES)))],
+                           prefix=(key_index(gst.KEY),))
+    numeral, chord, Ioctave = random_chord(numeral=item[2], octave=item[1],
+                                           gst=gst)
+    tone = chord[item[3]]
+
+    # Voice question: chord, then tone
+    tl = Timeline(bpm=gst.BPM)
+    tl.add_phrase(voice_progression([numeral], gst.KEY, Ioctave=Ioctave))
+    tl.rest().add(tone)
+
+    return {'numeral': numeral,
+            'chord': chord,
+            'Ioctave': Ioctave,
+            'tone': tone,
+            'timeline': tl,
+            'sampler': sampler,
+            'items': [item]}
+
+
+def new_question_chord_tone(session):
+    if session.new_question:
+        session.print_score()
+        session.count += 1
+        session.current_q_info = next_question(session, prepare_chord_tone)
+
+    numeral = session.current_q_info['numeral']
+    chord = session.current_q_info['chord']
+    Ioctave = session.current_q_info['Ioctave']
+    tone = session.current_q_info['tone']
 
     # Play chord, then tone
-    def playfcn():
-        play_progression([numeral], st.KEY, Ioctave=Ioctave)
-        play_wait()
-        fluidsynth.play_Note(tone)
-    p = Process(target=playfcn())
-    p.start()
+    session.mark_sound()
+    session.play(session.current_q_info['timeline'])
 
     # Request user's answer
     mes = ("Which tone did you hear?\n""Enter {}, or {}: ".format(
             ", ".join([str(t) for t in st.TONES[:-1]]),
             st.TONES[-1]))
-    ans = getch(mes).strip()
-    p.terminate()
+    ans = session.getch(mes).strip()
+    gst = mode_settings(session)
 
     if ans in menu_commands:
-        menu_commands[ans].action()
+        menu_commands[ans].action(session)
     else:
         try:
             ans = int(ans)
         except:
             print("User input not understood.  Please try again.")
-            st.NEWQUESTION = False
+            session.new_question = False
 
         if ans in st.TONES:
             tone_idx = [n for n in chord].index(tone)
             correct_ans = st.TONES[tone_idx]
+            session.record_attempt('chord_tone', gst.KEY, [int(tone)],
+                                   [int(chord[st.TONES.index(ans)])],
+                                   ans == correct_ans)
+            session.adapt(ans == correct_ans)
             if ans == correct_ans:
-                st.SCORE += 1
+                session.score += 1
                 print("Yes! The {} tone of".format(correct_ans), 
                                                     chordname(chord, numeral))
                 if st.ARPEGGIATE_WHEN_CORRECT:
-                    resolve_chord_tone(chord, tone, Ioctave)
-                    play_wait()
-                    st.NEWQUESTION = True
+                    resolve_chord_tone(session, chord, tone, Ioctave)
+                    session.new_question = True
             else:
                 print("No! The {} tone of".format(correct_ans), 
                                                     chordname(chord, numeral))
                 if st.ARPEGGIATE_WHEN_INCORRECT:
-                    resolve_chord_tone(chord, tone, Ioctave)
-                    play_wait()
-                    st.NEWQUESTION = True
+                    resolve_chord_tone(session, chord, tone, Ioctave)
+                    session.new_question = True
 
         # secret option
         elif ans in [8, 9, 0]:
             tone_idx = [8, 9, 0].index(ans)
-            for num in st.NUMERALS:
-                tmp = progressions.to_chords([num], st.KEY)[0]
+            tl = Timeline(bpm=gst.BPM)
+            for num in gst.NUMERALS:
+                tmp = progressions.to_chords([num], gst.KEY)[0]
                 num_chord = NoteContainer(tmp)
-                play_progression([num], st.KEY, Ioctave=Ioctave)
-                play_wait()
-                fluidsynth.play_Note(num_chord[tone_idx])
-                play_wait()
-            play_wait()
-            st.NEWQUESTION = False
+                tl.add_phrase(voice_progression([num], gst.KEY, 
+                                                Ioctave=Ioctave))
+                tl.rest()
+                tl.add(num_chord[tone_idx]).rest()
+            tl.rest().play()
+            session.new_question = False
 
         else:
             print("User input not understood.  Please try again.")
-            st.NEWQUESTION = False
+            session.new_question = False
+    if session.new_question:
+        session.mark_answered()
     return
 
 
@@ -686,22 +870,27 @@ def new_question_chord_tone():
 game_modes = {
     'single_chord': gs.GameMode('single_chord', 
                                 intro, 
-                                new_question_single_chord
+                                new_question_single_chord,
+                                prepare_fcn=prepare_single_chord
                                 ),
 
     'progression': gs.GameMode('progression', 
                                intro, 
-                               new_question_progression
+                               new_question_progression,
+                               prepare_fcn=prepare_progression
                               ),
 
     'chord_tone': gs.GameMode('chord_tone', 
-                              lambda: intro(play_cadence=False), 
-                              new_question_chord_tone
+                              lambda session: intro(session,
+                                                    play_cadence=False), 
+                              new_question_chord_tone,
+                              prepare_fcn=prepare_chord_tone
                              ),
 
     'interval': gs.GameMode('interval', 
                             intro, 
-                            new_question_interval
+                            new_question_interval,
+                            prepare_fcn=prepare_interval
                            ),
     # 'random_notes': gs.GameMode('random_notes',
     #                         intro_rn,
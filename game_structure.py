@@ -28,12 +28,13 @@ class SettingsContainer(object):
 
 
 class GameMode:
-    def __init__(self, name, intro_fcn, new_question_fcn, menu_fcn=None, mode_specific_settings=None):
+    def __init__(self, name, intro_fcn, new_question_fcn, menu_fcn=None, mode_specific_settings=None, prepare_fcn=None):
         self.name = name
         self.intro_fcn = intro_fcn
         self.new_question_fcn = new_question_fcn
         self.menu_fcn = menu_fcn
         self.settings = mode_specific_settings
+        self.prepare_fcn = prepare_fcn
 
     def intro(self, *args, **kwargs):
         self.intro_fcn(*args, **kwargs)
@@ -41,6 +42,9 @@ class GameMode:
     def new_question(self, *args, **kwargs):
         self.new_question_fcn(*args, **kwargs)
 
+    def prepare(self, *args, **kwargs):
+        return self.prepare_fcn(*args, **kwargs)
+
     def eval(self, *args, **kwargs):
         self.eval_fcn(*args, **kwargs)
 
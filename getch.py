@@ -3,6 +3,10 @@ This module sets of the getch() function, which is like input(), but only
 takes a single character, and doesn't require the user to press enter.
 Credit:
 https://stackoverflow.com/questions/510357/python-read-a-single-character-from-the-user
+
+It also provides `KeyboardReader`, which puts the terminal into cbreak mode
+once and reads keys on a background thread, so keys typed while a question
+is playing are kept (and menu hotkeys can cut playback short).
 """
 
 
@@ -11,6 +15,15 @@ from __future__ import division, absolute_import, print_function
 try: input = raw_input
 except: pass
 
+# Standard Library Dependencies
+import os
+import sys
+import threading
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
 
 class _Getch:
     """Gets a single character from standard input.  Does not echo to the
@@ -49,8 +62,181 @@ class _GetchWindows:
         return msvcrt.getch()
 
 
+_getch = None  # the `_Getch`, created on first use
+_reader = None  # the running `KeyboardReader`, if any
+
+
 def getch(message=None):
+    if _reader is not None:
+        return _reader.getch(message)
+    global _getch
     if message:
         print(message)
-    getchfunc = _Getch()
-    return getchfunc()
+    if _getch is None:
+        _getch = _Getch()
+    return _getch()
+
+
+def readline(message=''):
+    """Like `input()`, but reads through the running `KeyboardReader`, if
+    any."""
+    if _reader is not None:
+        return _reader.readline(message)
+    return input(message)
+
+
+BACKSPACE = ('\x7f', '\x08')
+NEWLINE = ('\r', '\n')
+
+
+class KeyboardReader(object):
+    """Reads key presses from standard input on a background thread.
+
+    While started, the terminal is in cbreak mode (keys are available as
+    soon as they're pressed and aren't echoed, but output and Ctrl-C work as
+    usual) and every key pressed is put on a queue, to be taken by
+    `getch()` or `readline()`.
+
+    Args:
+        hotkeys (iterable): keys that set the `interrupt` event when pressed,
+            e.g. to stop playback (see `Timeline.play()`).
+        fd (int, optional): the file descriptor to read.  Defaults to
+            standard input's.
+
+    Example:
+        >>> with KeyboardReader(hotkeys='x') as keyboard:
+        ...     answer = keyboard.readline("Your answer: ")
+    """
+    def __init__(self, hotkeys=(), fd=None):
+        self.hotkeys = set(hotkeys)
+        self.fd = sys.stdin.fileno() if fd is None else fd
+        self.keys = queue.Queue()
+        self.interrupt = threading.Event()
+        self.eof = False
+        self._old_settings = None
+        self._thread = None
+        self._wake = None
+
+    def start(self):
+        global _reader
+        if self._thread is not None:
+            return self
+        try:
+            import msvcrt
+        except ImportError:
+            msvcrt = None
+        if msvcrt is not None:
+            target = self._run_windows
+        else:
+            import tty, termios
+            if os.isatty(self.fd):
+                self._old_settings = termios.tcgetattr(self.fd)
+                tty.setcbreak(self.fd)
+            self._wake = os.pipe()
+            target = self._run
+        self._thread = threading.Thread(target=target)
+        self._thread.daemon = True
+        self._thread.start()
+        _reader = self
+        return self
+
+    def stop(self):
+        global _reader
+        if self._thread is None:
+            return
+        if _reader is self:
+            _reader = None
+        if self._wake is not None:
+            os.write(self._wake[1], b'x')
+            self._thread.join()
+            for fd in self._wake:
+                os.close(fd)
+            self._wake = None
+        if self._old_settings is not None:
+            import termios
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self._old_settings)
+            self._old_settings = None
+        self._thread = None
+
+    def _put(self, key):
+        if key in self.hotkeys:
+            self.interrupt.set()
+        self.keys.put(key)
+
+    def _run(self):
+        import selectors
+        import codecs
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        selector = selectors.DefaultSelector()
+        selector.register(self.fd, selectors.EVENT_READ)
+        selector.register(self._wake[0], selectors.EVENT_READ)
+        try:
+            while True:
+                for key, _ in selector.select():
+                    if key.fd == self._wake[0]:
+                        return
+                    data = os.read(self.fd, 1024)
+                    if not data:  # end of input
+                        self.eof = True
+                        self.keys.put('')
+                        return
+                    for ch in decoder.decode(data):
+                        self._put(ch)
+        finally:
+            selector.close()
+
+    def _run_windows(self):
+        import msvcrt
+        while True:
+            self._put(msvcrt.getwch())
+
+    def getch(self, message=None, timeout=None):
+        """Returns the next key pressed (including any pressed since it was
+        last called), or None after `timeout` seconds."""
+        if message:
+            print(message)
+        if self.eof and self.keys.empty():
+            return ''
+        try:
+            key = self.keys.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if self.keys.empty():
+            self.interrupt.clear()
+        return key
+
+    def readline(self, prompt=''):
+        """Like `input()`, echoing keys as they're taken from the queue (so
+        anything typed early appears after the prompt)."""
+        sys.stdout.write(prompt)
+        sys.stdout.flush()
+        line = []
+        while True:
+            key = self.getch()
+            if key in NEWLINE or key == '':
+                break
+            if key in BACKSPACE:
+                if line:
+                    line.pop()
+                    sys.stdout.write('\b \b')
+            elif key >= ' ':  # ignore other control characters
+                line.append(key)
+                sys.stdout.write(key)
+            sys.stdout.flush()
+        sys.stdout.write('\n')
+        return ''.join(line)
+
+    def clear(self):
+        """Discards any keys pressed but not yet read."""
+        while True:
+            try:
+                self.keys.get_nowait()
+            except queue.Empty:
+                break
+        self.interrupt.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
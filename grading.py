@@ -0,0 +1,301 @@
+"""Grading melodic answers by alignment.
+
+An answer is aligned to the correct notes by edit distance over pitch
+classes (notes an octave apart are equal), so one missed or extra note only
+costs that note instead of shifting every later note out of place.  Each
+correct note gets credit if it is aligned to an answered note of the same
+pitch class; answered notes aligned to nothing are insertions, correct notes
+aligned to nothing are deletions.
+
+`align()` grades one answer; `align_batch()` grades many at once (e.g. every
+attempt in an `AttemptLog`) with NumPy, looping only over note positions,
+and only for answers that can't simply be compared position by position.
+Both break ties the same way, so they always agree.
+
+`StreamingGrader` grades an answer note by note as a listener hears it, with
+the same alignment, so listening can stop once the answer is known to be too
+far off."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+from collections import namedtuple
+
+# Internal Dependencies
+from notenames import note_int
+
+# External Dependencies
+import numpy as np
+
+
+BATCH_ROWS = 2 ** 14  # rows aligned at a time by `align_batch()`
+
+
+class Alignment(namedtuple('Alignment', 'credit partners distance '
+                                        'insertions deletions substitutions')):
+    """The alignment of an answer to the correct notes.  `credit` has a
+    boolean for each correct note, `partners` the index of the answered note
+    aligned with each correct note (None if it was missed)."""
+    __slots__ = ()
+
+    @property
+    def correct(self):
+        return self.distance == 0
+
+
+def _pitch_classes(notes, unknown):
+    notes = [note_int(x) for x in notes]
+    return [x % 12 if x >= 0 else unknown for x in notes]
+
+
+def align(correct_notes, user_notes):
+    """Aligns `user_notes` to `correct_notes` (lists of ints, e.g. mingus
+    note ints; negative ints are unknown notes, which never match).  Returns
+    an `Alignment`."""
+    target = _pitch_classes(correct_notes, -1)
+    answer = _pitch_classes(user_notes, -2)
+    m, n = len(target), len(answer)
+
+    # d[i][j] is the edit distance between target[:i] and answer[:j]
+    d = [[j for j in range(n + 1)]]
+    for i in range(1, m + 1):
+        row = [i]
+        for j in range(1, n + 1):
+            row.append(min(d[i - 1][j - 1] + (target[i - 1] != answer[j - 1]),
+                           d[i - 1][j] + 1,
+                           row[j - 1] + 1))
+        d.append(row)
+
+    # backtrace, preferring (mis)matches, then deletions, then insertions
+    partners = [None] * m
+    insertions = deletions = substitutions = 0
+    i, j = m, n
+    while i or j:
+        if i and j:
+            mismatch = target[i - 1] != answer[j - 1]
+            if d[i][j] == d[i - 1][j - 1] + mismatch:
+                partners[i - 1] = j - 1
+                substitutions += mismatch
+                i, j = i - 1, j - 1
+                continue
+        if i and d[i][j] == d[i - 1][j] + 1:
+            deletions += 1
+            i -= 1
+        else:
+            insertions += 1
+            j -= 1
+    credit = [p is not None and target[k] == answer[p]
+              for k, p in enumerate(partners)]
+    return Alignment(credit, partners, d[m][n], insertions, deletions,
+                     substitutions)
+
+
+class StreamingGrader(object):
+    """Grades an answer note by note while it is being heard.
+
+    Pass `feed` as a listener's `on_note` callback.  The notes heard are
+    aligned to the correct notes by the same edit distance as `align()`,
+    updated one column of the table per note.  `feed` returns True once
+    there is nothing left to listen for -- as many notes were heard as
+    there are correct notes, or the answer will be at least `max_misses`
+    notes off however it goes on (0 to never stop early).
+
+    Attributes:
+        heard (list): the notes fed so far.
+        misses (int): the fewest wrong, missed or extra notes the answer
+            can end up with, given the notes heard so far.
+    """
+    def __init__(self, correct_notes, max_misses=2):
+        self.correct_notes = list(correct_notes)
+        self.target = _pitch_classes(correct_notes, -1)
+        self.max_misses = max_misses
+        self.heard = []
+        # distances between each prefix of the target and the notes heard
+        self._d = list(range(len(self.target) + 1))
+
+    def feed(self, note):
+        if self.done:
+            return True
+        self.heard.append(note)
+        pitch_class = note_int(note) % 12
+        d = self._d
+        new = [len(self.heard)]
+        for i, x in enumerate(self.target):
+            new.append(min(d[i] + (x != pitch_class), d[i + 1] + 1,
+                           new[i] + 1))
+        self._d = new
+        return self.done
+
+    @property
+    def misses(self):
+        return min(self._d)
+
+    @property
+    def covered(self):
+        """The number of correct notes the notes heard so far answer, i.e.
+        the prefix of the correct notes closest to them (the longest, if
+        several are)."""
+        d = self._d
+        return max(i for i, x in enumerate(d) if x == min(d))
+
+    def alignment(self):
+        """Returns the `Alignment` of the notes heard to the first `covered`
+        correct notes."""
+        return align(self.correct_notes[:self.covered], self.heard)
+
+    @property
+    def done(self):
+        return (len(self.heard) >= len(self.target) or
+                bool(self.max_misses) and self.misses >= self.max_misses)
+
+    @property
+    def stopped_early(self):
+        """True if listening stopped before as many notes were heard as there
+        are correct notes."""
+        return self.done and len(self.heard) < len(self.target)
+
+
+def _align_block(target, answer):
+    rows, width = target.shape
+    m = _lengths(target)
+    n = _lengths(answer)
+    target = np.where(target >= 0, target % 12, -1)
+    answer = np.where(answer >= 0, answer % 12, -2)
+
+    # d[i, j] is the edit distance between target[:, :i] and answer[:, :j]
+    d = np.empty((width + 1, width + 1, rows), dtype=np.int16)
+    d[:, 0] = np.arange(width + 1)[:, None]
+    d[0, :] = np.arange(width + 1)[:, None]
+    mismatch = (target[:, :, None] != answer[:, None, :]).transpose(1, 2, 0)
+    for i in range(1, width + 1):
+        for j in range(1, width + 1):
+            sub = d[i - 1, j - 1] + mismatch[i - 1, j - 1]
+            d[i, j] = np.minimum(np.minimum(sub, d[i - 1, j] + 1),
+                                 d[i, j - 1] + 1)
+
+    # backtrace all rows together, with the same preferences as `align()`
+    r = np.arange(rows)
+    i, j = m.copy(), n.copy()
+    partners = np.full((rows, width), -1, dtype=np.int16)
+    insertions = np.zeros(rows, dtype=np.int16)
+    deletions = np.zeros(rows, dtype=np.int16)
+    substitutions = np.zeros(rows, dtype=np.int16)
+    for _ in range(2 * width):
+        active = (i > 0) | (j > 0)
+        if not active.any():
+            break
+        im, jm = np.maximum(i - 1, 0), np.maximum(j - 1, 0)
+        here = d[i, j, r]
+        miss = mismatch[im, jm, r]
+        diag = (i > 0) & (j > 0) & (here == d[im, jm, r] + miss)
+        dele = ~diag & (i > 0) & (here == d[im, j, r] + 1)
+        ins = active & ~diag & ~dele
+        partners[r[diag], im[diag]] = jm[diag]
+        substitutions += diag & miss
+        deletions += dele
+        insertions += ins
+        i -= diag | dele
+        j -= diag | ins
+
+    aligned = np.take_along_axis(answer, np.maximum(partners, 0), axis=1)
+    credit = (partners >= 0) & (aligned == target)
+    return {'credit': credit,
+            'partners': partners,
+            'distance': d[m, n, r],
+            'insertions': insertions,
+            'deletions': deletions,
+            'substitutions': substitutions}
+
+
+def align_batch(target, answer, batch_rows=BATCH_ROWS):
+    """Aligns each row of `answer` to the same row of `target`.
+
+    Args:
+        target, answer (array): ints (e.g. `AttemptLog` columns), one
+            attempt per row, each padded at the end with -1.  Other -1s
+            are unknown notes, which never match.
+        batch_rows (int): rows aligned at a time, to bound memory use.
+
+    Returns a dictionary of arrays: `credit` (a boolean for each target
+    note), `partners` (the index of the answer note aligned with each target
+    note, -1 if none), and per row `distance`, `insertions`, `deletions` and
+    `substitutions`."""
+    target = np.asarray(target)
+    answer = np.asarray(answer)
+    width = max(target.shape[1], answer.shape[1])
+
+    # only look at as many note positions as were ever used
+    rows = len(target)
+    m, n = _lengths(target), _lengths(answer)
+    used = max(m.max(initial=0), n.max(initial=0), 1)
+    target = _pad(target[:, :used].astype(np.int16), used)
+    answer = _pad(answer[:, :used].astype(np.int16), used)
+
+    # An answer as long as the target with at most one wrong note aligns
+    # position by position: any other alignment needs two or more
+    # insertions/deletions.  Only the remaining rows need the full table.
+    credit = (target >= 0) & (answer >= 0) & ((target - answer) % 12 == 0)
+    substitutions = m.copy()
+    for k in range(used):  # faster than summing short rows
+        substitutions -= credit[:, k]
+    positions = np.arange(used, dtype=np.int16)
+    out = {'credit': credit,
+           'partners': np.where(positions < m[:, None], positions,
+                                np.int16(-1)),
+           'distance': substitutions,
+           'insertions': np.zeros(rows, dtype=np.int16),
+           'deletions': np.zeros(rows, dtype=np.int16),
+           'substitutions': substitutions.copy()}
+
+    rest = np.flatnonzero((m != n) | (substitutions > 1))
+    for k in range(0, len(rest), batch_rows):
+        idx = rest[k:k + batch_rows]
+        block = _align_block(target[idx], answer[idx])
+        for name in out:
+            out[name][idx] = block[name]
+    for name in ('credit', 'partners'):
+        out[name] = _pad(out[name], width, False if name == 'credit' else -1)
+    return out
+
+
+def _lengths(x):
+    """Returns the number of notes in each row of `x`, i.e. up to the last
+    that isn't -1 (unknown notes in between count)."""
+    last = np.zeros(len(x), dtype=np.int16)
+    for k in range(x.shape[1]):  # faster than reducing short rows
+        last[x[:, k] >= 0] = k + 1
+    return last
+
+
+def _pad(x, width, fill=-1):
+    if x.shape[1] >= width:
+        return x
+    out = np.full((len(x), width), fill, dtype=x.dtype)
+    out[:, :x.shape[1]] = x
+    return out
+
+
+def benchmark(rows=1000000, notes_per_phrase=3, seed=0):
+    """Times `align_batch()` on `rows` synthetic attempts with wrong and extra
+    notes.  Returns seconds in total and per attempt."""
+    import time
+    from attempt_log import MAX_NOTES
+    rng = np.random.RandomState(seed)
+    target = np.full((rows, MAX_NOTES), -1, dtype=np.int16)
+    target[:, :notes_per_phrase] = rng.randint(28, 84,
+                                               (rows, notes_per_phrase))
+    answer = target.copy()
+    wrong = rng.random_sample((rows, notes_per_phrase)) > 0.8
+    answer[:, :notes_per_phrase][wrong] += rng.randint(1, 12, wrong.sum())
+    extra = rng.random_sample(rows) > 0.9
+    answer[extra, notes_per_phrase] = rng.randint(28, 84, extra.sum())
+    start = time.time()
+    align_batch(target, answer)
+    seconds = time.time() - start
+    return {'rows': rows, 'seconds': seconds, 'per_attempt': seconds / rows}
+
+
+if __name__ == '__main__':
+    for k, v in sorted(benchmark().items()):
+        print("{:>11}: {}".format(k, v))
@@ -0,0 +1,212 @@
+"""Low-overhead timing instrumentation for the question loop.
+
+Functions at each stage of a question -- generation, voicing, playback,
+listening and grading -- are wrapped with `timed(stage)`.  While
+instrumentation is enabled each call's duration is appended to an in-memory
+ring (a bounded deque) and added to per-function totals; while it is
+disabled (the default) the wrapper only checks a flag.
+
+Timings can be exported as JSON lines (`write_json_lines()`) or in the
+Prometheus text exposition format (`prometheus_text()`).  Every N questions
+can be profiled with cProfile (see `enable()`).
+
+Run `python instrument.py` to measure the overhead."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import os
+import json
+import time
+import functools
+import threading
+from collections import deque, defaultdict
+
+try:
+    perf_counter = time.perf_counter
+except AttributeError:  # python 2
+    perf_counter = time.time
+
+
+METRIC_PREFIX = 'earthosenotes'
+
+
+class Instruments(object):
+    """Timings and counters.
+
+    Attributes:
+        enabled (bool): whether anything is recorded.
+        events (deque): the most recent `(time, stage, function, seconds)`
+            timings, `time` being `time.time()` at the start of the call.
+        calls, seconds (dict): call counts and total seconds, keyed by
+            `(stage, function)`.
+        counters (dict): event counts, e.g. 'questions'.
+        profile_every (int): if nonzero, every `profile_every`-th question
+            (from one answer to the next) is profiled.
+        profiles (deque): `pstats.Stats` of the most recent profiles.
+    """
+    def __init__(self, capacity=10000):
+        self.enabled = False
+        self.events = deque(maxlen=capacity)
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.profile_every = 0
+        self.profile_dir = None
+        self.profiles = deque(maxlen=10)
+        self._profiler = None
+        self._lock = threading.Lock()
+
+    def record(self, stage, function, start, seconds):
+        self.events.append((start, stage, function, seconds))
+        key = (stage, function)
+        with self._lock:
+            self.calls[key] += 1
+            self.seconds[key] += seconds
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += n
+
+    def question_done(self):
+        """Call once each question has been answered."""
+        if not self.enabled:
+            return
+        self.count('questions')
+        if self._profiler is not None:
+            self._save_profile()
+        if (self.profile_every and
+                self.counters['questions'] % self.profile_every == 0):
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def _save_profile(self):
+        import pstats
+        self._profiler.disable()
+        if self.profile_dir is not None:
+            self._profiler.dump_stats(os.path.join(
+                self.profile_dir,
+                'question{}.prof'.format(self.counters['questions'])))
+        self.profiles.append(pstats.Stats(self._profiler))
+        self._profiler = None
+
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self.calls.clear()
+            self.seconds.clear()
+            self.counters.clear()
+
+    def json_lines(self):
+        """Yields each event in the ring as a line of JSON."""
+        for t, stage, function, seconds in list(self.events):
+            yield json.dumps({'time': t, 'stage': stage,
+                              'function': function, 'seconds': seconds})
+
+    def write_json_lines(self, path):
+        with open(path, 'a') as f:
+            for line in self.json_lines():
+                f.write(line + '\n')
+
+    def prometheus_text(self):
+        """Returns the totals and counters in the Prometheus text format."""
+        with self._lock:
+            calls = sorted(self.calls.items())
+            seconds = dict(self.seconds)
+            counters = sorted(self.counters.items())
+
+        def labels(key):
+            return '{{stage="{}",function="{}"}}'.format(*key)
+        lines = []
+        name = METRIC_PREFIX + '_stage_seconds_total'
+        lines += ['# HELP {} Time spent in each instrumented function.'
+                  ''.format(name),
+                  '# TYPE {} counter'.format(name)]
+        lines += ['{}{} {!r}'.format(name, labels(k), seconds[k])
+                  for k, _ in calls]
+        name = METRIC_PREFIX + '_stage_calls_total'
+        lines += ['# HELP {} Calls of each instrumented function.'
+                  ''.format(name),
+                  '# TYPE {} counter'.format(name)]
+        lines += ['{}{} {}'.format(name, labels(k), n) for k, n in calls]
+        for counter, n in counters:
+            name = '{}_{}_total'.format(METRIC_PREFIX, counter)
+            lines += ['# TYPE {} counter'.format(name),
+                      '{} {}'.format(name, n)]
+        return '\n'.join(lines) + '\n'
+
+
+instruments = Instruments()
+
+
+def enable(profile_every=0, profile_dir=None):
+    """Starts recording (and, if `profile_every` is nonzero, profiling every
+    `profile_every`-th question, saving .prof files in `profile_dir` if
+    given)."""
+    instruments.profile_every = profile_every
+    instruments.profile_dir = profile_dir
+    instruments.enabled = True
+    return instruments
+
+
+def disable():
+    instruments.enabled = False
+    if instruments._profiler is not None:
+        instruments._save_profile()
+
+
+def timed(stage):
+    """Decorator recording each call's duration under `stage` (e.g.
+    'generate') while instrumentation is enabled."""
+    def decorator(func):
+        function = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not instruments.enabled:
+                return func(*args, **kwargs)
+            start_time = time.time()
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                instruments.record(stage, function, start_time,
+                                   perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def measure_overhead(n=200000):
+    """Returns the overhead (in nanoseconds per call) that `timed` adds to a
+    trivial function, while disabled and while enabled."""
+    global instruments
+
+    def f(x):
+        return x
+
+    def per_call(fcn):
+        start = perf_counter()
+        for k in range(n):
+            fcn(k)
+        return 1e9 * (perf_counter() - start) / n
+
+    g = timed('overhead')(f)
+    saved, instruments = instruments, Instruments()  # don't pollute timings
+    try:
+        bare = per_call(f)
+        disabled = per_call(g)
+        instruments.enabled = True
+        enabled = per_call(g)
+    finally:
+        instruments = saved
+    return {'bare_ns': bare,
+            'disabled_overhead_ns': disabled - bare,
+            'enabled_overhead_ns': enabled - bare}
+
+
+if __name__ == '__main__':
+    for k, v in sorted(measure_overhead().items()):
+        print("{:>21}: {:.0f}".format(k, v))
@@ -0,0 +1,136 @@
+"""Deadlines, cancellation and results shared by the listeners.
+
+Every listener's `listen()` takes
+
+    timeout (float): seconds to listen for at most,
+    idle_timeout (float): seconds to wait for each next note at most, and
+    cancel (CancelToken): to stop listening from elsewhere -- any object with
+        an `is_set()` method will do, e.g. `getch.KeyboardReader.interrupt`,
+
+and returns a `ListenResult`: the notes heard (a list, as before) along with
+why listening ended, so that a silent student or an unplugged device gives a
+partial answer rather than a hung session."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import time
+import threading
+
+try:
+    monotonic = time.monotonic
+except AttributeError:  # python 2
+    monotonic = time.time
+
+
+POLL = 0.05  # seconds between checks for cancellation while nothing's heard
+
+# `ListenResult.status` values
+COMPLETE = 'complete'  # heard all the notes asked for
+STOPPED = 'stopped'  # the `on_note` callback asked to stop
+TIMEOUT = 'timeout'  # the `timeout` (or a MIDI `duration`) ran out
+IDLE = 'idle'  # no note for `idle_timeout` seconds
+CANCELLED = 'cancelled'
+ERROR = 'error'  # the device failed, see `ListenResult.error`
+
+
+class CancelToken(object):
+    """Cancels a `listen()` call (e.g. from another thread) when `cancel()`
+    is called."""
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def reset(self):
+        self._event.clear()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class ListenResult(list):
+    """The notes heard by a listener, and why it stopped listening.
+
+    Attributes:
+        status (str): one of `COMPLETE`, `STOPPED`, `TIMEOUT`, `IDLE`,
+            `CANCELLED` or `ERROR`.
+        error (Exception): what went wrong, if the status is `ERROR`.
+    """
+    def __init__(self, notes=(), status=COMPLETE, error=None):
+        list.__init__(self, notes)
+        self.status = status
+        self.error = error
+
+    @property
+    def timed_out(self):
+        return self.status in (TIMEOUT, IDLE)
+
+    @property
+    def cancelled(self):
+        return self.status == CANCELLED
+
+    @property
+    def failed(self):
+        return self.status == ERROR
+
+    @property
+    def partial(self):
+        """True if listening ended before the answer was complete."""
+        return self.status not in (COMPLETE, STOPPED)
+
+    def __repr__(self):
+        return 'ListenResult({}, status={!r})'.format(list.__repr__(self),
+                                                      self.status)
+
+
+class Deadline(object):
+    """Tracks a `listen()` call's `timeout`, `idle_timeout` and `cancel`
+    token (all optional)."""
+    def __init__(self, timeout=None, idle_timeout=None, cancel=None,
+                 clock=monotonic):
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.cancel = cancel
+        self.clock = clock
+        self.start = self.last_heard = clock()
+
+    def heard(self):
+        """Call when a note is heard (restarting the idle timeout)."""
+        self.last_heard = self.clock()
+
+    def expired(self):
+        """Returns `CANCELLED`, `TIMEOUT` or `IDLE` if listening should
+        stop, otherwise None."""
+        if self.cancel is not None and self.cancel.is_set():
+            return CANCELLED
+        now = self.clock()
+        if self.timeout is not None and now - self.start >= self.timeout:
+            return TIMEOUT
+        if (self.idle_timeout is not None and
+                now - self.last_heard >= self.idle_timeout):
+            return IDLE
+        return None
+
+    def wait_time(self):
+        """Returns how long to wait for the next note before checking again:
+        at most `POLL` seconds."""
+        return max(0.001, min(POLL, self.remaining(POLL)))
+
+    def remaining(self, default=None):
+        """Returns the seconds until the timeout or idle timeout, or
+        `default` if neither is set."""
+        now = self.clock()
+        remaining = [t for t in (
+            None if self.timeout is None else self.start + self.timeout - now,
+            None if self.idle_timeout is None
+            else self.last_heard + self.idle_timeout - now) if t is not None]
+        if not remaining:
+            return default
+        return max(0., min(remaining))
@@ -0,0 +1,225 @@
+"""Markov-chain chord progression generator.
+
+Progressions are drawn from a first-order transition matrix over the seven
+diatonic numerals.  Cumulative-distribution tables are computed once, so
+drawing a chord is a single comparison against a precomputed row and many
+progressions can be generated at once without any rejection loops.
+
+The batch tables are fixed, so they serve sessions without adaptive
+practice (and simulations).  Adaptive play draws one progression at a time
+from a `sampler.AdaptiveSampler` whose weights change after every answer;
+there the Fenwick-tree draw per chord (see `adaptive_progression()`) is
+cheaper than rebuilding a table for the key on every question."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import random
+
+# Internal Dependencies
+from sampler import AdaptiveSampler, KEY_INDICES
+from instrument import timed
+
+# External Dependencies
+import numpy as np
+
+
+# Rows/columns are ordered I, II, III, IV, V, VI, VII.  The weights follow the
+# usual tonic -> predominant -> dominant -> tonic flow.  The diagonal is zero
+# so that a chord is never followed by itself.
+FUNCTIONAL_HARMONY = np.array([
+    # I  II III  IV   V  VI VII
+    [0,  2,  1,  4,  4,  3,  1],  # I
+    [1,  0,  0,  1,  6,  1,  3],  # II
+    [1,  1,  0,  3,  1,  4,  0],  # III
+    [3,  2,  0,  0,  5,  1,  2],  # IV
+    [8,  0,  1,  1,  0,  3,  0],  # V
+    [1,  4,  1,  4,  2,  0,  0],  # VI
+    [6,  0,  2,  0,  1,  1,  0],  # VII
+], dtype=float)
+
+
+def _cdf_table(weights):
+    """Normalizes the rows of `weights` and returns their cumulative sums."""
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    if np.any(weights < 0):
+        raise ValueError("Transition weights must be non-negative.")
+    totals = weights.sum(axis=1, keepdims=True)
+    if np.any(totals == 0):
+        raise ValueError("Every numeral needs at least one possible "
+                         "successor.")
+    cdf = np.cumsum(weights / totals, axis=1)
+    cdf[:, -1] = 1.0  # guard against round-off
+    return cdf
+
+
+class MarkovProgression(object):
+    """Generates chord progressions from a numeral transition matrix.
+
+    Args:
+        numerals (list): the numerals, e.g. `st.NUMERALS`.  Rows and columns
+            of `transitions` are indexed in the same order.
+        transitions (array-like): square matrix of (unnormalized) transition
+            weights, `transitions[i, j]` being the weight of moving from
+            `numerals[i]` to `numerals[j]`.  Defaults to
+            `FUNCTIONAL_HARMONY`.
+        initial (array-like, optional): weights for the first chord of a
+            progression.  Defaults to uniform.
+        seed (int, optional): seed for the generator's random state.
+        batch_size (int): how many progressions to generate at a time when
+            single progressions are requested with `random_progression()`.
+    """
+    def __init__(self, numerals, transitions=FUNCTIONAL_HARMONY, initial=None,
+                 seed=None, batch_size=256):
+        self.numerals = list(numerals)
+        n = len(self.numerals)
+        transitions = np.asarray(transitions, dtype=float)
+        if transitions.shape != (n, n):
+            raise ValueError("Expected a {0}x{0} transition matrix, got shape "
+                             "{1}.".format(n, transitions.shape))
+        if initial is None:
+            initial = np.ones(n)
+
+        initial = np.asarray(initial, dtype=float)
+        self.transitions = transitions / transitions.sum(axis=1, keepdims=True)
+        self.initial = initial / initial.sum()
+        self._cdf = _cdf_table(transitions)
+        self._initial_cdf = _cdf_table(initial)[0]
+        self.rng = np.random.RandomState(seed)
+        self.batch_size = batch_size
+        self._pool = {}
+
+    @classmethod
+    def from_corpus(cls, corpus, numerals, smoothing=0.1, **kwargs):
+        """Learns the transition matrix from example progressions.
+
+        Args:
+            corpus (list): a list of progressions, each a list of numerals.
+                Repeated consecutive numerals (i.e. strums) are collapsed.
+            numerals (list): the numerals to use, e.g. `st.NUMERALS`.
+            smoothing (float): pseudo-count added to every (non-repeating)
+                transition so that unseen moves remain possible.
+        """
+        index = dict((x, k) for k, x in enumerate(numerals))
+        n = len(numerals)
+        counts = np.full((n, n), float(smoothing))
+        initial = np.full(n, float(smoothing))
+        for prog in corpus:
+            idx = np.array([index[x] for x in prog], dtype=np.intp)
+            if not len(idx):
+                continue
+            idx = idx[np.r_[True, idx[1:] != idx[:-1]]]  # collapse strums
+            initial[idx[0]] += 1
+            np.add.at(counts, (idx[:-1], idx[1:]), 1)
+        np.fill_diagonal(counts, 0)
+
+        # numerals never seen leading anywhere fall back to uniform
+        empty = counts.sum(axis=1) == 0
+        counts[empty] = 1
+        counts[empty, np.flatnonzero(empty)] = 0
+        if not initial.sum():
+            initial[:] = 1
+        return cls(numerals, counts, initial=initial, **kwargs)
+
+    def generate(self, number, length):
+        """Returns a `(number, length)` array of numeral indices, each row
+        being an independent progression of `length` chords."""
+        u = self.rng.random_sample((number, length))
+        out = np.empty((number, length), dtype=np.intp)
+        if not length:
+            return out
+        out[:, 0] = np.searchsorted(self._initial_cdf, u[:, 0], side='right')
+        for k in range(1, length):
+            out[:, k] = (self._cdf[out[:, k - 1]] <= u[:, k, None]).sum(axis=1)
+        np.minimum(out, len(self.numerals) - 1, out=out)
+        return out
+
+    def generate_strums(self, number, number_strums, strums_per_chord=(1,)):
+        """Generates `number` progressions of exactly `number_strums` strums.
+
+        Returns a tuple `(chords, strums)` of `(number, number_strums)` arrays.
+        `chords` holds numeral indices and `strums` the number of strums each
+        chord gets, the last chord being clipped to fit.  Unused trailing
+        entries have zero strums."""
+        chords = self.generate(number, number_strums)
+        choices = np.asarray(strums_per_chord, dtype=np.intp)
+        strums = choices[self.rng.randint(len(choices),
+                                          size=(number, number_strums))]
+        start = np.cumsum(strums, axis=1) - strums
+        strums = np.clip(number_strums - start, 0, strums)
+        return chords, strums
+
+    def progressions(self, number, number_strums, strums_per_chord=(1,)):
+        """Returns a list of `number` `(prog, prog_strums)` tuples, in the
+        format returned by `musictools.random_progression()`."""
+        chords, strums = self.generate_strums(number, number_strums,
+                                              strums_per_chord)
+        numerals = self.numerals
+        out = []
+        for row_chords, row_strums in zip(chords.tolist(), strums.tolist()):
+            prog = []
+            prog_strums = []
+            for c, s in zip(row_chords, row_strums):
+                if not s:
+                    break
+                prog.append(numerals[c])
+                prog_strums += [numerals[c]] * s
+            out.append((prog, prog_strums))
+        return out
+
+    def random_progression(self, number_strums, strums_per_chord=(1,)):
+        """Returns a single `(prog, prog_strums)` tuple.  Progressions are
+        generated `batch_size` at a time and handed out one by one."""
+        pool_key = (number_strums, tuple(strums_per_chord))
+        pool = self._pool.get(pool_key)
+        if not pool:
+            pool = self.progressions(self.batch_size, number_strums,
+                                     strums_per_chord)
+            self._pool[pool_key] = pool
+        return pool.pop()
+
+
+_generators = {}
+
+
+@timed('generate')
+def markov_progression(number_strums, numerals, strums_per_chord=[1]):
+    """Drop-in replacement for `musictools.random_progression()` using the
+    default functional-harmony transitions."""
+    numerals = tuple(numerals)
+    if numerals not in _generators:
+        _generators[numerals] = MarkovProgression(numerals)
+    return _generators[numerals].random_progression(number_strums,
+                                                    strums_per_chord)
+
+
+def markov_sampler(numerals):
+    """Returns an adaptive sampler for progressions, with items
+    `(key index, previous numeral, numeral)` weighted by the default
+    transition probabilities (the previous numeral is None for the first
+    chord)."""
+    generator = MarkovProgression(numerals)
+    base = np.vstack([generator.transitions, generator.initial])
+    return AdaptiveSampler([KEY_INDICES, list(numerals) + [None], numerals],
+                           base=np.tile(base, (len(KEY_INDICES), 1)).ravel())
+
+
+@timed('generate')
+def adaptive_progression(sampler, key, number_strums, strums_per_chord=[1]):
+    """Like `markov_progression()`, but draws each chord from `sampler` (see
+    `markov_sampler()`).  Returns `(prog, prog_strums, items)`.
+
+    Each chord is an O(log n) draw from the sampler's current weights, so
+    the batch CDF tables of `MarkovProgression` aren't used here."""
+    prog, prog_strums, items = [], [], []
+    numeral = None
+    while len(prog_strums) < number_strums:
+        item = sampler.sample((key, numeral))
+        numeral = item[2]
+        strums = min(random.choice(strums_per_chord),
+                     number_strums - len(prog_strums))
+        prog_strums += [numeral] * strums
+        prog.append(numeral)
+        items.append(item)
+    return prog, prog_strums, items
@@ -10,10 +10,15 @@
 ######################################################################
 from __future__ import division, print_function
 import numpy as np
-import pyaudio
-import matplotlib.pyplot as plt
 from mingus.containers import Note
+try:
+    import pyaudio
+except ImportError:  # only needed to open the microphone
+    pyaudio = None
 from time import time
+from instrument import timed
+from resample import PolyphaseResampler
+from listening import ListenResult, Deadline, STOPPED, ERROR
 
 ######################################################################
 # Feel free to play with these numbers. Might want to change NOTE_MIN
@@ -25,6 +30,13 @@ NOTE_MAX = 96  # C7
 FSAMP = 22050  # Sampling frequency in Hz
 FRAME_SIZE = 2048  # How many samples per frame?
 FRAMES_PER_FFT = 16  # FFT takes average across how many frames?
+CALIBRATION_HOPS = 5  # hops measured to find the noise floor (about 0.5s)
+GATE_OPEN = 2.5  # analyse once a hop is this many times the noise floor (RMS)
+GATE_CLOSE = 1.6  # ... until one is below this many times it
+FLOOR_ADAPT = 0.05  # how fast the noise floor follows quiet hops
+MIN_FLOOR = 1.  # in int16 units, for digital silence
+MAX_DECIMATION = 16  # analyse low note ranges at as little as FSAMP / this
+NYQUIST_MARGIN = 1.5  # ... keeping the highest note this far below Nyquist
 
 ######################################################################
 # Derived quantities from constants above. Note that as
@@ -69,124 +81,406 @@ def note_name(n):
 def note_to_fftbin(n): return number_to_freq(n) / FREQ_STEP
 
 
+def _smooth(n):
+    """Returns the nearest number to `n` with no prime factors above 5 (so
+    FFTs of it, or a power of two times it, are fast)."""
+    best = 1
+    for twos in range(int(np.log2(2 * n)) + 1):
+        for threes in range(int(np.log(2 * n) / np.log(3)) + 1):
+            for fives in range(int(np.log(2 * n) / np.log(5)) + 1):
+                m = 2 ** twos * 3 ** threes * 5 ** fives
+                if abs(m - n) < abs(best - n):
+                    best = m
+    return best
+
+
+def analysis_rate(note_max, samplerate=FSAMP):
+    """Returns the lowest rate, `samplerate` divided by up to
+    `MAX_DECIMATION`, that comfortably holds notes up to `note_max`."""
+    highest = NYQUIST_MARGIN * number_to_freq(note_max)
+    for k in range(MAX_DECIMATION, 1, -1):
+        if samplerate % k == 0 and samplerate / k / 2 > highest:
+            return samplerate // k
+    return samplerate
+
+
+def device_rate(audio, input_device_index=None):
+    """Returns the native sample rate of a pyaudio input device."""
+    if input_device_index is None:
+        info = audio.get_default_input_device_info()
+    else:
+        info = audio.get_device_info_by_index(input_device_index)
+    return int(info['defaultSampleRate'])
+
+
+def synthetic_audio(midi_notes, hops_per_note=24, seed=0):
+    """Returns int16 audio of each MIDI note (with a few harmonics and some
+    noise) played for `hops_per_note` hops of `FRAME_SIZE` samples."""
+    rng = np.random.RandomState(seed)
+    t = np.arange(hops_per_note * FRAME_SIZE) / FSAMP
+    out = []
+    for n in midi_notes:
+        f = number_to_freq(n)
+        x = sum(np.sin(2 * np.pi * k * f * t) / k for k in (1, 2, 3))
+        x += 0.05 * rng.randn(len(t))
+        out.append((3000 * x).astype(np.int16))
+    return np.concatenate(out)
+
+
+class NoiseGate(object):
+    """Decides, from each new hop alone, whether there's anything to
+    analyse.
+
+    The noise floor is the median RMS of quiet hops given to `calibrate()`
+    (see `calibrate_gate()`) or, failing that, of the first
+    `calibration_hops` hops.  The gate then opens when a hop's RMS is
+    `open_ratio` times the floor and closes when it drops below
+    `close_ratio` times it.  While it's closed, the floor slowly follows
+    the room's noise up, and drops straight to any quieter hop -- so a
+    floor measured while someone was already singing is corrected by the
+    first pause.
+    """
+    def __init__(self, calibration_hops=CALIBRATION_HOPS, open_ratio=GATE_OPEN,
+                 close_ratio=GATE_CLOSE, adapt=FLOOR_ADAPT):
+        self.calibration_hops = calibration_hops
+        self.open_ratio = open_ratio
+        self.close_ratio = close_ratio
+        self.adapt = adapt
+        self.floor = None
+        self.is_open = False
+        self._calibration = []
+
+    def calibrate(self, hops):
+        """Sets the noise floor from hops of quiet input.  Returns it."""
+        self.floor = max(MIN_FLOOR, float(np.median([_rms(x) for x in hops])))
+        self.is_open = False
+        self._calibration = []
+        return self.floor
+
+    def recalibrate(self):
+        """Forgets the noise floor, to measure it on the next hops."""
+        self.floor = None
+        self.is_open = False
+        self._calibration = []
+
+    def __call__(self, samples):
+        """Takes a hop of samples.  Returns whether the gate is open."""
+        rms = _rms(samples)
+        if self.floor is None:
+            self._calibration.append(rms)
+            if len(self._calibration) >= self.calibration_hops:
+                self.floor = max(MIN_FLOOR, float(np.median(self._calibration)))
+                self._calibration = []
+            return False
+        if self.is_open:
+            self.is_open = rms >= self.close_ratio * self.floor
+        else:
+            self.is_open = rms > self.open_ratio * self.floor
+        if not self.is_open:
+            if rms < self.floor:
+                self.floor = max(MIN_FLOOR, rms)
+            else:
+                self.floor += self.adapt * (rms - self.floor)
+        return self.is_open
+
+
+def _rms(samples):
+    x = np.asarray(samples, dtype=np.float32)
+    return np.sqrt(np.dot(x, x) / len(x))
+
+
+def calibrate_gate(gate, input_device_index=None, prompt=True):
+    """Measures the room's noise for `gate` (e.g. a `NoiseGate`) from the
+    microphone, asking for quiet first if `prompt`.  Returns the noise
+    floor, or None if the microphone couldn't be read (the gate then
+    calibrates on the first hops it's given)."""
+    if prompt:
+        print("Measuring the room's noise -- please be quiet for a moment...")
+    audio = pyaudio.PyAudio()
+    try:
+        rate = device_rate(audio, input_device_index)
+        resampler = PolyphaseResampler(rate, FSAMP)
+        chunk = int(round(FRAME_SIZE * rate / FSAMP))
+        stream = audio.open(format=pyaudio.paInt16, channels=1, rate=rate,
+                            input=True, frames_per_buffer=chunk,
+                            input_device_index=input_device_index)
+    except (IOError, OSError) as e:  # no (such) device
+        audio.terminate()
+        print("Couldn't open the microphone: {}".format(e))
+        return None
+
+    try:
+        stream.start_stream()
+        hops = []
+        while len(hops) < CALIBRATION_HOPS:
+            samples = np.frombuffer(
+                stream.read(chunk, exception_on_overflow=False), np.int16)
+            hops.extend(resampler.hops(samples, FRAME_SIZE))
+        return gate.calibrate(hops)
+    except (IOError, OSError) as e:  # e.g. the device was unplugged
+        print("Couldn't read the microphone: {}".format(e))
+        return None
+    finally:
+        stream.close()
+        audio.terminate()
+
+
+class PitchDetector(object):
+    """The per-hop analysis done by `MicListener.listen()`.
+
+    Keeps a buffer of the last `SAMPLES_PER_FFT` samples.  Each call to
+    `process()` shifts in a new hop of `FRAME_SIZE` samples and, once the
+    buffer is full and loud enough, returns the frequency and (fractional)
+    MIDI number of the strongest note between `note_min` and `note_max`.
+
+    At a `samplerate` below `FSAMP` (see `analysis_rate()`), hops and the
+    buffer are shorter in proportion, so they last as long and the
+    frequency resolution is the same, but the FFT is cheaper.
+
+    If a `gate` (e.g. a `NoiseGate`) is given, it's called with each hop
+    and, while it returns False, the hop is only buffered (no windowing or
+    FFT).  Otherwise the whole windowed buffer's RMS must be above
+    `rms_threshold`.
+    """
+    def __init__(self, note_min=NOTE_MIN, note_max=NOTE_MAX, rms_threshold=10,
+                 samplerate=FSAMP, gate=None):
+        self.note_min = note_min
+        self.note_max = note_max
+        self.rms_threshold = rms_threshold
+        self.gate = gate
+        self.samplerate = samplerate
+        self.frame_size = _smooth(FRAME_SIZE * samplerate / FSAMP)
+        self.samples_per_fft = self.frame_size * FRAMES_PER_FFT
+        self.freq_step = samplerate / self.samples_per_fft
+
+        # Create Hanning window function
+        ss = np.linspace(0, 2 * np.pi, self.samples_per_fft, False)
+        self.window = 0.5 * (1 - np.cos(ss))
+
+        notes_in_range = np.arange(note_min, note_max + 1)
+        self.fftfreqs = np.fft.rfftfreq(len(self.window), 1./samplerate)
+        self.note_freqs = number_to_freq(notes_in_range)
+
+        # Allocate space to run an FFT.
+        self.buf = np.zeros(self.samples_per_fft, dtype=np.float32)
+        self.num_frames = 0
+        self.spectrum = None  # of the last detection
+
+    def reset(self):
+        self.buf[:] = 0
+        self.num_frames = 0
+
+    def process(self, samples):
+        """Takes the next `frame_size` samples (int16).  Returns `(frequency,
+        MIDI number)` of the loudest note, or None if the buffer isn't full
+        yet or is too quiet."""
+        # Shift the buffer down, place new samples at the end
+        buf = self.buf
+        buf[:-self.frame_size] = buf[self.frame_size:]
+        buf[-self.frame_size:] = samples
+        self.num_frames += 1
+
+        # if loud enough and buffer is full, find note
+        if self.gate is not None:
+            if not self.gate(samples) or self.num_frames < FRAMES_PER_FFT:
+                return None
+            frame = buf * self.window
+        else:
+            frame = buf * self.window
+            rms = np.sqrt(np.mean(frame * frame))  # estimates amplitude
+            if rms <= self.rms_threshold or self.num_frames < FRAMES_PER_FFT:
+                return None
+
+        # Run the FFT on the windowed buffer
+        fft = np.abs(np.fft.rfft(frame))
+        note_fft = np.interp(self.note_freqs, self.fftfreqs, fft)
+        self.spectrum = fft  # e.g. for tuner.py
+
+        # Get frequency of maximum response in range
+        freq = self.note_freqs[note_fft.argmax()]
+        return freq, freq_to_number(freq)
+
+
+class MultiPitchDetector(object):
+    """`PitchDetector` for every channel of an interleaved multi-channel
+    stream at once.
+
+    Each hop is de-interleaved by reshaping (a view) and copied straight into
+    a circular buffer per channel, so nothing is shifted: the window is
+    rotated instead (a rotation only changes the FFT's phase).  The FFTs of
+    all loud enough channels are then done in one batch.
+    """
+    def __init__(self, channels, note_min=NOTE_MIN, note_max=NOTE_MAX,
+                 rms_threshold=10):
+        self.channels = channels
+        self.rms_threshold = rms_threshold
+
+        # the Hanning window, rotated to match each position of the buffer
+        ss = np.linspace(0, 2 * np.pi, SAMPLES_PER_FFT, False)
+        window = (0.5 * (1 - np.cos(ss))).astype(np.float32)
+        self.windows = np.array([np.roll(window, (k + 1) * FRAME_SIZE)
+                                 for k in range(FRAMES_PER_FFT)])
+
+        # linear interpolation of the spectrum at each note's frequency
+        self.notes = np.arange(note_min, note_max + 1)
+        self.note_freqs = number_to_freq(self.notes)
+        fftfreqs = np.fft.rfftfreq(SAMPLES_PER_FFT, 1./FSAMP)
+        self._bins = np.searchsorted(fftfreqs, self.note_freqs) - 1
+        self._weights = (self.note_freqs - fftfreqs[self._bins]) / FREQ_STEP
+
+        self.in_range = np.ones((channels, len(self.notes)), dtype=bool)
+        self.buf = np.zeros((channels, SAMPLES_PER_FFT), dtype=np.float32)
+        self.num_frames = np.zeros(channels, dtype=int)
+        self.hops = 0
+
+    def set_range(self, channel, note_min, note_max):
+        """Only notes from `note_min` to `note_max` are detected on
+        `channel`."""
+        self.in_range[channel] = ((self.notes >= note_min) &
+                                  (self.notes <= note_max))
+
+    def reset(self, channel=None):
+        channels = slice(None) if channel is None else channel
+        self.buf[channels] = 0
+        self.num_frames[channels] = 0
+
+    def process(self, samples):
+        """Takes the next `FRAME_SIZE` frames of interleaved int16 samples.
+        Returns a list with, for each channel, what `PitchDetector.process()`
+        would."""
+        slot = self.hops % FRAMES_PER_FFT
+        self.hops += 1
+        frames = np.asarray(samples).reshape(FRAME_SIZE, self.channels)
+        self.buf[:, slot * FRAME_SIZE:(slot + 1) * FRAME_SIZE] = frames.T
+        self.num_frames += 1
+        frame = self.buf * self.windows[slot]
+
+        # find notes on the channels that are loud enough and full
+        rms = np.sqrt(np.mean(frame * frame, axis=1))
+        active = np.flatnonzero((rms > self.rms_threshold) &
+                                (self.num_frames >= FRAMES_PER_FFT))
+        detected = [None] * self.channels
+        if not len(active):
+            return detected
+        fft = np.abs(np.fft.rfft(frame[active], axis=1))
+        note_fft = (fft[:, self._bins] * (1 - self._weights) +
+                    fft[:, self._bins + 1] * self._weights)
+        note_fft[~self.in_range[active]] = -1
+        for channel, k in zip(active, note_fft.argmax(axis=1)):
+            freq = self.note_freqs[k]
+            detected[channel] = freq, freq_to_number(freq)
+        return detected
+
+
 class MicListener:
-    """See `MicListener().listen()`."""
+    """See `MicListener().listen()`.
+
+    Attributes:
+        gate (NoiseGate): calibrated by `calibrate()` (or else on the first
+            call to `listen()`) and kept (adapting to the room) for later
+            calls.
+    """
     def __init__(self):
-        pass
+        self.gate = NoiseGate()
+
+    def calibrate(self, input_device_index=None, prompt=True):
+        """Asks for quiet and measures the room's noise (see
+        `calibrate_gate()`), e.g. before the first question."""
+        return calibrate_gate(self.gate, input_device_index, prompt)
 
+    @timed('listen')
     def listen(self, notes, instrument_range=(NOTE_MIN, NOTE_MAX),
-               input_device_index=None, output_on=False, mingus_range=False):
-        """Listens for the input sequence of notes.  Returns a score in the 
-        form of a sequence of booleans."""
+               input_device_index=None, output_on=False, mingus_range=False,
+               on_note=None, timeout=None, idle_timeout=None, cancel=None):
+        """Listens for the input sequence of notes.  Returns the notes heard
+        (as `Note` objects) in a `ListenResult`.  If given, `on_note` is
+        called with each note as soon as it is heard, and listening stops
+        early if it returns True.  See `listening.py` for `timeout`,
+        `idle_timeout` and `cancel`; they're checked after every hop, and
+        the stream is closed as soon as listening stops."""
         if mingus_range:
             note_min = int(Note(instrument_range[0])) + 12
             note_max = int(Note(instrument_range[1])) + 12
         else:
             note_min, note_max = instrument_range
+        deadline = Deadline(timeout, idle_timeout, cancel)
+        response_notes = ListenResult()
 
-        # Get min/max index within FFT of notes we care about.
-        imin = max(0, int(np.floor(note_to_fftbin(note_min - 1))))
-        imax = min(SAMPLES_PER_FFT, int(np.ceil(note_to_fftbin(note_max + 1))))
-
-        # Create Hanning window function
-        ss = np.linspace(0, 2 * np.pi, SAMPLES_PER_FFT, False)
-        window = 0.5 * (1 - np.cos(ss))
-
-        notes_in_range = range(note_min, note_max + 1)
-        fftfreqs = np.fft.rfftfreq(len(window), 1./FSAMP)
-        note_freqs = map(number_to_freq, notes_in_range)
-        # note_bins = map(note_to_fftbin, notes_in_range)
-        note_names = map(note_name, notes_in_range)
-
-        # Allocate space to run an FFT.
-        buf = np.zeros(SAMPLES_PER_FFT, dtype=np.float32)
-        num_frames = 0
-
-        # Initialize audio
-        tmp = {'format': pyaudio.paInt16,
-               'channels': 1,
-               'rate': FSAMP,
-               'input': True,
-               'frames_per_buffer': FRAME_SIZE,
-               'input_device_index': input_device_index}
-
-        stream = pyaudio.PyAudio().open(**tmp)
-
+        # Capture at the device's own rate, resampling to the analysis rate
+        audio = pyaudio.PyAudio()
         try:
-            # for plotting
-            # plt.ion()
-            # fig = plt.figure()
-            # ax = fig.add_subplot(111)
-            # ax.set_xlabel(note_names)
+            rate = device_rate(audio, input_device_index)
+            detector = PitchDetector(note_min, note_max,
+                                     samplerate=analysis_rate(note_max),
+                                     gate=self.gate)
+            resampler = PolyphaseResampler(rate, detector.samplerate)
+            chunk = int(round(detector.frame_size * rate /
+                              detector.samplerate))
+
+            # Initialize audio
+            tmp = {'format': pyaudio.paInt16,
+                   'channels': 1,
+                   'rate': rate,
+                   'input': True,
+                   'frames_per_buffer': chunk,
+                   'input_device_index': input_device_index}
+
+            stream = audio.open(**tmp)
+        except (IOError, OSError) as e:  # no (such) device
+            audio.terminate()
+            response_notes.status, response_notes.error = ERROR, e
+            return response_notes
 
+        try:
             stream.start_stream()
 
             # Print initial text
             if output_on:
-                print('sampling at', FSAMP, 'Hz with max resolution of',
-                      FREQ_STEP, 'Hz', '\n')
-
-            class Timer:
-                def __init__(self):
-                    start = time()
+                print('sampling at', rate, 'Hz, analysing at',
+                      detector.samplerate, 'Hz with max resolution of',
+                      detector.freq_step, 'Hz', '\n')
 
             old_mes = ''
-            plot_time = time()
-            response_notes = []
-            while stream.is_active():
-
-                # Shift the buffer down, place new samples at the end
-                buf[:-FRAME_SIZE] = buf[FRAME_SIZE:]
-                buf[-FRAME_SIZE:] = np.fromstring(stream.read(FRAME_SIZE), np.int16)
-                frame = buf * window
-                num_frames += 1
-
-                # if loud enough and buffer is full, find note
-                rms = np.sqrt(np.mean(frame * frame))  # used to estimate amplitude
-                # print(rms)
-                if rms > 10 and num_frames >= FRAMES_PER_FFT:
-                    # Run the FFT on the windowed buffer
-                    fft = np.abs(np.fft.rfft(frame))
-                    note_fft = np.interp(note_freqs, fftfreqs, fft)
-
-                    # # Plot results
-                    # if time() > plot_time + 1:
-                    #     try:
-                    #         for bar, h in zip(bars, note_fft):
-                    #             bar.set_height(h)
-                    #     except:
-                    #         bars = ax.bar(left=notes_in_range,
-                    #                       height=note_fft,
-                    #                       align='center')
-                    #     # fig.canvas.draw()
-                    #     plot_time = time()
-
-                    # Get frequency of maximum response in range
-                    freq = note_freqs[note_fft.argmax()]
-                    # freq = (np.abs(fft[imin:imax]).argmax() + imin) * FREQ_STEP
-
-                    # Get note number and nearest note
-                    n = freq_to_number(freq)
+            while True:
+                status = deadline.expired()
+                if status is not None:
+                    response_notes.status = status
+                    return response_notes
+                if not stream.is_active():
+                    raise IOError("The input stream stopped.")
+                samples = np.frombuffer(
+                    stream.read(chunk, exception_on_overflow=False), np.int16)
+                for hop in resampler.hops(samples, detector.frame_size):
+                    detected = detector.process(hop)
+                    if detected is None:
+                        continue
+                    freq, n = detected
+
+                    # Get nearest note
                     n0 = int(round(n))
 
                     # Console output once we have a full buffer
                     mes = ('freq: {:4.2f} Hznote: {:>3s} {:+.2f}'
-                           ''.format(freq, note_name(n0), n - n0))
+                           ''.format(freq, note_name(n0).name, n - n0))
                     if mes != old_mes:
                         if output_on:
                             print(mes)
-                        # print('%s\r' % mes, end='')
                         old_mes = mes
+                        deadline.heard()
                         response_notes.append(note_name(n0))
-                    if notes is not None and len(response_notes) == len(notes):
+                        if (on_note is not None and
+                                on_note(response_notes[-1])):
+                            response_notes.status = STOPPED
+                            return response_notes
+                    if (notes is not None and
+                            len(response_notes) == len(notes)):
                         return response_notes
-                else:
-                    # print('%s\r' % rms, end='')
-                    bla = 1
-        except Exception as e:
-            print(e)
+        except (IOError, OSError) as e:  # e.g. the device was unplugged
+            response_notes.status, response_notes.error = ERROR, e
+            return response_notes
         finally:
             stream.close()
+            audio.terminate()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,453 @@
+"""Microphone capture and pitch detection in separate processes.
+
+`MicListener.listen()` reads and analyses audio on the game's own thread, so
+anything else the game does under the GIL (printing, grading, parsing)
+delays the analysis.  `ProcessMicListener` instead runs
+
+    a capture process, which writes each hop of `FRAME_SIZE` samples (and
+        the time it was captured) into an `AudioRing`, a ring buffer in
+        `multiprocessing.shared_memory`, and
+    an analysis process, which runs a `PitchDetector` on each hop in place
+        (no pickling or copying) and puts the detections on a queue as small
+        tuples,
+
+and `listen()` just turns detections into notes, as `MicListener` does.  If
+the analysis falls more than a ring's worth of hops behind, the oldest hops
+are skipped and counted as overflows.
+
+Usage:
+    $ python mic_process.py     # latency under synthetic CPU load
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import time
+import atexit
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+# Internal Dependencies
+from mic_listen import (MicListener, PitchDetector, NoiseGate, note_name,
+                        synthetic_audio, device_rate, NOTE_MIN, NOTE_MAX,
+                        FSAMP, FRAME_SIZE, FREQ_STEP, CALIBRATION_HOPS)
+from resample import PolyphaseResampler
+from listening import ListenResult, Deadline, STOPPED, ERROR
+from instrument import timed
+
+# External Dependencies
+import numpy as np
+from mingus.containers import Note
+try:
+    import pyaudio
+except ImportError:  # only needed to open the microphone
+    pyaudio = None
+
+monotonic = time.monotonic  # system-wide, so comparable between processes
+
+
+RING_SLOTS = 32  # hops the ring holds (about 3 seconds)
+
+# `AudioRing.header` fields
+(_WRITTEN, _READ, _OVERFLOWS, _GENERATION, _NOTE_MIN, _NOTE_MAX, _START,
+ _CALIBRATE, _FLOOR) = range(9)
+_HEADER_SIZE = 16
+
+
+class AudioRing(object):
+    """A single-writer, single-reader ring of audio hops in shared memory.
+
+    Args:
+        slots (int): number of hops held.
+        hop (int): samples per hop.
+
+    Attributes:
+        header (array): int64 counters -- hops written, hops read, hops
+            skipped because the reader fell behind, the listening
+            `generation`, note range, first hop and whether to recalibrate
+            the noise gate set by `begin()`, and the noise floor measured
+            (in thousandths) when it asked to.
+        times (array): the `monotonic()` time each hop was written.
+        hops (array): int16 samples, one row per slot.
+
+    The ring is passed to the child processes as a `Process` argument (and
+    reattached by name if they're spawned rather than forked).
+    """
+    def __init__(self, slots=RING_SLOTS, hop=FRAME_SIZE, name=None):
+        self.slots = slots
+        self.hop = hop
+        size = 8 * (_HEADER_SIZE + slots) + 2 * slots * hop
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.owner = name is None
+        buf = self.shm.buf
+        self.header = np.ndarray(_HEADER_SIZE, np.int64, buf)
+        self.times = np.ndarray(slots, np.float64, buf, 8 * _HEADER_SIZE)
+        self.hops = np.ndarray((slots, hop), np.int16, buf,
+                               8 * (_HEADER_SIZE + slots))
+        if self.owner:
+            self.header[:] = 0
+            self.header[_NOTE_MIN:_NOTE_MAX + 1] = NOTE_MIN, NOTE_MAX
+
+    def __reduce__(self):
+        return AudioRing, (self.slots, self.hop, self.shm.name)
+
+    def write(self, samples):
+        """Appends a hop (overwriting the oldest, if it wasn't read)."""
+        written = self.header[_WRITTEN]
+        slot = written % self.slots
+        self.hops[slot] = samples
+        self.times[slot] = monotonic()
+        self.header[_WRITTEN] = written + 1  # publish after the data
+
+    def read(self):
+        """Returns `(index, capture time, samples)` of the next unread hop,
+        or None.  `samples` is a view into the ring, valid until the writer
+        comes round again."""
+        header = self.header
+        written, read = header[_WRITTEN], header[_READ]
+        if read == written:
+            return None
+        if written - read >= self.slots:  # the writer may be on the oldest
+            skipped = written - read - self.slots + 1
+            header[_OVERFLOWS] += skipped
+            read += skipped
+        header[_READ] = read + 1
+        slot = read % self.slots
+        return read, self.times[slot], self.hops[slot]
+
+    def begin(self, note_min=NOTE_MIN, note_max=NOTE_MAX, calibrate=False):
+        """Starts a new listening `generation` (the reader resets its
+        analysis, so nothing heard before counts) with the next hop
+        written.  If `calibrate`, the reader measures the noise floor again
+        on its first hops (see `floor`).  Returns the generation."""
+        header = self.header
+        header[_NOTE_MIN:_NOTE_MAX + 1] = note_min, note_max
+        header[_START] = header[_WRITTEN]
+        header[_CALIBRATE] = calibrate
+        if calibrate:
+            header[_FLOOR] = 0
+        header[_GENERATION] += 1  # publish after the rest
+        return int(header[_GENERATION])
+
+    @property
+    def generation(self):
+        return int(self.header[_GENERATION])
+
+    @property
+    def start(self):
+        """The index of the first hop of the current generation."""
+        return int(self.header[_START])
+
+    @property
+    def floor(self):
+        """The noise floor measured after `begin(calibrate=True)`, or None
+        until it has been."""
+        floor = int(self.header[_FLOOR])
+        return floor / 1000 if floor else None
+
+    @property
+    def note_range(self):
+        return int(self.header[_NOTE_MIN]), int(self.header[_NOTE_MAX])
+
+    @property
+    def overflows(self):
+        return int(self.header[_OVERFLOWS])
+
+    def close(self):
+        del self.header, self.times, self.hops  # release the buffer
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def capture_microphone(ring, stop, input_device_index=None):
+    """Capture process: writes microphone hops into `ring` until `stop` is
+    set (capturing at the device's own rate, resampled to `FSAMP`)."""
+    audio = pyaudio.PyAudio()
+    rate = device_rate(audio, input_device_index)
+    resampler = PolyphaseResampler(rate, FSAMP)
+    chunk = int(round(FRAME_SIZE * rate / FSAMP))
+    stream = audio.open(
+        format=pyaudio.paInt16, channels=1, rate=rate, input=True,
+        frames_per_buffer=chunk, input_device_index=input_device_index)
+    try:
+        stream.start_stream()
+        while not stop.is_set():
+            samples = np.frombuffer(
+                stream.read(chunk, exception_on_overflow=False), np.int16)
+            for hop in resampler.hops(samples, FRAME_SIZE):
+                ring.write(hop)
+    finally:
+        stream.close()
+
+
+def capture_synthetic(ring, stop, midi_notes, hops_per_note=8, speed=1.):
+    """Capture process standing in for a microphone: writes synthetic audio
+    of `midi_notes`, over and over, at `speed` times real time (after
+    enough quiet noise to calibrate the `NoiseGate`)."""
+    hops = synthetic_audio(midi_notes, hops_per_note).reshape(-1, FRAME_SIZE)
+    period = FRAME_SIZE / FSAMP / speed
+    noise = np.random.RandomState(0).randn(CALIBRATION_HOPS, FRAME_SIZE)
+    for hop in (150 * noise).astype(np.int16):
+        ring.write(hop)
+    due = monotonic()
+    while not stop.is_set():
+        for hop in hops:
+            due += period
+            delay = due - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            ring.write(hop)
+            if stop.is_set():
+                break
+
+
+def analyze(ring, stop, events, poll=0.002):
+    """Analysis process: runs a `PitchDetector` on each hop in `ring`,
+    putting `(generation, hop index, capture time, detection time,
+    frequency, MIDI number)` on `events` for each detection.  Hops written
+    before the current generation began only go to the noise gate."""
+    detector = None
+    generation = None
+    calibrating = False
+    gate = NoiseGate()
+    while not stop.is_set():
+        hop = ring.read()
+        if hop is None:
+            time.sleep(poll)
+            continue
+        index, captured, samples = hop
+        current = ring.generation  # read first: `begin()` sets it last
+        if index < ring.start:  # from before this `listen()` call
+            gate(samples)
+            continue
+        if current != generation:  # a new `listen()` call
+            generation = current
+            note_min, note_max = ring.note_range
+            if (detector is None or detector.note_min != note_min or
+                    detector.note_max != note_max):
+                detector = PitchDetector(note_min, note_max, gate=gate)
+            else:
+                detector.reset()
+            calibrating = bool(ring.header[_CALIBRATE])
+            if calibrating:
+                gate.recalibrate()
+        detected = detector.process(samples)
+        if calibrating and gate.floor is not None:
+            ring.header[_FLOOR] = max(1, int(round(1000 * gate.floor)))
+            calibrating = False
+        if detected is not None:
+            events.put((generation, int(index), captured, monotonic(),
+                        float(detected[0]), float(detected[1])))
+
+
+class ProcessMicListener(MicListener):
+    """A `MicListener` whose capture and pitch detection run in their own
+    processes (see module docstring).  They're started on the first call to
+    `listen()` and run until `close()`.
+
+    Args:
+        capture (callable, optional): the capture process's target, called
+            as `capture(ring, stop, *capture_args)`.  Defaults to
+            `capture_microphone`.
+        capture_args (tuple): e.g. `(input_device_index,)`.
+        slots (int): hops in the ring.
+        threaded (bool): run the analysis on a thread of this process
+            instead (for comparison).
+
+    Attributes:
+        latencies (deque): recent capture-to-`listen()` latencies of
+            detections, in seconds.
+    """
+    def __init__(self, capture=None, capture_args=(), slots=RING_SLOTS,
+                 threaded=False):
+        MicListener.__init__(self)
+        self.capture = capture or capture_microphone
+        self.capture_args = capture_args
+        self.slots = slots
+        self.threaded = threaded
+        self.ring = None
+        self.latencies = deque(maxlen=1000)
+        self._workers = []
+
+    def start(self):
+        if self.ring is not None:
+            return self
+        ctx = multiprocessing.get_context()
+        self.ring = AudioRing(self.slots)
+        self._stop = ctx.Event()
+        if self.threaded:
+            self.events = queue.Queue()
+            analysis = threading.Thread(
+                target=analyze, args=(self.ring, self._stop, self.events))
+        else:
+            self.events = ctx.Queue()
+            analysis = ctx.Process(
+                target=analyze, args=(self.ring, self._stop, self.events))
+        capture = ctx.Process(target=self.capture,
+                              args=(self.ring, self._stop) + self.capture_args)
+        self._workers = [analysis, capture]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+        atexit.register(self.close)
+        return self
+
+    def close(self):
+        if self.ring is None:
+            return
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(1)
+            if worker.is_alive() and hasattr(worker, 'terminate'):
+                worker.terminate()
+        self._workers = []
+        self.ring.close()
+        self.ring = None
+
+    @property
+    def overflows(self):
+        return self.ring.overflows if self.ring is not None else 0
+
+    def calibrate(self, input_device_index=None, prompt=True, timeout=3.):
+        """Asks for quiet and has the analysis process measure the room's
+        noise on the next hops (like `MicListener.calibrate()`;
+        `input_device_index` is ignored).  Returns the noise floor, or None
+        if it wasn't measured within `timeout` seconds."""
+        if prompt:
+            print("Measuring the room's noise -- please be quiet for a "
+                  "moment...")
+        self.start()
+        self.ring.begin(calibrate=True)
+        end = monotonic() + timeout
+        while self.ring.floor is None and monotonic() < end:
+            time.sleep(0.01)
+        floor = self.ring.floor
+        if floor is not None:  # e.g. for `contour.ContourRecorder`
+            self.gate.floor = floor
+        return floor
+
+    @timed('listen')
+    def listen(self, notes, instrument_range=(NOTE_MIN, NOTE_MAX),
+               input_device_index=None, output_on=False, mingus_range=False,
+               on_note=None, timeout=None, idle_timeout=None, cancel=None):
+        """Like `MicListener.listen()`.  `input_device_index` is ignored;
+        pass it in `capture_args`."""
+        if mingus_range:
+            note_min = int(Note(instrument_range[0])) + 12
+            note_max = int(Note(instrument_range[1])) + 12
+        else:
+            note_min, note_max = instrument_range
+        self.start()
+        generation = self.ring.begin(note_min, note_max)
+        if output_on:
+            print('sampling at', FSAMP, 'Hz with max resolution of',
+                  FREQ_STEP, 'Hz', '\n')
+
+        deadline = Deadline(timeout, idle_timeout, cancel)
+        old_mes = ''
+        response_notes = ListenResult()
+        while True:
+            status = deadline.expired()
+            if status is not None:
+                response_notes.status = status
+                return response_notes
+            if not all(worker.is_alive() for worker in self._workers):
+                response_notes.status = ERROR
+                response_notes.error = IOError("Audio capture stopped.")
+                return response_notes
+            try:
+                event = self.events.get(timeout=deadline.wait_time())
+            except queue.Empty:
+                continue
+            if event[0] != generation:  # from an earlier call
+                continue
+            self.latencies.append(monotonic() - event[2])
+            freq, n = event[4:]
+
+            # Get nearest note
+            n0 = int(round(n))
+            mes = ('freq: {:4.2f} Hznote: {:>3s} {:+.2f}'
+                   ''.format(freq, note_name(n0).name, n - n0))
+            if mes != old_mes:
+                if output_on:
+                    print(mes)
+                old_mes = mes
+                deadline.heard()
+                response_notes.append(note_name(n0))
+                if on_note is not None and on_note(response_notes[-1]):
+                    response_notes.status = STOPPED
+                    return response_notes
+            if notes is not None and len(response_notes) == len(notes):
+                return response_notes
+
+
+def _busy(stop):
+    """Pure-Python CPU load, holding the GIL as much as it can."""
+    while not stop.is_set():
+        sum(i * i for i in range(10000))
+
+
+def benchmark(seconds=5., load_threads=2, speed=4., threaded=False, seed=0):
+    """Streams synthetic notes at `speed` times real time through a
+    `ProcessMicListener` (or, if `threaded`, one analysing on a thread of
+    this process) while `load_threads` threads keep this process busy.
+    Returns latency (ms) and overflow statistics."""
+    rng = np.random.RandomState(seed)
+    midi_notes = rng.randint(NOTE_MIN + 12, NOTE_MAX - 12, 8)
+    listener = ProcessMicListener(capture_synthetic, (midi_notes, 8, speed),
+                                  threaded=threaded).start()
+    stop_load = threading.Event()
+    load = [threading.Thread(target=_busy, args=(stop_load,))
+            for _ in range(load_threads)]
+    for thread in load:
+        thread.daemon = True
+        thread.start()
+
+    generation = listener.ring.begin()
+    analysis, delivery = [], []
+    end = monotonic() + seconds
+    try:
+        while monotonic() < end:
+            try:
+                event = listener.events.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if event[0] == generation:
+                delivery.append(monotonic() - event[2])
+                analysis.append(event[3] - event[2])
+        hops = int(listener.ring.header[_WRITTEN])
+        overflows = listener.overflows
+    finally:
+        stop_load.set()
+        for thread in load:
+            thread.join()
+        listener.close()
+
+    def summary(x):
+        x = 1000 * np.asarray(x)
+        return {'mean': float(x.mean()) if len(x) else None,
+                'p99': float(np.percentile(x, 99)) if len(x) else None}
+    return {'mode': 'thread' if threaded else 'process',
+            'load_threads': load_threads,
+            'hops': hops,
+            'overflows': overflows,
+            'detections': len(delivery),
+            'analysis_ms': summary(analysis),
+            'delivery_ms': summary(delivery)}
+
+
+if __name__ == '__main__':
+    import json
+    for threaded in (False, True):
+        print(json.dumps(benchmark(threaded=threaded)))
@@ -6,8 +6,15 @@ from __future__ import print_function
 import logging
 import sys
 import time
-from rtmidi.midiutil import open_midiinput
+import threading
+try:
+    from rtmidi.midiutil import open_midiinput
+except ImportError:  # only needed to open a MIDI port
+    open_midiinput = None
 from musictools import easy_play
+from instrument import timed
+from listening import (ListenResult, Deadline, COMPLETE, STOPPED, TIMEOUT,
+                       ERROR)
 
 
 class MidiKeyPress(object):
@@ -35,7 +42,7 @@ class MidiListener:
     when midi events are recorded.
     """
 
-    def __init__(self, port=None, always_recording=True):
+    def __init__(self, port=None, always_recording=True, midiin=None):
         """
         
         Args:
@@ -43,6 +50,9 @@ class MidiListener:
             useful if you already know how your available midi ports will be 
             listed.
             always_recording (bool):   
+            midiin (optional): an already opened MIDI input (anything with 
+            `set_callback()` and `close_port()` methods, e.g. to replay 
+            recorded events).  If given, `port` is just used as a label.
         """
         self.always_recording = always_recording
         self.currently_recording = always_recording
@@ -50,6 +60,7 @@ class MidiListener:
         self.history = []  # collects note history as MidiKeyPress objects
         self._port = port
         self._wallclock = time.time()
+        self._key_pressed = threading.Condition()  # notified for each event
         self.debug_mode = False
 
         # self.log = logging.getLogger('midiin_callback')
@@ -58,13 +69,19 @@ class MidiListener:
         # Prompts user for MIDI input port, unless a valid port number or name
         # is given as the first argument on the command line.
         # API backend defaults to ALSA on Linux.
-        try:
-            self._midiin, self._port = open_midiinput(self._port)
-        except (EOFError, KeyboardInterrupt):
-            sys.exit()
+        if midiin is not None:
+            self._midiin = midiin
+        else:
+            try:
+                self._midiin, self._port = open_midiinput(self._port)
+            except (EOFError, KeyboardInterrupt):
+                sys.exit()
 
         # print("Attaching MIDI input callback handler.")
         self._midiin.set_callback(self._midi_input_handler)
+        self.error = None  # the last error reported by the MIDI port
+        if hasattr(self._midiin, 'set_error_callback'):
+            self._midiin.set_error_callback(self._midi_error_handler)
 
     def _midi_input_handler(self, event, data=None):
 
@@ -79,10 +96,17 @@ class MidiListener:
             self._wallclock += deltatime
             self.history.append(
                 MidiKeyPress(self._port, self._wallclock, message))
+            with self._key_pressed:
+                self._key_pressed.notify_all()
 
             if self.debug_mode:
                 print(self.history[-1])
 
+    def _midi_error_handler(self, error_type, message, data=None):
+        self.error = IOError(message)
+        with self._key_pressed:
+            self._key_pressed.notify_all()
+
     def start_recording(self, stop_time=None):
         self.currently_recording = True
         self.time_to_stop_recording = stop_time
@@ -92,10 +116,12 @@ class MidiListener:
         self.currently_recording = False
         self.time_to_stop_recording = stop_time
 
-    def listen(self, duration=None, num_notes=None, wait_for_key_release=False):
+    @timed('listen')
+    def listen(self, duration=None, num_notes=None, wait_for_key_release=False,
+               on_note=None, timeout=None, idle_timeout=None, cancel=None):
         """Returns just those MidiKeyPress objects created over the next 
         `duration` seconds of time or after the next `num_notes` are played, 
-        whichever comes first.
+        whichever comes first, in a `ListenResult`.
         
         duration (int or float, optional): If `duration` is specified, will 
         return MidiKeyPress objects created over the next `duration` seconds of 
@@ -107,7 +133,15 @@ class MidiListener:
         
         wait_for_key_release (bool): If `False` and `num_notes` is not None, 
             will not wait for the release of each note played.  Defaults 
-            to False."""
+            to False.
+
+        on_note (callable, optional): called with the MIDI note number of 
+            each key press as soon as it is heard.  If it returns True, 
+            listening stops early.
+
+        timeout, idle_timeout, cancel (optional): see `listening.py`.  The 
+            result's status is `TIMEOUT` if `duration` runs out before 
+            `num_notes` notes are played."""
 
         if num_notes is None:
             num_notes = float("inf")
@@ -116,8 +150,9 @@ class MidiListener:
             stop_time = float("inf")
         else:
             stop_time = duration + time.time()
+        deadline = Deadline(timeout, idle_timeout, cancel)
 
-        i0 = max(len(self.history) - 1, 0)
+        i0 = len(self.history)  # only events from now on are the answer
         if not self.always_recording:
             self.start_recording()
 
@@ -127,19 +162,50 @@ class MidiListener:
             return self.history[ix].note in notes_released_since_ix
 
         note_count = 0
-        while time.time() < stop_time and note_count < num_notes:
-            if len(self.history) > i0 + 1 + note_count:  # if new notes heard
+        seen = i0  # history before this has been passed to `on_note`
+        status = COMPLETE
+        self.error = None
+        while note_count < num_notes:
+            if len(self.history) > i0 + note_count:  # if new notes heard
                 if wait_for_key_release:
-                    note_count = sum(1 for ix, x in self.history[i0:]
-                                         if x.velocity > 0 and is_released(ix))
+                    note_count = sum(1 for ix, x in enumerate(self.history[i0:],
+                                                              i0)
+                                     if x.velocity > 0 and is_released(ix))
                 else:
                     note_count = sum(1 for x in self.history[i0:]
                                      if x.velocity > 0)
+            if len(self.history) > seen:
+                new, seen = self.history[seen:], len(self.history)
+                pressed = [x.note for x in new if x.velocity > 0]
+                if pressed:
+                    deadline.heard()
+                if on_note is not None and any(on_note(x) for x in pressed):
+                    status = STOPPED
+                    break
+            if note_count >= num_notes:
+                break
+            if time.time() >= stop_time:
+                status = COMPLETE if num_notes == float("inf") else TIMEOUT
+                break
+            expired = deadline.expired()
+            if expired is not None:
+                status = expired
+                break
+            if self.error is not None:  # e.g. the device was unplugged
+                status = ERROR
+                break
+
+            # sleep until the next MIDI event (or the next check)
+            wait = min(deadline.wait_time(), stop_time - time.time())
+            with self._key_pressed:
+                if len(self.history) == seen and wait > 0:
+                    self._key_pressed.wait(wait)
 
         if not self.always_recording:
             self.stop_recording()
 
-        return self.history[i0:]
+        return ListenResult(self.history[i0:], status,
+                            self.error if status == ERROR else None)
 
     def close(self):
         self._midiin.close_port()
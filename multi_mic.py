@@ -0,0 +1,235 @@
+"""Grading several students at once from a multi-input audio interface.
+
+A `MultiMicListener` opens one N-channel input stream and, on a background
+thread, runs a `MultiPitchDetector` over all channels at once (one batched
+FFT per hop).  Each channel's notes go to their own queue, read by that
+channel's `ChannelListener`, which works like a `MicListener` -- so each
+student gets their own `Session`, with their channel as its listener:
+
+    >>> mics = MultiMicListener(4).start()
+    >>> sessions = [Session(SettingsContainer(dict(settings,
+    ...                                            listener=mics.channel(k))))
+    ...             for k in range(4)]
+
+Usage:
+    $ python multi_mic.py     # how the analysis scales with channels
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import time
+import threading
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+# Internal Dependencies
+from mic_listen import (MicListener, PitchDetector, MultiPitchDetector,
+                        note_name, synthetic_audio, NOTE_MIN, NOTE_MAX, FSAMP,
+                        FRAME_SIZE)
+from listening import ListenResult, Deadline, STOPPED, ERROR
+from instrument import timed
+
+# External Dependencies
+import numpy as np
+from mingus.containers import Note
+try:
+    import pyaudio
+except ImportError:  # only needed to open the microphones
+    pyaudio = None
+
+
+class MultiMicListener(object):
+    """Detects notes on every channel of one input device.
+
+    Args:
+        channels (int): number of input channels.
+        input_device_index (int, optional): the pyaudio input device.
+        source (callable, optional): if given, called for each hop of
+            `FRAME_SIZE` interleaved int16 frames instead of reading the
+            device (None ends the stream), e.g. to test or benchmark.
+    """
+    def __init__(self, channels, input_device_index=None, source=None):
+        self.channels = channels
+        self.input_device_index = input_device_index
+        self.source = source
+        self.detector = MultiPitchDetector(channels)
+        self.queues = [queue.Queue() for _ in range(channels)]
+        self.generations = [0] * channels  # bumped by each `listen()`
+        self._ranges = [(NOTE_MIN, NOTE_MAX)] * channels
+        self._stream = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.error = None  # what stopped the stream, if it failed
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        source = self.source
+        if source is None:
+            self._stream = pyaudio.PyAudio().open(
+                format=pyaudio.paInt16, channels=self.channels, rate=FSAMP,
+                input=True, frames_per_buffer=FRAME_SIZE,
+                input_device_index=self.input_device_index)
+            self._stream.start_stream()
+            source = self._read
+        self._thread = threading.Thread(target=self._run, args=(source,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def channel(self, channel):
+        """Returns the `MicListener` for one channel."""
+        return ChannelListener(self, channel)
+
+    def begin(self, channel, note_min=NOTE_MIN, note_max=NOTE_MAX):
+        """Starts listening afresh on `channel` (nothing heard before
+        counts).  Returns the new generation of its notes."""
+        self._ranges[channel] = note_min, note_max
+        self.generations[channel] += 1
+        return self.generations[channel]
+
+    def _read(self):
+        return np.frombuffer(
+            self._stream.read(FRAME_SIZE, exception_on_overflow=False),
+            np.int16)
+
+    def _run(self, source):
+        detector = self.detector
+        seen = [0] * self.channels
+        old_notes = [None] * self.channels
+        while not self._stop.is_set():
+            try:
+                samples = source()
+            except (IOError, OSError) as e:  # e.g. the device was unplugged
+                self.error = e
+                break
+            if samples is None:
+                break
+            for channel in range(self.channels):
+                if self.generations[channel] != seen[channel]:
+                    seen[channel] = self.generations[channel]
+                    detector.set_range(channel, *self._ranges[channel])
+                    detector.reset(channel)
+                    old_notes[channel] = None
+            for channel, detected in enumerate(detector.process(samples)):
+                if detected is None:
+                    continue
+                n0 = int(round(detected[1]))
+                if n0 != old_notes[channel]:
+                    old_notes[channel] = n0
+                    self.queues[channel].put((seen[channel], detected[0], n0))
+
+
+class ChannelListener(MicListener):
+    """One channel of a `MultiMicListener`.  See `MicListener.listen()`."""
+    def __init__(self, mics, channel):
+        MicListener.__init__(self)
+        self.mics = mics
+        self.channel = channel
+
+    @timed('listen')
+    def listen(self, notes, instrument_range=(NOTE_MIN, NOTE_MAX),
+               input_device_index=None, output_on=False, mingus_range=False,
+               on_note=None, timeout=None, idle_timeout=None, cancel=None):
+        if mingus_range:
+            note_min = int(Note(instrument_range[0])) + 12
+            note_max = int(Note(instrument_range[1])) + 12
+        else:
+            note_min, note_max = instrument_range
+        generation = self.mics.begin(self.channel, note_min, note_max)
+        notes_heard = self.mics.queues[self.channel]
+
+        deadline = Deadline(timeout, idle_timeout, cancel)
+        response_notes = ListenResult()
+        while True:
+            status = deadline.expired()
+            if status is not None:
+                response_notes.status = status
+                break
+            if not self.mics.running and notes_heard.empty():
+                response_notes.status = ERROR
+                response_notes.error = (self.mics.error or
+                                        IOError("The input stream stopped."))
+                break
+            try:
+                event_generation, freq, n0 = notes_heard.get(
+                    timeout=deadline.wait_time())
+            except queue.Empty:
+                continue
+            if event_generation != generation:  # from an earlier call
+                continue
+            if output_on:
+                print('channel {}: freq: {:4.2f} Hz note: {:>3s}'
+                      ''.format(self.channel, freq, note_name(n0).name))
+            deadline.heard()
+            response_notes.append(note_name(n0))
+            if on_note is not None and on_note(response_notes[-1]):
+                response_notes.status = STOPPED
+                break
+            if notes is not None and len(response_notes) == len(notes):
+                break
+        return response_notes
+
+
+def synthetic_channels(channels, notes_per_channel=4, hops_per_note=8,
+                       seed=0):
+    """Returns `(notes, hops)`: random MIDI notes for each channel and
+    interleaved int16 audio of them, one row per hop."""
+    rng = np.random.RandomState(seed)
+    notes = rng.randint(NOTE_MIN + 12, NOTE_MAX - 12,
+                        (channels, notes_per_channel))
+    audio = np.stack([synthetic_audio(notes[k], hops_per_note, seed + k)
+                      for k in range(channels)], axis=1)
+    return notes, audio.reshape(-1, FRAME_SIZE * channels)
+
+
+def benchmark(channel_counts=(1, 2, 4, 8, 16), hops=64):
+    """Returns milliseconds of analysis per hop for each number of channels,
+    batched (`MultiPitchDetector`) and with a `PitchDetector` per
+    channel."""
+    results = []
+    for channels in channel_counts:
+        _, audio = synthetic_channels(channels, hops_per_note=hops // 4)
+        detector = MultiPitchDetector(channels)
+        start = time.time()
+        for hop in audio:
+            detector.process(hop)
+        batched = (time.time() - start) / len(audio)
+
+        detectors = [PitchDetector() for _ in range(channels)]
+        start = time.time()
+        for hop in audio:
+            frames = hop.reshape(FRAME_SIZE, channels)
+            for channel, d in enumerate(detectors):
+                d.process(frames[:, channel])
+        separate = (time.time() - start) / len(audio)
+        results.append({'channels': channels,
+                        'batched_ms': 1000 * batched,
+                        'separate_ms': 1000 * separate,
+                        'realtime_fraction': batched * FSAMP / FRAME_SIZE})
+    return results
+
+
+if __name__ == '__main__':
+    print("{:>8} {:>12} {:>12} {:>10}".format(
+        'channels', 'batched ms', 'separate ms', 'of a hop'))
+    for r in benchmark():
+        print("{channels:>8} {batched_ms:>12.3f} {separate_ms:>12.3f} "
+              "{realtime_fraction:>10.1%}".format(**r))
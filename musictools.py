@@ -6,25 +6,26 @@ except:
     pass
 
 import settings as st
+from audio_backend import get_backend
+from instrument import timed
+import notenames
+from notenames import make_note
 
 # External Dependencies
 import random
-from mingus.midi import fluidsynth  # requires FluidSynth is installed
 from mingus.core import progressions, intervals, chords as ch
 import mingus.core.notes as notes
 from mingus.containers import NoteContainer, Note, Bar
 
 
 def parse2note(x):
-    if isinstance(x, int):
-        return Note().from_int(x)  # if integer
-    elif isinstance(x, str):
-        try:
-            return Note().from_int(str(x))  # if integer string
-        except:
-            return Note(x)  # if string note name
-    elif isinstance(x, Note):
+    if isinstance(x, Note):
         return x  # if already Note
+    elif isinstance(x, (int, str)):
+        note = make_note(x)  # if integer, integer string or note name
+        if note is not None:
+            return note
+        return Note(x)  # other spellings mingus understands
     else:
         raise Exception("Could not parse input {} of type {} to string."
                         "".format(x, type(x)))
@@ -52,20 +53,26 @@ def random_progression(number_strums, numerals, strums_per_chord=[1]):
     return prog, prog_strums
 
 
-def random_chord():
+@timed('generate')
+def random_chord(numeral=None, octave=None, gst=st):
+    """Returns `(numeral, chord, Ioctave)`.  `numeral` and (if 
+    `gst.MANY_OCTAVES`) `octave` are picked at random unless given.  `gst`
+    holds the key and numerals, see `game_modes.mode_settings()`."""
     # Pick random chord
-    numeral = random.choice(st.NUMERALS)
-    chord = NoteContainer(progressions.to_chords([numeral], st.KEY)[0])
+    if numeral is None:
+        numeral = random.choice(gst.NUMERALS)
+    chord = NoteContainer(progressions.to_chords([numeral], gst.KEY)[0])
 
     # Pick random octave, set chord to octave   
-    if st.MANY_OCTAVES:
-        octave = random.choice(st.OCTAVES)
+    if gst.MANY_OCTAVES:
+        if octave is None:
+            octave = random.choice(st.OCTAVES)
         d = octave - chord[0].octave
         for x in chord:
             x.octave = x.octave + d
 
         # Find Ioctave
-        dist_to_tonic = (int(chord[0]) - int(Note(st.KEY))) % 12
+        dist_to_tonic = (int(chord[0]) - int(Note(gst.KEY))) % 12
         I_root = Note().from_int(int(chord[0]) - dist_to_tonic)
         Ioctave = I_root.octave
     else:
@@ -87,28 +94,41 @@ def random_chord():
 
 class Diatonic(object):
     def __init__(self, key, Ioctave=None, minor=False):
-        self.minor = minor
+        self.minor = minor or key[0] == key[0].lower()
         if not Ioctave:
-            Ioctave = Note(key).octave
+            Ioctave = Note(key[0].upper() + key[1:]).octave
         self.Ioctave = Ioctave
 
-        if minor or key[0] == key[0].lower():  # natural minor
+        if self.minor:  # natural minor
             self.rel_semitones = [0, 2, 3, 5, 7, 8, 10]
-            self.keyname = key[0].upper + key[1:] + " Major"
-        elif key[0] == key[0].upper():  # major
+            self.keyname = key[0].upper() + key[1:] + " Minor"
+        else:  # major
             self.rel_semitones = [0, 2, 4, 5, 7, 9, 11]
-            self.keyname = key + " Minor"
+            self.keyname = key + " Major"
         self.tonic = Note(name=key[0].upper() + key[1:], octave=Ioctave)
+        self.tonic_int = int(self.tonic)
 
-        self.abs_semitones = [int(self.tonic) + x for x in self.rel_semitones]
+        self.abs_semitones = [self.tonic_int + x for x in self.rel_semitones]
         self.notes = [Note().from_int(x) for x in self.abs_semitones]
         self.numdict = dict([(k + 1, n) for k, n in enumerate(self.notes)])
         self.base_semitones = [x % 12 for x in self.abs_semitones]
+        self._degrees = dict((x, k + 1) 
+                             for k, x in enumerate(self.base_semitones))
 
     def semitone_distance2note(self, dist):
         """Returns the note that is the input semitone distance from the tonic.
         """
-        return Note().from_int(int(self.tonic) + dist)
+        return Note().from_int(self.tonic_int + dist)
+
+    def relative(self, notes):
+        """Returns the semitone distances of `notes` from the tonic, i.e. a 
+        representation of them that is the same in every key."""
+        return [int(x) - self.tonic_int for x in notes]
+
+    def absolute(self, offsets):
+        """The inverse of `relative()`: returns the `Note`s at semitone 
+        distances `offsets` from the tonic."""
+        return [Note().from_int(self.tonic_int + x) for x in offsets]
 
     def degree2note(self, degree):
         """Converts diatonic degree to `Note` object."""
@@ -119,13 +139,11 @@ class Diatonic(object):
 
     def note2degree(self, note):
         """Converts a `Note` object to a diatonic degree."""
-        base_semitones = [x % 12 for x in self.abs_semitones]
-        note_base_semi = int(note) % 12
-        try:
-            return base_semitones.index(note_base_semi) + 1
-        except:
+        degree = self._degrees.get(notenames.note_int(note) % 12)
+        if degree is None:
             raise ValueError("{} is not a note in {}.".format(note.name, 
                              self.keyname))
+        return degree
 
     def degrees2semidist(self, num1, num2):
         """Find the distance in semitones between two diatonic degrees."""
@@ -161,11 +179,15 @@ class Diatonic(object):
     def random_note(self):
         return random.choice(self.notes)
 
-    def bounded_random_notes(self, low, high, max_int, n, previous_note=None):
-        note_int_range = [x for x in range(int(parse2note(low)),
-                                           int(parse2note(high)) + 1)
-                            if (x % 12) in self.base_semitones]
+    def note_int_range(self, low, high):
+        """Returns the notes of the scale from `low` to `high` as ints."""
+        return [x for x in range(int(parse2note(low)),
+                                 int(parse2note(high)) + 1)
+                if (x % 12) in self.base_semitones]
 
+    @timed('generate')
+    def bounded_random_notes(self, low, high, max_int, n, previous_note=None):
+        note_int_range = self.note_int_range(low, high)
 
         if previous_note is None:
             previous_note = Note().from_int(random.choice(note_int_range))
@@ -178,6 +200,30 @@ class Diatonic(object):
             previous_note = notes[-1]
         return notes
 
+    @timed('generate')
+    def adaptive_random_notes(self, sampler, key, low, high, max_int, n, 
+                              previous_note=None):
+        """Like `bounded_random_notes()`, but each note is drawn by 
+        `sampler` (see `new_question.rn_sampler()`), whose items are 
+        `(key index, previous note, interval)`.  Returns `(notes, items)`."""
+        note_int_range = self.note_int_range(low, high)
+        if previous_note is None:
+            previous_note = random.choice(note_int_range)
+        previous_note = int(previous_note)
+
+        max_int = min(max_int, sampler.dims[2][-1])
+        notes, items = [], []
+        for k in range(n):
+            item = sampler.sample((key, previous_note),
+                                  low=max(-max_int, 
+                                          note_int_range[0] - previous_note),
+                                  high=min(max_int, 
+                                           note_int_range[-1] - previous_note))
+            previous_note += item[2]
+            notes.append(Note().from_int(previous_note))
+            items.append(item)
+        return notes, items
+
     def root2chord(root_pitch, type='triad'):
         """Given a `Note` object, returns a `NoteContainer`.  `type` determines
         the chord type and voicing."""
@@ -192,17 +238,58 @@ class Diatonic(object):
         degrees = [self.note2degree(root_pitch) + (d-1) for d in tones]
         return NoteContainer(map(self.degree2note, degrees))
 
-    
-def isvalidnote(answer):
-    try:  # return True if response is numerical 1-7
-        return int(answer) in range(1, 8)
-    except:
-        pass
-    try:  # return True if response is a valid note name
-        return notes.is_valid_note(answer[0].upper() + answer[1:])
-    except:
+
+_diatonics = {}
+
+
+def get_diatonic(key, Ioctave=None, minor=False):
+    """Returns a `Diatonic`, shared by all callers with the same `(key, 
+    Ioctave, minor)`, so treat it as read-only."""
+    minor = minor or key[0] == key[0].lower()
+    if not Ioctave:
+        Ioctave = Note(key[0].upper() + key[1:]).octave
+    cache_key = (key[0].upper() + key[1:], Ioctave, minor)
+    try:
+        return _diatonics[cache_key]
+    except KeyError:
+        return _diatonics.setdefault(cache_key, 
+                                     Diatonic(key, Ioctave, minor))
+
+
+_interval_offsets = {}
+
+
+def interval_offsets(number, root=1, ascending=True, minor=False):
+    """Returns the semitone distances from the tonic of the notes of 
+    `Diatonic.interval()` (with `root` given as a scale degree).  These are 
+    the same in every key, so they are computed once (in C) and cached; 
+    `get_diatonic(key, Ioctave, minor).absolute()` voices them in a key."""
+    cache_key = (number, root, ascending, minor)
+    try:
+        return _interval_offsets[cache_key]
+    except KeyError:
         pass
-    return False
+    diatonic = get_diatonic('C', minor=minor)
+    interval = diatonic.interval(number, root=diatonic.notes[root - 1], 
+                                 ascending=ascending)
+    return _interval_offsets.setdefault(cache_key, 
+                                        tuple(diatonic.relative(interval)))
+
+
+def transpose(notes, semitones):
+    """Returns a copy of `notes` (a `Note`, a `NoteContainer` or a list of 
+    either) moved up by `semitones`."""
+    if isinstance(notes, Note):
+        return Note().from_int(int(notes) + semitones)
+    if isinstance(notes, NoteContainer):
+        return NoteContainer([transpose(x, semitones) for x in notes])
+    return [transpose(x, semitones) for x in notes]
+
+
+def isvalidnote(answer):
+    """Returns True if `answer` is a scale degree (1-7) or a note name."""
+    return (notenames.degree(answer) is not None or 
+            notenames.pitch_class(answer) is not None)
 
 
 def random_key(minor=False, output_on=True):
@@ -243,6 +330,7 @@ def easy_bar(notes, durations=None):
     return bar
 
 
+@timed('synthesize')
 def easy_play(notes, durations=None, bpm=None):
     """`notes` should be a list of notes and/or note_containers.
     durations will all default to 4 (quarter notes).
@@ -250,7 +338,7 @@ def easy_play(notes, durations=None, bpm=None):
     # if bpm is None:
     #     bpm = st.BPM
     assert bpm is not None
-    fluidsynth.play_Bar(easy_bar(notes, durations), bpm=bpm)
+    get_backend().play_Bar(easy_bar(notes, durations), bpm=bpm)
 
 
 def play_wait(duration=None, notes=None, bpm=None):
@@ -267,16 +355,17 @@ def play_wait(duration=None, notes=None, bpm=None):
         assert (notes and bpm) or duration
 
 
-def play_progression(prog, key, octaves=None, Ioctave=4, Iup = "I", bpm=None):
-    """ Converts a progression to chords and plays them using fluidsynth.
-    Iup will be played an octave higher than other numerals by default.
+@timed('voice')
+def voice_progression(prog, key, octaves=None, Ioctave=4, Iup="I"):
+    """Converts a progression to a list of chords (`NoteContainer` objects).
+    Iup will be voiced an octave higher than other numerals by default.
     Set Ioctave to fall for no octave correction from mingus default behavior.
     """
     if octaves:
         assert len(prog) == len(octaves)
 
     if not octaves:
-        I_chd = NoteContainer(progressions.to_chords([st.I], key)[0])
+        I_chd = NoteContainer(progressions.to_chords(["I"], key)[0])
         I_chd[0].octave = Ioctave
         I_val = int(I_chd[0])
 
@@ -306,8 +395,13 @@ def play_progression(prog, key, octaves=None, Ioctave=4, Iup = "I", bpm=None):
                 x.octave_up()
 
         chords.append(chord)
+    return chords
+
 
-    easy_play(chords, bpm=bpm)
+def play_progression(prog, key, octaves=None, Ioctave=4, Iup = "I", bpm=None):
+    """ Converts a progression to chords and plays them.
+    See `voice_progression` for details."""
+    easy_play(voice_progression(prog, key, octaves, Ioctave, Iup), bpm=bpm)
 
 
 def resolve_with_chords(num2res, key, Ioctave, numerals, bpm=None):
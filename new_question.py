@@ -7,34 +7,142 @@ except:
 
 from musictools import easy_play, play_wait, parse2note
 import settings as st
+import game_structure as gs
 from game_modes import repeat_question, new_question  # Decorators
+from game_modes import answer_stats, quit_game
 from midi_listen import MidiListener
+from timeline import Timeline, duration2seconds
+from prefetch import QuestionPrefetcher
+from instrument import timed, instruments
+from grading import align, StreamingGrader
+from notenames import note_int
 from mic_listen import MicListener
+from contour import ContourRecorder, score_contour
+from listening import COMPLETE, CANCELLED
+from sampler import AdaptiveSampler, KEY_INDICES, key_index
 import time
+from collections import OrderedDict
+
+# External Dependencies
+import numpy as np
+from mingus.containers import Note
+
+
+NOTE_INTS = list(range(108))  # C-0 to B-8
+RN_INTERVALS = list(range(-24, 25))
 
 
 def intro_rn():
     print("And away we go!")
 
 
+def random_phrase(gst, previous_note=None):
+    """Picks the notes for a new question using the game settings `gst`."""
+    return gst.scale.bounded_random_notes(gst.low,
+                                          gst.high,
+                                          gst.max_int,
+                                          gst.notes_per_phrase,
+                                          previous_note)
+
+
+def rn_sampler():
+    """Returns a new adaptive sampler for random notes questions.  Its 
+    items are `(key index, previous note, interval)`; intervals landing 
+    outside the key get zero weight."""
+    key = np.array(KEY_INDICES)[:, None, None]
+    note = (np.array(NOTE_INTS)[None, :, None] + 
+            np.array(RN_INTERVALS)[None, None, :])
+    degree = (note - key % 12) % 12
+    in_key = np.where(key < 12, np.isin(degree, [0, 2, 4, 5, 7, 9, 11]),
+                                np.isin(degree, [0, 2, 3, 5, 7, 8, 10]))
+    in_range = (note >= NOTE_INTS[0]) & (note <= NOTE_INTS[-1])
+    return AdaptiveSampler([KEY_INDICES, NOTE_INTS, RN_INTERVALS],
+                           base=(in_key & in_range).astype(float).ravel())
+
+
+def phrase_timeline(gst, notes):
+    """Returns the `Timeline` for a question's phrase."""
+    tl = Timeline(bpm=gst.bpm)
+    if gst.single_notes:
+        return tl.add_phrase(notes)
+    return tl.add_phrase([gst.scale.root2chord(n, gst.chord_type)
+                          for n in notes])
+
+
+@timed('prepare')
+def prepare_rn(gst, previous_note=None, session=None):
+    """Picks and voices a new question.  Returns its `current_q_info`.  If
+    `session` is given, notes are picked by its adaptive sampler."""
+    if session is None:
+        notes = random_phrase(gst, previous_note)
+        return {'notes': notes, 'timeline': phrase_timeline(gst, notes)}
+    sampler = session.sampler('random_notes', rn_sampler)
+    key = key_index(gst.key.lower() if gst.minor else gst.key)
+    notes, items = gst.scale.adaptive_random_notes(sampler, key,
+                                                   gst.low,
+                                                   gst.high,
+                                                   gst.max_int,
+                                                   gst.notes_per_phrase,
+                                                   previous_note)
+    return {'notes': notes, 'timeline': phrase_timeline(gst, notes),
+            'sampler': sampler, 'items': items}
+
+
+def enable_prefetch_rn(session, depth=2, render=None):
+    """Starts preparing questions for `session` in the background.  Each 
+    prepared phrase continues on from the one prepared before it."""
+    gst = session.settings
+    previous = {'note': None}
+
+    def produce():
+        q_info = prepare_rn(gst, previous['note'], session)
+        previous['note'] = q_info['notes'][-1]
+        return q_info
+    session.prefetcher = QuestionPrefetcher(produce, depth, render)
+    return session.prefetcher
+
+
+def grade_rn(user_notes, correct_notes):
+    """Returns a list of booleans, one for each note in `correct_notes`, 
+    indicating whether a user's note matched it (up to octave) once the 
+    answer is aligned to the correct notes (see `grading.align`).  Takes in 
+    notes as list of `int` or `Note` objects."""
+    return align([note_int(x) for x in correct_notes],
+                 [note_int(x) for x in user_notes]).credit
+
+
+@timed('grade')
 @new_question
-def eval_rn(user_notes, correct_notes, gst):
-    """Takes in notes as list of `int` or `Note` objects."""
+def eval_rn(session, user_notes, correct_notes, covered=None):
+    """Takes in notes as list of `int` or `Note` objects.  If `covered` is
+    given, listening was cut short (see `grading.StreamingGrader`) and only
+    the first `covered` correct notes are graded."""
 
     user_notes = [parse2note(x) for x in user_notes]
     correct_notes = [parse2note(x) for x in correct_notes]
+    stopped_early = covered is not None
+    graded = correct_notes
+    if stopped_early:
+        graded = correct_notes[:covered]
+    alignment = align(graded, user_notes)
 
-    if user_notes:
-        answers_correct = [(int(nu) - int(nc)) % 12 == 0
-                           for nu, nc in zip(user_notes, correct_notes)]
-    else:
-        answers_correct = [False] * len(correct_notes)
+    gst = session.settings
+    session.record_attempt('random_notes',
+                           gst.key.lower() if gst.minor else gst.key,
+                           [note_int(x) for x in correct_notes],
+                           [note_int(x) for x in user_notes],
+                           alignment.correct and not stopped_early)
+    session.adapt(alignment.credit + 
+                  [None] * (len(correct_notes) - len(graded)))
 
     print("Correct answer:", " ".join([x.name for x in correct_notes]))
     print("Your answer:   ", " ".join([x.name for x in user_notes]))
+    if alignment.deletions or alignment.insertions:
+        print("({} missed, {} extra)".format(alignment.deletions,
+                                             alignment.insertions))
 
-    if all(answers_correct):
-        st.SCORE += 1
+    if alignment.correct and not stopped_early:
+        session.score += 1
         print("Good Job!")
         print()
     else:
@@ -44,6 +152,144 @@ def eval_rn(user_notes, correct_notes, gst):
     # play_wait(bpm=gst.bpm)
 
 
+def listen_options(session):
+    """Returns the keyword arguments limiting how long listeners wait for an
+    answer (see `listening.py`)."""
+    return {'timeout': st.LISTEN_TIMEOUT,
+            'idle_timeout': st.LISTEN_IDLE_TIMEOUT,
+            'cancel': session.interrupt}
+
+
+def eval_rn_streamed(session, grader, user_notes, correct_notes,
+                     result=None):
+    """Evaluates an answer that `grader` graded as it was heard.  `result`
+    is the listener's `ListenResult`: if listening failed or was cancelled
+    (by a hotkey, see `handle_hotkeys_rn()`), the answer isn't graded and
+    the question is asked again."""
+    if getattr(result, 'failed', False):
+        instruments.count('listen_errors')
+        print("Couldn't hear your answer: {}".format(result.error))
+        session.new_question = False  # ask it again
+        return
+    if getattr(result, 'cancelled', False):
+        session.new_question = False  # unless the hotkey says otherwise
+        return
+    if getattr(result, 'timed_out', False):
+        instruments.count('listen_timeouts')
+        print("Stopped listening: no {}note heard in time."
+              "".format("further " if user_notes else ""))
+    covered = None
+    if grader.stopped_early:
+        instruments.count('early_stops')
+        print("Stopped listening after {} wrong, missed or extra note{}."
+              "".format(grader.misses, "s" if grader.misses > 1 else ""))
+        covered = grader.covered
+    eval_rn(session, user_notes, correct_notes, covered)
+
+
+def sight_sing_rn(session, notes):
+    """Shows `notes` to be sung (after playing the first) and grades the
+    singing by its pitch contour (see `contour.py`)."""
+    gst = session.settings
+    if gst.listener.gate.floor is None:  # not calibrated yet
+        gst.listener.calibrate()
+    print("Sing:", " ".join("{}-{}".format(x.name, x.octave) for x in notes))
+    session.mark_sound()
+    session.play(Timeline(bpm=gst.bpm).add_phrase(notes[:1]))
+
+    recorder = ContourRecorder(int(Note(gst.low)) + 12,
+                               int(Note(gst.high)) + 12,
+                               gate=gst.listener.gate)
+    contour = recorder.record(len(notes) * duration2seconds(4, gst.bpm),
+                              **listen_options(session))
+    if contour.failed:
+        instruments.count('listen_errors')
+        print("Couldn't hear your answer: {}".format(contour.error))
+        session.new_question = False  # ask it again
+        return
+    if contour.status == CANCELLED:
+        session.new_question = False  # unless the hotkey says otherwise
+        return
+    if contour.status != COMPLETE:
+        instruments.count('listen_timeouts')
+    eval_sight_singing(session, score_contour(contour, notes, gst.bpm),
+                       notes)
+
+
+@timed('grade')
+@new_question
+def eval_sight_singing(session, result, correct_notes):
+    """Takes the `contour.ContourScore` of singing `correct_notes` (None if
+    too little was heard to score)."""
+    correct = [note_int(x) for x in correct_notes]
+    if result is None:
+        credit, sung = [False] * len(correct), []
+    else:
+        credit = result.credit
+        sung = [n + int(round(c / 100)) for n, c in zip(correct, result.cents)]
+
+    gst = session.settings
+    session.record_attempt('sight_singing',
+                           gst.key.lower() if gst.minor else gst.key,
+                           correct, sung, all(credit))
+    session.adapt(credit)
+
+    print("Correct answer:", " ".join([x.name for x in correct_notes]))
+    if result is None:
+        print("Not enough singing heard to grade.")
+    else:
+        print("You sang:      ", " ".join(
+            "{}({:+.0f})".format(x.name, c)
+            for x, c in zip(correct_notes, result.cents)))
+        print("{:.0%} in tune, {:.0f} cents off on average; starts off by "
+              "{:.0f}ms (at {:.0%} of the tempo)".format(
+                  result.accuracy, result.cents_error,
+                  1000 * result.timing_deviation, result.tempo))
+
+    if all(credit):
+        session.score += 1
+        print("Good Job!")
+        print()
+    else:
+        print("It's ok, you'll get 'em next time.")
+        print()
+
+
+@repeat_question
+def replay_rn(session):
+    print("Again:")
+
+
+rn_menu_commands = OrderedDict((mc.command, mc) for mc in [
+    gs.MenuCommand("r", "hear the phrase again", replay_rn),
+    gs.MenuCommand("a", "see statistics on all your logged answers",
+                   answer_stats),
+    gs.MenuCommand("x", "quit", quit_game),
+])
+
+# keys that interrupt playback and listening in random notes mode
+RN_HOTKEYS = list(rn_menu_commands)
+
+
+def handle_hotkeys_rn(session):
+    """Runs the menu command of the first hotkey pressed since the last call
+    (if any), discarding any other keys, and clears the keyboard's
+    interrupt.  Returns True if a command was run."""
+    keyboard = session.keyboard
+    if keyboard is None or not keyboard.interrupt.is_set():
+        return False
+    command = None
+    while command is None:
+        key = keyboard.getch(timeout=0)
+        if not key:  # nothing left (or end of input)
+            break
+        command = rn_menu_commands.get(key)
+    keyboard.clear()
+    if command is not None:
+        command.action(session)
+    return command is not None
+
+
 def parse_midi_input(midi_key_presses):
     """Takes in a list of MidiKeyPress objects, returns the notes, ordered by 
     time pressed."""
@@ -51,37 +297,34 @@ def parse_midi_input(midi_key_presses):
     return [x.note for x in midi_key_presses if x.velocity > 0]
 
 
-def new_question_rn(game_settings):
-    gst = game_settings
-    if st.NEWQUESTION:
-        if st.COUNT:
-            print("score: {} / {} = {:.2%}".format(st.SCORE, st.COUNT,
-                                                    st.SCORE/st.COUNT))
-        st.COUNT += 1
+def new_question_rn(session):
+    gst = session.settings
+    if session.new_question:
+        session.print_score()
+        session.count += 1
         # Find random melody/progression
-        try:
-            previous_note = st.CURRENT_Q_INFO['notes'][-1]
-        except:
-            previous_note = None
-        notes = gst.scale.bounded_random_notes(gst.low,
-                                               gst.high,
-                                               gst.max_int,
-                                               gst.notes_per_phrase,
-                                               previous_note)
-
-        # store question info
-        st.CURRENT_Q_INFO = {'notes': notes}
-    else:
-        notes = st.CURRENT_Q_INFO['notes']
+        if session.prefetcher is not None:
+            session.current_q_info = session.prefetcher.get()
+        else:
+            try:
+                previous_note = session.current_q_info['notes'][-1]
+            except:
+                previous_note = None
+            session.current_q_info = prepare_rn(gst, previous_note, session)
+    notes = session.current_q_info['notes']
+
+    if st.SIGHT_SINGING and isinstance(gst.listener, MicListener):
+        sight_sing_rn(session, notes)
+        handle_hotkeys_rn(session)
+        if session.new_question:
+            session.mark_answered()
+        return
 
     # Play melody/progression
     # start_time = time.time()
     # i0 = len(HISTORY)
-    if gst.single_notes:
-        easy_play(notes, bpm=gst.bpm)
-    else:
-        easy_play([gst.scale.root2chord(n, gst.chord_type) for n in notes],
-                  bpm=gst.bpm)
+    session.mark_sound()
+    session.play(session.current_q_info['timeline'])
 
     # def midi_listen(notes):
     #     i0 = len(HISTORY)
@@ -90,18 +333,30 @@ def new_question_rn(game_settings):
     #     # play_wait(notes, bpm=gst.bpm)
     #     return HISTORY[i0:]
 
-    # Request user's answer
+    # Request user's answer, grading each note as it is heard
+    grader = StreamingGrader(notes, st.MAX_MISSES)
     if isinstance(gst.listener, MidiListener):
         user_response = \
-            gst.listener.listen(num_notes=gst.notes_per_phrase)
+            gst.listener.listen(num_notes=gst.notes_per_phrase,
+                                on_note=grader.feed,
+                                **listen_options(session))
         user_response_notes = parse_midi_input(user_response)
-        eval_rn(user_response_notes, notes, gst)
+        if grader.stopped_early:
+            user_response_notes = user_response_notes[:len(grader.heard)]
+        eval_rn_streamed(session, grader, user_response_notes, notes,
+                         user_response)
         play_wait(3, bpm=gst.bpm)
-    elif isinstance(gst.listener, MicListener):
+    elif gst.listener is not None:  # `MicListener` or `simulate.AgentListener`
         user_response_notes = gst.listener.listen(notes, (gst.low, gst.high),
-                                                  mingus_range=True)
-        eval_rn(user_response_notes, notes, gst)
+                                                  mingus_range=True,
+                                                  on_note=grader.feed,
+                                                  **listen_options(session))
+        eval_rn_streamed(session, grader, user_response_notes, notes,
+                         user_response_notes)
     else:
         play_wait(3, bpm=gst.bpm)
+    handle_hotkeys_rn(session)
+    if session.new_question:
+        session.mark_answered()
 
 
@@ -0,0 +1,102 @@
+"""Note name tables.
+
+Every accepted spelling of a note -- a letter (either case) with up to two
+sharps or flats, optionally followed by an octave as "-4" or "4" -- is
+mapped once, at import, to its note int (mingus convention: C-0 is 0, MIDI
+numbers are 12 more) and pitch class.  Parsing an answer is then a dictionary
+lookup instead of mingus string parsing wrapped in try/except, and
+formatting a note int is a list lookup.
+
+Unknown spellings give None (or the `default` given) rather than raising."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+from numbers import Integral
+
+# External Dependencies
+from mingus.containers import Note
+
+
+LETTERS = 'CDEFGAB'
+ACCIDENTALS = ['', '#', '##', 'b', 'bb']
+OCTAVES = range(9)  # C-0 to B-8
+DEFAULT_OCTAVE = 4  # as for `Note(name)`
+NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+DEGREES = dict((str(k), k) for k in range(1, 8))
+
+SPELLINGS = {}  # spelling -> (mingus name, octave or None)
+PITCH_CLASSES = {}  # spelling -> pitch class (C=0)
+NOTE_INTS = {}  # spelling -> note int (DEFAULT_OCTAVE if none is given)
+_NAME_INTS = {}  # mingus name -> note int in octave 0
+
+
+def _build_tables():
+    for letter in LETTERS:
+        for accidental in ACCIDENTALS:
+            name = letter + accidental
+            base = int(Note(name, 0))
+            _NAME_INTS[name] = base
+            for spelled in (name, letter.lower() + accidental):
+                SPELLINGS[spelled] = (name, None)
+                PITCH_CLASSES[spelled] = base % 12
+                NOTE_INTS[spelled] = base + 12 * DEFAULT_OCTAVE
+                for octave in OCTAVES:
+                    for sep in ('-', ''):
+                        s = '{}{}{}'.format(spelled, sep, octave)
+                        SPELLINGS[s] = (name, octave)
+                        PITCH_CLASSES[s] = base % 12
+                        NOTE_INTS[s] = base + 12 * octave
+
+
+_build_tables()
+
+
+def pitch_class(spelling, default=None):
+    """Returns the pitch class of a note name like 'Eb', 'f#' or 'C-4'."""
+    return PITCH_CLASSES.get(spelling.strip(), default)
+
+
+def note_int(x, default=None):
+    """Returns the note int of `x`: an int, a `Note` or a note name (or a
+    string of digits)."""
+    if isinstance(x, Integral):
+        return int(x)
+    if isinstance(x, Note):
+        base = _NAME_INTS.get(x.name)
+        return int(x) if base is None else base + 12 * x.octave
+    x = x.strip()
+    if x.isdigit():
+        return int(x)
+    return NOTE_INTS.get(x, default)
+
+
+def make_note(x):
+    """Returns a `Note` for `x` (a note int or a note name, keeping its
+    spelling), or None if `x` isn't understood."""
+    if isinstance(x, Integral):
+        x = int(x)
+        note = Note.__new__(Note)  # skips mingus's name parsing
+        note.name, note.octave = NAMES[x % 12], x // 12
+        return note
+    x = x.strip()
+    if x.isdigit():
+        return make_note(int(x))
+    if x not in SPELLINGS:
+        return None
+    name, octave = SPELLINGS[x]
+    note = Note.__new__(Note)
+    note.name = name
+    note.octave = DEFAULT_OCTAVE if octave is None else octave
+    return note
+
+
+def name(x):
+    """Returns the display name (e.g. 'C#') of note int `x`."""
+    return NAMES[x % 12]
+
+
+def degree(answer, default=None):
+    """Returns the scale degree (1-7) typed as `answer`."""
+    return DEGREES.get(answer.strip(), default)
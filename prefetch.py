@@ -0,0 +1,100 @@
+"""Question prefetching.
+
+A `QuestionPrefetcher` runs a producer function on a background thread to
+keep a small queue of fully prepared upcoming questions (notes chosen,
+voicings resolved into a `Timeline`, audio optionally pre-rendered), so that
+the next question can be played as soon as the previous one is graded.
+
+Anything that changes how questions are generated (key, BPM, mode, ...)
+must call `invalidate()`; questions prepared before that are discarded.
+
+The producer is never called on two threads at once (a question prepared on
+the calling thread after a miss waits for the background thread's), so it
+may keep state between questions, e.g. the last note of the previous one."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import threading
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+
+class QuestionPrefetcher(object):
+    """Prepares questions ahead of time on a background thread.
+
+    Args:
+        produce (callable): called with no arguments (and on one thread at
+            a time), returns a prepared question (e.g. a `current_q_info`
+            dictionary).
+        depth (int): the number of questions to keep ready.
+        render (callable, optional): if given, called on each prepared
+            question's 'timeline' and the result stored under 'audio'.
+    """
+    def __init__(self, produce, depth=2, render=None):
+        self.produce = produce
+        self.render = render
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._queue = queue.Queue(maxsize=depth)
+        self._lock = threading.Lock()
+        self._produce_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='QuestionPrefetcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _prepare(self):
+        with self._produce_lock:
+            question = self.produce()
+        if self.render is not None and 'timeline' in question:
+            question['audio'] = self.render(question['timeline'])
+        return question
+
+    def _run(self):
+        while not self._closed.is_set():
+            generation = self.generation
+            try:
+                question = self._prepare()
+            except Exception as e:
+                print("Question prefetching failed:", e)
+                self._closed.wait(1)
+                continue
+            while not self._closed.is_set() and generation == self.generation:
+                try:
+                    self._queue.put((generation, question), timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def get(self):
+        """Returns the next prepared question.  If none is ready (e.g. just
+        after `invalidate()`), one is prepared on the calling thread."""
+        while True:
+            try:
+                generation, question = self._queue.get_nowait()
+            except queue.Empty:
+                self.misses += 1
+                return self._prepare()
+            if generation == self.generation:
+                self.hits += 1
+                return question
+
+    def invalidate(self):
+        """Discards all prepared questions, e.g. after a settings change."""
+        with self._lock:
+            self.generation += 1
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
@@ -0,0 +1,129 @@
+"""Sample-rate conversion for microphone input.
+
+Audio devices often don't support `mic_listen.FSAMP` natively (and may
+resample it slowly, or refuse to open).  `MicListener` instead captures at
+the device's own rate and converts to the analysis rate with a
+`PolyphaseResampler`: the anti-aliasing filter is designed once, split into
+one short filter per output phase, and each hop is filtered in one
+vectorized step, carrying the filter's history over to the next hop.
+
+Usage:
+    $ python resample.py     # cost per hop for common device rates
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+try:
+    from math import gcd
+except ImportError:  # python 2
+    from fractions import gcd
+
+# External Dependencies
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+TAPS_PER_RATE = 10  # filter half-length, in samples of the slower rate
+KAISER_BETA = 5.0
+
+
+class PolyphaseResampler(object):
+    """Converts a stream from `rate_in` to `rate_out` Hz, a chunk at a time.
+
+    The rates' ratio is reduced to `up / down`; output sample `m` is the
+    input, upsampled by `up` and low-pass filtered, at `m * down`.  Only
+    the filter taps that meet a (non-zero) input sample are used, i.e. one
+    of `up` short filters (phases), so nothing is actually upsampled.
+    Output comes in blocks of `up` samples, each taking `down` inputs.
+
+    Args:
+        rate_in (int): input sample rate.
+        rate_out (int): output sample rate.
+        taps_per_rate (int): filter half-length, in output samples when
+            decimating.  Longer filters have a sharper cutoff.
+    """
+    def __init__(self, rate_in, rate_out, taps_per_rate=TAPS_PER_RATE):
+        self.rate_in = rate_in
+        self.rate_out = rate_out
+        g = gcd(rate_in, rate_out)
+        self.up, self.down = rate_out // g, rate_in // g
+        self.passthrough = self.up == self.down
+
+        # windowed-sinc low-pass at the lower of the two Nyquist rates
+        slower = max(self.up, self.down)
+        half = taps_per_rate * slower
+        t = np.arange(-half, half + 1)
+        h = np.sinc(t / slower) * np.kaiser(len(t), KAISER_BETA)
+        h *= self.up / h.sum()
+
+        # split it into `up` phases of `taps` taps: phases[p, k] = h[p+k*up]
+        self.taps = -(-len(h) // self.up)
+        h = np.concatenate([h, np.zeros(self.taps * self.up - len(h))])
+        self.phases = h.reshape(self.taps, self.up).T
+        self.delay = 0. if self.passthrough else half / self.up / rate_in
+
+        # The phases repeat every `up` outputs (a block), which take `down`
+        # inputs, so each block is one window of input times `matrix`.
+        newest = np.arange(self.up) * self.down // self.up
+        self.window = self.taps + newest[-1]
+        self.matrix = np.zeros((self.window, self.up), dtype=np.float32)
+        for j, n in enumerate(newest):
+            p = j * self.down % self.up
+            self.matrix[n:n + self.taps, j] = self.phases[p, ::-1]
+        self.reset()
+
+    def reset(self):
+        # the input from the next block's window, starting with silence
+        self._buf = np.zeros(self.taps - 1, dtype=np.float32)
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def output_length(self, n):
+        """Returns about how many samples `n` input samples become."""
+        return int(round(n * self.up / self.down))
+
+    def process(self, samples):
+        """Returns the float32 output for the next chunk of input.  Input
+        that doesn't complete a block is kept for the next call."""
+        if self.passthrough:
+            return np.asarray(samples, dtype=np.float32)
+        buf = np.concatenate([self._buf, np.asarray(samples, np.float32)])
+        blocks = max(0, (len(buf) - self.window) // self.down + 1)
+        windows = as_strided(buf, (blocks, self.window),
+                             (self.down * buf.strides[0], buf.strides[0]))
+        self._buf = buf[blocks * self.down:]
+        return np.dot(windows, self.matrix).ravel()
+
+    def hops(self, samples, size):
+        """Resamples the next chunk of input and yields whatever complete
+        hops of `size` output samples are then available."""
+        pending = np.concatenate([self._pending, self.process(samples)])
+        start = 0
+        while len(pending) - start >= size:
+            yield pending[start:start + size]
+            start += size
+        self._pending = pending[start:]
+
+
+def benchmark(rates_in=(44100, 48000, 96000), rate_out=22050, hops=200,
+              hop_size=2048):
+    """Returns the milliseconds taken to resample a hop (`hop_size` output
+    samples) of noise from each of `rates_in` to `rate_out`."""
+    import time
+    rng = np.random.RandomState(0)
+    results = {}
+    for rate_in in rates_in:
+        resampler = PolyphaseResampler(rate_in, rate_out)
+        chunk = int(round(hop_size * rate_in / rate_out))
+        x = (3000 * rng.randn(hops, chunk)).astype(np.int16)
+        start = time.time()
+        for hop in x:
+            resampler.process(hop)
+        results[rate_in] = 1000 * (time.time() - start) / hops
+    return results
+
+
+if __name__ == '__main__':
+    for rate_in, ms in sorted(benchmark().items()):
+        print("{:>6} Hz -> 22050 Hz: {:.3f} ms per hop".format(rate_in, ms))
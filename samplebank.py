@@ -0,0 +1,325 @@
+"""Sample-bank synthesis.
+
+One sample per MIDI note is rendered ahead of time -- from the soundfont
+(with FluidSynth, if available) or by a simple additive synthesizer -- into
+a single NumPy array.  Playing a note is then just mixing a slice of that
+array, so:
+
+    `SampleBank.render()` mixes a whole `Timeline` at once (e.g. for the
+        server, in place of `FluidSynthRenderer`), and
+    `SampleBankBackend` is an audio backend that mixes the notes currently
+        sounding into one persistent output stream (opened with a callback,
+        if pyaudio is installed), instead of a FluidSynth call per note.
+
+Usage:
+    $ python samplebank.py     # benchmark against FluidSynth rendering
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import threading
+
+# Internal Dependencies
+from audio_backend import AudioBackend
+from mic_listen import NOTE_MIN, NOTE_MAX, number_to_freq
+
+# External Dependencies
+import numpy as np
+try:
+    import pyaudio
+except ImportError:  # only needed to open an output stream
+    pyaudio = None
+
+
+SAMPLE_SECONDS = 1.5  # length of each note's sample
+RELEASE = 0.05  # seconds to fade out a note after it's stopped
+HARMONICS = [1., 0.5, 0.3, 0.2, 0.12, 0.08]  # amplitudes, additive synth
+PEAK = 0.25  # peak of a single note, leaving headroom for chords
+
+
+class SampleBank(object):
+    """One sample per MIDI note from `note_min` to `note_max`.
+
+    Args:
+        samples (array): float32 samples, one row per note.
+        samplerate (int): in Hz.
+        note_min (int): the MIDI number of the first row.
+
+    Notes outside the bank are played with the sample an octave (or more)
+    up or down, so they keep their pitch class.
+    """
+    def __init__(self, samples, samplerate, note_min=NOTE_MIN):
+        self.samples = np.ascontiguousarray(samples, dtype=np.float32)
+        self.samplerate = samplerate
+        self.note_min = note_min
+        self.note_max = note_min + len(self.samples) - 1
+        self.release_frames = max(1, int(RELEASE * samplerate))
+        self._release_ramp = np.linspace(1, 0, self.release_frames,
+                                         endpoint=False).astype(np.float32)
+
+    @classmethod
+    def additive(cls, samplerate=22050, note_min=NOTE_MIN, note_max=NOTE_MAX,
+                 seconds=SAMPLE_SECONDS):
+        """Synthesizes a bank from a few decaying harmonics per note."""
+        midi = np.arange(note_min, note_max + 1)
+        freqs = number_to_freq(midi)[:, None]
+        t = np.arange(int(seconds * samplerate)) / samplerate
+        samples = np.zeros((len(midi), len(t)), dtype=np.float32)
+        for k, amplitude in enumerate(HARMONICS, 1):
+            audible = (k * freqs < samplerate / 2).astype(np.float32)
+            samples += (amplitude * audible *
+                        np.sin(2 * np.pi * k * freqs * t)).astype(np.float32)
+
+        # 5ms attack, then a decay that's slower for lower notes
+        attack = np.minimum(t / 0.005, 1)
+        decay = np.exp(-t / (0.6 * (220. / freqs) ** 0.3))
+        samples *= (attack * decay).astype(np.float32)
+        samples *= PEAK / np.abs(samples).max(axis=1, keepdims=True)
+        return cls(samples, samplerate, note_min)
+
+    @classmethod
+    def from_soundfont(cls, sound_font, samplerate=22050, note_min=NOTE_MIN,
+                       note_max=NOTE_MAX, seconds=SAMPLE_SECONDS):
+        """Renders a bank from `sound_font` (requires FluidSynth)."""
+        from audio_backend import FluidSynthRenderer
+        from timeline import Timeline
+        from notenames import make_note
+        renderer = FluidSynthRenderer(sound_font, samplerate)
+        length = int(seconds * samplerate)
+        samples = np.zeros((note_max - note_min + 1, length),
+                           dtype=np.float32)
+        for row, midi in enumerate(range(note_min, note_max + 1)):
+            hold = Timeline(bpm=60).add(make_note(midi - 12), 4. / seconds)
+            rendered = renderer.render(hold, tail=0)[:length]
+            samples[row, :len(rendered)] = rendered / 32768.
+        peak = np.abs(samples).max()
+        if peak > 0:
+            samples *= PEAK / peak
+        return cls(samples, samplerate, note_min)
+
+    @classmethod
+    def load(cls, sound_font=None, samplerate=22050, **kwargs):
+        """Renders a bank from `sound_font` if FluidSynth is available,
+        otherwise synthesizes one."""
+        if sound_font is not None:
+            try:
+                return cls.from_soundfont(sound_font, samplerate, **kwargs)
+            except (ImportError, OSError, IOError):
+                pass
+        return cls.additive(samplerate, **kwargs)
+
+    def sample(self, midi):
+        """Returns the sample for MIDI number `midi`."""
+        while midi < self.note_min:
+            midi += 12
+        while midi > self.note_max:
+            midi -= 12
+        return self.samples[midi - self.note_min]
+
+    def mix(self, timeline, tail=0.5):
+        """Returns `timeline` mixed to float32 samples, followed by `tail`
+        seconds for the last notes to ring out."""
+        sr = self.samplerate
+        out = np.zeros(int(round((timeline.duration + tail) * sr)),
+                       dtype=np.float32)
+        started = {}
+        for event in timeline.sorted_events():
+            if event.on:
+                started[id(event.notes)] = event
+                continue
+            on = started.pop(id(event.notes), None)
+            if on is not None:
+                self._add(out, on, event.time)
+        for on in started.values():  # never stopped
+            self._add(out, on, None)
+        return out
+
+    def _add(self, out, on, stop_time):
+        sr = self.samplerate
+        start = int(round(on.time * sr))
+        gain = on.velocity / 127.
+        for note in on.notes:
+            sample = self.sample(int(note) + 12)
+            n = min(len(sample), len(out) - start)
+            hold = n if stop_time is None else int(round(
+                (stop_time - on.time) * sr))
+            if hold < n:  # fade out over the release
+                n = min(n, hold + self.release_frames)
+                out[start:start + hold] += gain * sample[:hold]
+                out[start + hold:start + n] += (
+                    gain * sample[hold:n] * self._release_ramp[:n - hold])
+            else:
+                out[start:start + n] += gain * sample[:n]
+
+    def render(self, timeline, tail=0.5, channel=1):
+        """Like `FluidSynthRenderer.render()`: returns `timeline` as int16
+        samples."""
+        out = self.mix(timeline, tail)
+        np.clip(out, -1, 1, out=out)
+        return (out * 32767).astype(np.int16)
+
+
+class _Voice(object):
+    """A note sounding in a `SampleBankBackend`."""
+    __slots__ = ('samples', 'position', 'gain', 'release')
+
+    def __init__(self, samples, gain):
+        self.samples = samples
+        self.position = 0
+        self.gain = gain
+        self.release = None  # frames of release left, once stopped
+
+
+class SampleBankBackend(AudioBackend):
+    """An audio backend playing notes from a `SampleBank`.
+
+    Notes are mixed, `block` frames at a time, by `mix()`, which is the
+    callback of a single output stream opened by `init()` (if pyaudio is
+    installed and `output` is True).  Starting a note only adds a voice to
+    the mix, so it sounds within one block.
+
+    Args:
+        bank (SampleBank, optional): defaults to `SampleBank.load()` (from
+            the soundfont passed to `init()`).
+        samplerate (int): used if `bank` isn't given.
+        block (int): frames per output buffer.
+        output (bool): if False, no stream is opened; call `mix()` to pull
+            audio (e.g. to test or benchmark).
+    """
+    def __init__(self, bank=None, samplerate=44100, block=256, output=True):
+        self.bank = bank
+        self.samplerate = bank.samplerate if bank is not None else samplerate
+        self.block = block
+        self.output = output
+        self.voices = {}  # (channel, MIDI number) -> _Voice
+        self.stream = None
+        self.underruns = 0
+        self._lock = threading.Lock()
+
+    @property
+    def latency(self):
+        """Seconds from starting a note to it being in the output buffer,
+        at most."""
+        return self.block / self.samplerate
+
+    def init(self, sound_font=None):
+        if self.bank is None:
+            self.bank = SampleBank.load(sound_font, self.samplerate)
+        if self.output and pyaudio is not None and self.stream is None:
+            self.stream = pyaudio.PyAudio().open(
+                format=pyaudio.paFloat32, channels=1, rate=self.samplerate,
+                output=True, frames_per_buffer=self.block,
+                stream_callback=self._callback)
+            self.stream.start_stream()
+        return True
+
+    def play_Note(self, note, channel=1, velocity=100):
+        midi = int(note) + 12
+        voice = _Voice(self.bank.sample(midi), velocity / 127.)
+        with self._lock:
+            self.voices[(channel, midi)] = voice
+        return True
+
+    def stop_Note(self, note, channel=1):
+        with self._lock:
+            voice = self.voices.get((channel, int(note) + 12))
+            if voice is not None and voice.release is None:
+                voice.release = self.bank.release_frames
+        return True
+
+    def mix(self, frames=None):
+        """Returns the next `frames` (default `block`) float32 samples of
+        the sounding notes, advancing them."""
+        frames = frames or self.block
+        out = np.zeros(frames, dtype=np.float32)
+        ramp = self.bank._release_ramp
+        with self._lock:
+            for key, voice in list(self.voices.items()):
+                start = voice.position
+                n = min(frames, len(voice.samples) - start)
+                if voice.release is not None:
+                    n = min(n, voice.release)
+                    done = len(ramp) - voice.release
+                    out[:n] += (voice.gain * voice.samples[start:start + n] *
+                                ramp[done:done + n])
+                    voice.release -= n
+                else:
+                    out[:n] += voice.gain * voice.samples[start:start + n]
+                voice.position += n
+                if voice.position >= len(voice.samples) or voice.release == 0:
+                    del self.voices[key]
+        np.clip(out, -1, 1, out=out)
+        return out
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if status:
+            self.underruns += 1
+        return self.mix(frame_count).tobytes(), pyaudio.paContinue
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+
+def benchmark(questions=200, notes_per_question=4, seed=0):
+    """Times rendering random chord questions with a synthesized bank, and
+    mixing them block by block through `SampleBankBackend`.  Returns seconds
+    per question (and, if FluidSynth is available, for
+    `FluidSynthRenderer` too)."""
+    import time
+    import random
+    from timeline import Timeline
+    from notenames import make_note
+    import settings as st
+
+    rng = random.Random(seed)
+    questions = [Timeline(bpm=120).add_phrase(
+        [make_note(rng.randint(NOTE_MIN, NOTE_MAX - 12) - 12)
+         for _ in range(notes_per_question)])
+        for _ in range(questions)]
+    results = {}
+
+    start = time.time()
+    bank = SampleBank.additive()
+    results['build_bank'] = time.time() - start
+
+    start = time.time()
+    for tl in questions:
+        bank.render(tl)
+    results['render'] = (time.time() - start) / len(questions)
+
+    backend = SampleBankBackend(SampleBank.additive(44100), output=False)
+    backend.init()
+    start = time.time()
+    for tl in questions[:20]:  # dispatch events between output blocks
+        frame = 0
+        for event in tl.sorted_events():
+            while frame < event.time * backend.samplerate:
+                backend.mix()
+                frame += backend.block
+            if event.on:
+                backend.play_NoteContainer(event.notes, 1, event.velocity)
+            else:
+                backend.stop_NoteContainer(event.notes, 1)
+    results['backend_mix'] = (time.time() - start) / 20
+    results['backend_latency'] = backend.latency
+
+    try:
+        from audio_backend import FluidSynthRenderer
+        renderer = FluidSynthRenderer(st.SOUNDFONT)
+    except (ImportError, OSError, IOError):
+        return results
+    start = time.time()
+    for tl in questions:
+        renderer.render(tl)
+    results['fluidsynth_render'] = (time.time() - start) / len(questions)
+    return results
+
+
+if __name__ == '__main__':
+    for k, v in sorted(benchmark().items()):
+        print("{:>17}: {}".format(k, v))
@@ -0,0 +1,236 @@
+"""Adaptive question sampling.
+
+Questions are drawn from an item space -- the product of a few dimensions
+such as key, register, scale degree and interval -- with probability
+proportional to a per-item weight.  Missing an item raises its weight,
+answering it correctly lowers it, so practice concentrates on what the
+student hasn't mastered yet.
+
+Weights are kept in a Fenwick (binary indexed) tree, so updating a weight
+and drawing an item both cost O(log n) in the size of the item space.
+Fixing the leading dimensions of the space (e.g. the current key) selects a
+contiguous block of items, so constrained draws are O(log n) too."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import random
+import threading
+from array import array
+
+# Internal Dependencies
+from attempt_log import key2pitch_class
+
+
+KEY_INDICES = list(range(24))  # major keys C..B, then minor keys c..b
+
+
+def key_index(key):
+    """Returns the index of `key` (e.g. 'Eb', or 'c#' for minor) in
+    `KEY_INDICES`."""
+    tonic, minor = key2pitch_class(key)
+    return tonic + 12 * minor
+
+
+class SumTree(object):
+    """A Fenwick tree over non-negative weights.
+
+    Supports setting a weight, prefix sums and weighted draws, each in
+    O(log n)."""
+    def __init__(self, weights):
+        self.weights = array('d', weights)
+        n = self.size = len(self.weights)
+        tree = array('d', [0.]) * (n + 1)
+        for i in range(1, n + 1):  # O(n) construction
+            tree[i] += self.weights[i - 1]
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        self._tree = tree
+        self._top = 1
+        while self._top * 2 <= n:
+            self._top *= 2
+
+    def __len__(self):
+        return self.size
+
+    def set(self, index, weight):
+        if weight < 0:
+            raise ValueError("Weights must be non-negative.")
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        tree, n = self._tree, self.size
+        i = index + 1
+        while i <= n:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index):
+        """Returns the sum of the first `index` weights."""
+        tree = self._tree
+        total = 0.
+        i = index
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    @property
+    def total(self):
+        return self.prefix(self.size)
+
+    def find(self, x):
+        """Returns the smallest index whose prefix sum (inclusive) exceeds
+        `x`."""
+        tree, n = self._tree, self.size
+        i = 0
+        step = self._top
+        while step:
+            j = i + step
+            if j <= n and tree[j] <= x:
+                i = j
+                x -= tree[j]
+            step //= 2
+        return i
+
+    def draw(self, start=0, stop=None, rng=random):
+        """Returns an index in `range(start, stop)` drawn with probability
+        proportional to its weight."""
+        stop = self.size if stop is None else stop
+        low = self.prefix(start)
+        mass = self.prefix(stop) - low
+        if mass <= 0:
+            raise ValueError("No items with positive weight to draw from.")
+        while True:
+            index = self.find(low + rng.random() * mass)
+            # round-off can land just outside the range or on a zero weight
+            index = min(max(index, start), stop - 1)
+            if self.weights[index] > 0:
+                return index
+
+
+class AdaptiveSampler(object):
+    """Draws items from the product of `dims` with adaptive weights.
+
+    Args:
+        dims (list): a list of lists of values.  Items are tuples with one
+            value from each.
+        base (sequence, optional): a weight for every item (in row-major
+            order), e.g. zero for items that aren't valid questions.
+            Defaults to uniform.
+        miss_factor (float): a missed item's weight is multiplied by this.
+        hit_factor (float): a correctly answered item's weight is multiplied
+            by this.
+        min_factor, max_factor (float): bounds on the accumulated factors,
+            so mastered items still come up occasionally.
+        rng (random.Random, optional): the random number generator to use.
+    """
+    def __init__(self, dims, base=None, miss_factor=2., hit_factor=0.7,
+                 min_factor=0.1, max_factor=20., rng=None):
+        self.dims = [list(d) for d in dims]
+        self._lookup = [dict((v, k) for k, v in enumerate(d))
+                        for d in self.dims]
+        self._strides = []
+        size = 1
+        for d in reversed(self.dims):
+            self._strides.insert(0, size)
+            size *= len(d)
+        if base is None:
+            base = array('d', [1.]) * size
+        self.base = array('d', base)
+        if len(self.base) != size:
+            raise ValueError("Expected {} base weights, got {}."
+                             "".format(size, len(self.base)))
+        self.miss_factor = miss_factor
+        self.hit_factor = hit_factor
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.rng = rng or random
+        self.factors = {}  # only items that have been answered
+        self.tree = SumTree(self.base)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.base)
+
+    def index(self, item):
+        return sum(self._lookup[k][v] * s
+                   for k, (v, s) in enumerate(zip(item, self._strides)))
+
+    def item(self, index):
+        out = []
+        for d, s in zip(self.dims, self._strides):
+            out.append(d[index // s])
+            index %= s
+        return tuple(out)
+
+    def weight(self, item):
+        index = self.index(item)
+        return self.base[index] * self.factors.get(index, 1.)
+
+    def sample(self, prefix=(), low=None, high=None):
+        """Draws an item whose leading values equal `prefix`.  If `low`
+        and/or `high` are given, the next value is also restricted to those
+        between them (inclusive) in its dimension's order."""
+        start = sum(self._lookup[k][v] * s for k, (v, s)
+                    in enumerate(zip(prefix, self._strides)))
+        k = len(prefix)
+        stride = self._strides[k - 1] if k else len(self.base)
+        stop = start + stride
+        if k < len(self.dims) and (low is not None or high is not None):
+            s = self._strides[k]
+            if high is not None:
+                stop = start + (self._lookup[k][high] + 1) * s
+            if low is not None:
+                start += self._lookup[k][low] * s
+        with self._lock:
+            return self.item(self.tree.draw(start, stop, self.rng))
+
+    def update(self, item, correct):
+        """Raises (if not `correct`) or lowers the weight of `item`."""
+        index = self.index(item)
+        with self._lock:
+            factor = self.factors.get(index, 1.)
+            if correct:
+                factor = max(self.min_factor, factor * self.hit_factor)
+            else:
+                factor = min(self.max_factor, factor * self.miss_factor)
+            self.factors[index] = factor
+            self.tree.set(index, self.base[index] * factor)
+
+
+def choose(session, name, dims, prefix=()):
+    """Picks an item (a tuple of one value from each of `dims`, beginning
+    with `prefix`) for a question.
+
+    If `session` is given, the item is drawn from the session's adaptive
+    sampler `name` for these `dims`, otherwise uniformly.  Returns
+    `(item, sampler)`, with `sampler` None for uniform draws."""
+    if session is None:
+        return (tuple(prefix) + tuple(random.choice(d)
+                                      for d in dims[len(prefix):]), None)
+    sampler = session.sampler((name,) + tuple(tuple(d) for d in dims),
+                              lambda: AdaptiveSampler(dims))
+    return sampler.sample(prefix), sampler
+
+
+def benchmark(size=500000, draws=100000):
+    """Times drawing from and updating a sampler with `size` items.  Returns
+    seconds per operation."""
+    import time
+    sampler = AdaptiveSampler([range(size)])
+    start = time.time()
+    for _ in range(draws):
+        item = sampler.sample()
+    draw = (time.time() - start) / draws
+    start = time.time()
+    for k in range(draws):
+        sampler.update((k,), k % 3 == 0)
+    update = (time.time() - start) / draws
+    return {'size': size, 'sample': draw, 'update': update}
+
+
+if __name__ == '__main__':
+    for k, v in sorted(benchmark().items()):
+        print("{:>7}: {}".format(k, v))
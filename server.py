@@ -0,0 +1,310 @@
+"""Local server mode: many students, one process.
+
+Instead of one `earthosenotes.py` process per seat, a single asyncio server
+hosts a `Session` per connected client.  All clients share one loaded
+soundfont (via `FluidSynthRenderer`) and one question generator; questions
+are rendered to audio on the server and streamed to the client.
+
+The protocol is newline-delimited JSON over TCP.  Client messages:
+    {"type": "question"}               -> audio chunks, then a question
+    {"type": "repeat"}                 -> the current question again
+    {"type": "answer", "notes": [...]} -> feedback (once per question)
+    {"type": "score"}                  -> score
+    {"type": "bye"}
+Notes are MIDI numbers (e.g. 60 for C-4) or note names (e.g. "C-4").
+
+Usage:
+    $ python server.py serve --port 8765
+    $ python server.py loadtest --clients 50 --questions 20 --spawn
+
+Requires python 3."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Internal Dependencies
+import settings as st
+from musictools import get_diatonic, parse2note
+from notenames import make_note
+from game_structure import SettingsContainer
+from session import Session
+from new_question import prepare_rn
+from grading import align
+
+
+LINE_LIMIT = 2 ** 24  # max message size in bytes (audio is sent as base64)
+
+
+def default_settings(key='C', low='E-2', high='C-7', max_int=12,
+                     notes_per_phrase=3, bpm=40):
+    """Returns game settings (as `earthosenotes.create_new_game()` would)
+    shared by all clients of a server."""
+    minor = key == key.lower()
+    key = key[0].upper() + key[1:]
+    return SettingsContainer({'chord_type': 'note',
+                              'notes_per_phrase': notes_per_phrase,
+                              'bpm': bpm,
+                              'low': low,
+                              'high': high,
+                              'key': key,
+                              'max_int': max_int,
+                              'listener': None,
+                              'scale': get_diatonic(key, minor=minor),
+                              'minor': minor,
+                              'sound_font': st.SOUNDFONT,
+                              'single_notes': True})
+
+
+def parse_wire_note(x):
+    """Converts a note received from a client (MIDI number or name)."""
+    if isinstance(x, int):
+        return make_note(x - 12)  # mingus ints are MIDI numbers - 12
+    return parse2note(x)
+
+
+def _encode(msg):
+    return (json.dumps(msg) + '\n').encode('utf-8')
+
+
+async def _recv(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    return json.loads(line.decode('utf-8'))
+
+
+class QuestionServer(object):
+    """Serves questions to any number of concurrent clients.
+
+    Args:
+        settings (SettingsContainer): game settings shared by all sessions.
+        renderer (FluidSynthRenderer, optional): if given, questions are
+            rendered to audio and streamed to clients.
+        audio_chunk (float): length (in seconds) of each streamed audio chunk.
+    """
+    def __init__(self, settings, renderer=None, audio_chunk=0.25):
+        self.settings = settings
+        self.renderer = renderer
+        self.audio_chunk = audio_chunk
+        self.sessions = set()
+        # the renderer is shared, so renders are run one at a time off the
+        # event loop
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # questions are prepared off the event loop too, several at once
+        # (they only read the shared settings)
+        self._prepare_executor = ThreadPoolExecutor()
+
+    async def start(self, host='127.0.0.1', port=8765):
+        return await asyncio.start_server(self.handle, host, port,
+                                          limit=LINE_LIMIT)
+
+    async def handle(self, reader, writer):
+        session = Session(self.settings)
+        self.sessions.add(session)
+        try:
+            while True:
+                msg = await _recv(reader)
+                if msg is None or msg.get('type') == 'bye':
+                    break
+                for reply in await self.respond(session, msg):
+                    writer.write(_encode(reply))
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            print("Client error:", e)
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+
+    async def respond(self, session, msg):
+        """Returns the list of replies to client message `msg`."""
+        kind = msg.get('type')
+        if kind == 'repeat':
+            session.new_question = False
+            return await self.question(session)
+        if kind == 'question':
+            return await self.question(session)
+        if kind == 'answer':
+            return [self.feedback(session, msg.get('notes', []))]
+        if kind == 'score':
+            return [{'type': 'score', 'score': session.score,
+                     'count': session.count}]
+        return [{'type': 'error',
+                 'message': "Unknown message type {}".format(kind)}]
+
+    async def question(self, session):
+        gst = session.settings
+        loop = asyncio.get_event_loop()
+        if session.new_question or session.current_q_info is None:
+            try:
+                previous_note = session.current_q_info['notes'][-1]
+            except (TypeError, KeyError, IndexError):
+                previous_note = None
+            q_info = await loop.run_in_executor(self._prepare_executor,
+                                                prepare_rn, gst,
+                                                previous_note)
+            session.count += 1
+            session.current_q_info = q_info
+            session.new_question = False
+        notes = session.current_q_info['notes']
+        tl = session.current_q_info['timeline']
+
+        replies = []
+        if self.renderer is not None:
+            pcm = await loop.run_in_executor(self._executor,
+                                             self.renderer.render, tl)
+            step = max(1, int(self.audio_chunk * self.renderer.samplerate))
+            for seq, k in enumerate(range(0, len(pcm), step)):
+                data = base64.b64encode(pcm[k:k + step].tobytes())
+                replies.append({'type': 'audio', 'seq': seq,
+                                'data': data.decode('ascii')})
+        replies.append({'type': 'question',
+                        'count': session.count,
+                        'num_notes': len(notes),
+                        'duration': tl.duration,
+                        'samplerate': (self.renderer.samplerate
+                                       if self.renderer is not None else None),
+                        'audio_chunks': len(replies)})
+        return replies
+
+    def feedback(self, session, answer):
+        if session.current_q_info is None:
+            return {'type': 'error', 'message': "No question to answer."}
+        if session.current_q_info.get('answered'):
+            return {'type': 'error',
+                    'message': "Already answered; ask for the next "
+                               "question."}
+        correct_notes = session.current_q_info['notes']
+        try:
+            user_notes = [parse_wire_note(x) for x in answer]
+        except Exception:
+            return {'type': 'error',
+                    'message': "Could not parse answer {}".format(answer)}
+        alignment = align(correct_notes, user_notes)
+        correct = alignment.correct
+        if correct:
+            session.score += 1
+        session.current_q_info['answered'] = True  # until the next question
+        session.new_question = True
+        return {'type': 'feedback',
+                'correct': correct,
+                'notes_correct': alignment.credit,
+                'missed': alignment.deletions,
+                'extra': alignment.insertions,
+                'correct_answer': [x.name for x in correct_notes],
+                'score': session.score,
+                'count': session.count}
+
+
+###############################################################################
+### load test #################################################################
+###############################################################################
+
+async def _student(host, port, questions, latencies):
+    reader, writer = await asyncio.open_connection(host, port,
+                                                   limit=LINE_LIMIT)
+    try:
+        for _ in range(questions):
+            writer.write(_encode({'type': 'question'}))
+            await writer.drain()
+            msg = await _recv(reader)
+            while msg['type'] == 'audio':
+                msg = await _recv(reader)
+            answer = [random.randint(40, 96) for _ in range(msg['num_notes'])]
+
+            start = time.perf_counter()
+            writer.write(_encode({'type': 'answer', 'notes': answer}))
+            await writer.drain()
+            msg = await _recv(reader)
+            latencies.append(time.perf_counter() - start)
+        writer.write(_encode({'type': 'bye'}))
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def load_test(host='127.0.0.1', port=8765, clients=50, questions=20):
+    """Runs `clients` concurrent simulated students, each answering
+    `questions` questions, and returns throughput and answer-to-feedback
+    latency statistics."""
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[_student(host, port, questions, latencies)
+                           for _ in range(clients)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p):
+        return 1000 * latencies[min(len(latencies) - 1,
+                                    int(p * len(latencies)))]
+    return {'clients': clients,
+            'questions': len(latencies),
+            'seconds': elapsed,
+            'questions_per_second': len(latencies) / elapsed,
+            'p50_ms': percentile(0.5),
+            'p99_ms': percentile(0.99)}
+
+
+def get_user_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command')
+    serve = subparsers.add_parser('serve', help="run the server")
+    loadtest = subparsers.add_parser('loadtest', help="run the load test")
+    for p in (serve, loadtest):
+        p.add_argument('--host', default='127.0.0.1')
+        p.add_argument('--port', type=int, default=8765)
+        p.add_argument('--no-audio', action='store_true',
+                       help="don't render/stream audio")
+        p.add_argument('--key', default='C')
+        p.add_argument('--notes', type=int, default=3,
+                       help="notes per phrase")
+        p.add_argument('--bpm', type=float, default=40)
+    loadtest.add_argument('--clients', type=int, default=50)
+    loadtest.add_argument('--questions', type=int, default=20)
+    loadtest.add_argument('--spawn', action='store_true',
+                          help="start a server in this process to test")
+    return parser.parse_args()
+
+
+def make_server(args):
+    renderer = None
+    if args.no_audio:
+        pass
+    elif st.AUDIO_BACKEND == 'samplebank':
+        from samplebank import SampleBank
+        renderer = SampleBank.load(st.SOUNDFONT)
+    else:
+        from audio_backend import FluidSynthRenderer
+        renderer = FluidSynthRenderer(st.SOUNDFONT)
+    settings = default_settings(key=args.key, notes_per_phrase=args.notes,
+                                bpm=args.bpm)
+    return QuestionServer(settings, renderer)
+
+
+async def _main(args):
+    if args.command == 'serve' or args.spawn:
+        server = await make_server(args).start(args.host, args.port)
+        port = server.sockets[0].getsockname()[1]
+        print("Serving on {}:{}".format(args.host, port))
+        if args.command == 'serve':
+            async with server:
+                await server.serve_forever()
+    else:
+        port = args.port
+    results = await load_test(args.host, port, args.clients, args.questions)
+    print(json.dumps(results, indent=2))
+    if args.spawn:
+        server.close()
+        await server.wait_closed()
+
+
+if __name__ == '__main__':
+    asyncio.run(_main(get_user_args()))
@@ -0,0 +1,195 @@
+"""Per-student game state.
+
+Everything that changes as a student plays -- score, question count, current
+mode and question, and the settings the menu commands change (the key, BPM
+and so on, see `game_modes.mode_settings()`) -- lives on a `Session` that is
+passed through question generation, evaluation and the menu commands.
+Nothing that changes is stored in module globals, so one process can host
+any number of independent sessions."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import time
+from collections import deque
+
+# Internal Dependencies
+from instrument import instruments
+
+try:
+    monotonic = time.monotonic
+except AttributeError:  # python 2
+    monotonic = time.time
+try:
+    _input = raw_input
+except NameError:  # python 3
+    _input = input
+
+
+class Session(object):
+    """The state of one student's game.
+
+    Args:
+        settings (SettingsContainer, optional): the game settings, as
+            created by `earthosenotes.game_menu()`.  The chord game modes
+            keep the settings their menu commands change on it, so give
+            each session its own if they play those modes.
+        mode (GameMode, optional): the initial game mode.
+
+    Attributes:
+        new_question (bool): if False, the next call to a `new_question_*`
+            function repeats the current question.
+        current_q_info (dict): whatever the current question needs to be
+            repeated or evaluated.
+        prefetcher (QuestionPrefetcher): if set, new questions are taken
+            from it (see `prefetch.py`).
+        latencies (deque): recent answer-to-next-sound latencies in seconds.
+        recorders (list): objects with a `record_attempt` method (e.g. see
+            `store.GameStore.recorder()`) that every graded answer is passed
+            to.
+        samplers (dict): the session's adaptive question samplers (see
+            `sampler.py`).
+        answerer (callable): if set, called as `answerer(session, prompt)`
+            instead of asking the user for answers (see `simulate.py`).
+        keyboard (getch.KeyboardReader): if set, answers are read through
+            it, and its hotkeys interrupt playback and listening.
+    """
+    __slots__ = ('settings', 'current_mode', 'current_q_info', 'new_question',
+                 'score', 'count', 'alternative_chord_tone_resolution',
+                 'prefetcher', 'answered_at', 'sounded_at', 'latencies',
+                 'recorders', 'samplers', 'answerer', 'keyboard',
+                 '__weakref__')
+
+    def __init__(self, settings=None, mode=None):
+        self.settings = settings
+        self.current_mode = mode
+        self.current_q_info = None
+        self.new_question = True
+        self.score = 0
+        self.count = 0
+        self.alternative_chord_tone_resolution = 2
+        self.prefetcher = None
+        self.answered_at = None
+        self.sounded_at = None
+        self.latencies = deque(maxlen=1000)
+        self.recorders = []
+        self.samplers = {}
+        self.answerer = None
+        self.keyboard = None
+
+    def input(self, prompt=''):
+        """Returns the user's (or the `answerer`'s) answer to `prompt`."""
+        if self.answerer is not None:
+            return self.answerer(self, prompt)
+        if self.keyboard is not None:
+            return self.keyboard.readline(prompt)
+        return _input(prompt)
+
+    def getch(self, prompt=None):
+        """Like `input()`, but for single key press answers."""
+        if self.answerer is not None:
+            return self.answerer(self, prompt)
+        if self.keyboard is not None:
+            return self.keyboard.getch(prompt)
+        from getch import getch
+        return getch(prompt)
+
+    @property
+    def interrupt(self):
+        """The keyboard's hotkey event (or None), which interrupts playback
+        and cancels listening."""
+        return self.keyboard.interrupt if self.keyboard is not None else None
+
+    def play(self, timeline):
+        """Plays a question's `Timeline`, stopping early if one of the
+        keyboard's hotkeys is pressed."""
+        return timeline.play(interrupt=self.interrupt)
+
+    def invalidate_prefetch(self):
+        """Call whenever a setting that affects question generation changes.
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.invalidate()
+
+    def mark_answered(self):
+        """Call once an answer has been graded."""
+        self.answered_at = monotonic()
+        instruments.question_done()
+
+    def mark_sound(self):
+        """Call right before the next question starts to play."""
+        self.sounded_at = monotonic()
+        if self.answered_at is not None:
+            self.latencies.append(self.sounded_at - self.answered_at)
+            self.answered_at = None
+
+    def record_attempt(self, mode, key, target, answer, correct):
+        """Passes a graded answer on to the session's recorders.  `target`
+        and `answer` are lists of ints.  The answer latency is measured from
+        the last call to `mark_sound()`."""
+        if not self.recorders:
+            return
+        latency = None
+        if self.sounded_at is not None:
+            latency = monotonic() - self.sounded_at
+        for recorder in self.recorders:
+            recorder.record_attempt(mode, key, target, answer, correct,
+                                    latency)
+
+    def sampler(self, key, create):
+        """Returns the session's sampler for `key`, calling `create()` to
+        make it the first time."""
+        try:
+            return self.samplers[key]
+        except KeyError:
+            return self.samplers.setdefault(key, create())
+
+    def adapt(self, correct):
+        """Updates the adaptive sampler that chose the current question.
+        `correct` is a bool, or a list of bools with one for each of the
+        question's 'items' (None for items that weren't graded)."""
+        q_info = self.current_q_info
+        if not q_info or q_info.get('sampler') is None:
+            return
+        items = q_info['items']
+        if not isinstance(correct, (list, tuple)):
+            correct = [correct] * len(items)
+        for item, item_correct in zip(items, correct):
+            if item_correct is not None:
+                q_info['sampler'].update(item, item_correct)
+
+    def latency_summary(self):
+        """Returns answer-to-next-sound latency statistics in milliseconds."""
+        ordered = sorted(self.latencies)
+        if not ordered:
+            return {'questions': 0, 'mean_ms': 0., 'p99_ms': 0.}
+        return {'questions': len(ordered),
+                'mean_ms': 1000 * sum(ordered) / len(ordered),
+                'p99_ms': 1000 * ordered[min(len(ordered) - 1,
+                                             int(0.99 * len(ordered)))]}
+
+    def reset_score(self):
+        self.score = 0
+        self.count = 0
+
+    def print_score(self):
+        """Prints the running score (if any questions have been asked)."""
+        if self.count:
+            print("score: {} / {} = {:.2%}".format(self.score, self.count,
+                                                    self.score/self.count))
+
+
+def session_memory(n=1000, settings=None):
+    """Returns the approximate memory (in bytes) used per `Session`,
+    measured by creating `n` sessions (sharing `settings`)."""
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        sessions = [Session(settings) for _ in range(n)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del sessions
+    return (after - before) / n
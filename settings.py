@@ -120,12 +120,16 @@
 # NAME_INTERVAL = False
 
 import os
-# Inelegant storage
-NEWQUESTION = True
-CURRENT_MODE = None
-CURRENT_Q_INFO = None
-SCORE = 0
-COUNT = 0
-ALTERNATIVE_CHORD_TONE_RESOLUTION = 2
+# Note: per-student game state (score, current question, etc.) is stored on a
+# `session.Session` object.
+PREFETCH_DEPTH = 2  # questions prepared in advance, 0 to disable prefetching
+INSTRUMENT = False  # record per-stage timings (see instrument.py)
+PROFILE_EVERY = 0  # if instrumenting, cProfile every Nth question (0: never)
+MAX_MISSES = 2  # stop listening after this many wrong notes (0: never)
+AUDIO_BACKEND = 'fluidsynth'  # or 'samplebank' (see samplebank.py)
+MIC_PROCESS = False  # detect sung notes in separate processes (mic_process.py)
+LISTEN_TIMEOUT = 60  # seconds to wait for a whole answer (None: forever)
+LISTEN_IDLE_TIMEOUT = 15  # seconds to wait for each note (None: forever)
+SIGHT_SINGING = False  # with a microphone, show the notes to sing (contour.py)
 SOUNDFONT = os.path.join(os.path.dirname(__file__),
                          "fluid-soundfont", "FluidR3 GM2-2.SF2")
\ No newline at end of file
@@ -0,0 +1,369 @@
+"""Headless simulation of the game loop.
+
+Runs the real `new_question_*` functions with answers supplied by scripted
+or probabilistic agents instead of the keyboard/microphone, and with a
+`NullBackend` whose virtual clock makes all playback (including
+`play_wait`) cost no wall time.  Reports throughput and the time spent in
+each stage of the question loop:
+
+    prepare  picking and voicing the question
+    sound    playing it
+    answer   the agent answering
+    grade    grading, feedback and any resolution that follows
+
+Usage:
+    $ python simulate.py --mode all --questions 2000 --accuracy 0.7
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import sys
+import time
+import json
+import random
+import argparse
+import itertools
+from collections import OrderedDict
+
+# Internal Dependencies
+import settings as st
+import audio_backend
+from audio_backend import NullBackend, set_backend
+from game_structure import SettingsContainer
+from musictools import get_diatonic, parse2note
+from session import Session
+from listening import ListenResult, STOPPED
+import instrument
+
+# External Dependencies
+from mingus.containers import Note
+
+try:
+    perf_counter = time.perf_counter
+except AttributeError:  # python 2
+    perf_counter = time.time
+
+
+MODES = ['random_notes', 'interval', 'single_chord', 'progression',
+         'chord_tone']
+STAGES = ['prepare', 'sound', 'answer', 'grade']
+
+# The game mode settings (see the commented out defaults in settings.py)
+GAME_MODE_DEFAULTS = OrderedDict([
+    ('KEY', 'C'),
+    ('BPM', 60.),
+    ('I', 'I'), ('II', 'II'), ('III', 'III'), ('IV', 'IV'), ('V', 'V'),
+    ('VI', 'VI'), ('VII', 'VII'),
+    ('TONES', [1, 3, 5]),
+    ('CADENCE', ['I', 'IV', 'V', 'I']),
+    ('NUMERALS', ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII']),
+    ('PROG_LENGTHS', range(2, 5)),
+    ('CHORD_LENGTHS', range(1, 3)),
+    ('RESOLVE_WHEN_INCORRECT', True),
+    ('RESOLVE_WHEN_CORRECT', True),
+    ('ARPEGGIATE_WHEN_CORRECT', True),
+    ('ARPEGGIATE_WHEN_INCORRECT', True),
+    ('INTERVALS', [2, 3, 4, 5, 6, 7, 8]),
+    ('INTERVAL_MODE', 'ascending'),
+    ('HARMONIC_INTERVALS', False),
+    ('MANY_OCTAVES', False),
+    ('OCTAVES', range(1, 8)),
+    ('DEFAULT_IOCTAVE', 4),
+    ('FIXED_ROOT', 0),
+    ('NAME_INTERVAL', False),
+])
+
+
+def apply_game_mode_defaults():
+    """Sets any game mode settings missing from `settings`."""
+    for name, value in GAME_MODE_DEFAULTS.items():
+        if not hasattr(st, name):
+            setattr(st, name, value)
+
+
+def rn_settings(key='C', low='E-2', high='C-7', max_int=12,
+                notes_per_phrase=3, bpm=60, listener=None):
+    """Returns settings for random notes mode."""
+    minor = key == key.lower()
+    key = key[0].upper() + key[1:]
+    return SettingsContainer({'chord_type': 'note',
+                              'notes_per_phrase': notes_per_phrase,
+                              'bpm': bpm,
+                              'low': low,
+                              'high': high,
+                              'key': key,
+                              'max_int': max_int,
+                              'listener': listener,
+                              'scale': get_diatonic(key, minor=minor),
+                              'minor': minor,
+                              'sound_font': st.SOUNDFONT,
+                              'single_notes': True})
+
+
+###############################################################################
+### answer agents #############################################################
+###############################################################################
+
+class ScriptedAgent(object):
+    """Answers with `answers` (strings, as typed by a user), in order,
+    cycling when they run out.  Random notes questions are answered with
+    the note names in each string."""
+    def __init__(self, answers):
+        self._answers = itertools.cycle(answers)
+
+    def __call__(self, session, prompt):
+        return next(self._answers)
+
+    def answer_notes(self, session, correct_notes):
+        return next(self._answers).split()
+
+
+class ProbabilisticAgent(object):
+    """Answers each question correctly with probability `accuracy`,
+    otherwise gives a random wrong answer."""
+    def __init__(self, accuracy=0.7, seed=None):
+        self.accuracy = accuracy
+        self.rng = random.Random(seed)
+
+    def __call__(self, session, prompt):
+        from game_modes import mode_settings
+        q_info = session.current_q_info
+        correct = self.rng.random() < self.accuracy
+        return getattr(self, '_' + session.current_mode.name)(
+            q_info, correct, mode_settings(session))
+
+    def _wrong(self, value, choices):
+        return self.rng.choice([x for x in choices if x != value])
+
+    def _digits(self, digits, correct, choices):
+        if not correct:
+            k = self.rng.randrange(len(digits))
+            digits[k] = self._wrong(digits[k], choices)
+        return "".join(str(x) for x in digits)
+
+    def _interval(self, q_info, correct, gst):
+        degrees = [q_info['diatonic'].note2degree(x)
+                   for x in q_info['interval']]
+        return self._digits(degrees, correct, range(1, 8))
+
+    def _single_chord(self, q_info, correct, gst):
+        degree = gst.NUMERALS.index(q_info['numeral']) + 1
+        return self._digits([degree], correct, range(1, 8))
+
+    def _progression(self, q_info, correct, gst):
+        degrees = [gst.NUMERALS.index(x) + 1 for x in q_info['prog']]
+        return self._digits(degrees, correct, range(1, 8))
+
+    def _chord_tone(self, q_info, correct, gst):
+        tone = q_info['tone']
+        answer = st.TONES[[x for x in q_info['chord']].index(tone)]
+        return str(answer if correct else self._wrong(answer, st.TONES))
+
+    def answer_notes(self, session, correct_notes):
+        notes = [int(x) for x in correct_notes]
+        if self.rng.random() >= self.accuracy:
+            k = self.rng.randrange(len(notes))
+            notes[k] += self.rng.randint(1, 11)
+        return [Note().from_int(x) for x in notes]
+
+
+class AgentListener(object):
+    """Stands in for a `MicListener` in random notes mode, answering with
+    `agent.answer_notes()`."""
+    def __init__(self, agent):
+        self.agent = agent
+        self.session = None
+
+    def listen(self, notes, instrument_range=None, on_note=None, **kwargs):
+        heard = ListenResult()
+        for note in self.agent.answer_notes(self.session, notes):
+            heard.append(parse2note(note))
+            if on_note is not None and on_note(heard[-1]):
+                heard.status = STOPPED
+                break
+        return heard
+
+
+###############################################################################
+### simulation ################################################################
+###############################################################################
+
+class StageTimer(object):
+    """Accumulates the time spent in each stage of the question loop."""
+    def __init__(self):
+        self.times = dict((stage, []) for stage in STAGES)
+        self.questions = 0
+        self._stage = None
+        self._start = None
+
+    def start(self, stage):
+        now = perf_counter()
+        if self._stage is not None:
+            self.times[self._stage].append(now - self._start)
+        self._stage, self._start = stage, now
+
+    def stop(self):
+        self.start(None)
+
+    def summary(self):
+        out = OrderedDict()
+        for stage in STAGES:
+            t = sorted(self.times[stage])
+            if t:
+                out[stage] = {
+                    'mean_us': 1e6 * sum(t) / len(t),
+                    'p99_us': 1e6 * t[min(len(t) - 1, int(0.99 * len(t)))],
+                    'total_s': sum(t)}
+        return out
+
+
+class SimulatedSession(Session):
+    """A `Session` that reports the stages of each question to a
+    `StageTimer`."""
+    __slots__ = ('timer',)
+
+    def mark_sound(self):
+        self.timer.start('sound')
+        Session.mark_sound(self)
+
+    def mark_answered(self):
+        Session.mark_answered(self)
+        self.timer.questions += 1
+        self.timer.stop()
+
+
+class _TimedProducer(object):
+    """Used as a session's `prefetcher`, so that question preparation is
+    timed (and done inline)."""
+    def __init__(self, produce, timer):
+        self.produce = produce
+        self.timer = timer
+
+    def get(self):
+        self.timer.start('prepare')
+        return self.produce()
+
+    def invalidate(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _Timed(object):
+    """Wraps an agent (or `AgentListener.listen`) to time the answer."""
+    def __init__(self, fcn, timer):
+        self.fcn = fcn
+        self.timer = timer
+
+    def __call__(self, *args, **kwargs):
+        self.timer.start('answer')
+        try:
+            return self.fcn(*args, **kwargs)
+        finally:
+            self.timer.start('grade')
+
+
+class _NullOutput(object):
+    def write(self, s):
+        pass
+
+    def flush(self):
+        pass
+
+
+def simulate(mode='random_notes', questions=1000, agent=None, seed=0,
+             settings=None, quiet=True):
+    """Plays `questions` questions of game `mode` with `agent` (by default a
+    70% accurate `ProbabilisticAgent`) answering.  Returns a dictionary of
+    results."""
+    import game_modes
+    from new_question import new_question_rn, prepare_rn
+
+    apply_game_mode_defaults()
+    random.seed(seed)
+    agent = agent or ProbabilisticAgent(seed=seed)
+    timer = StageTimer()
+
+    session = SimulatedSession(settings)
+    session.timer = timer
+    if mode == 'random_notes':
+        listener = AgentListener(agent)
+        listener.listen = _Timed(listener.listen, timer)
+        listener.session = session
+        session.settings = settings or rn_settings()
+        session.settings.listener = listener
+        previous = {'note': None}
+
+        def produce():
+            q_info = prepare_rn(session.settings, previous['note'], session)
+            previous['note'] = q_info['notes'][-1]
+            return q_info
+        play = new_question_rn
+    else:
+        session.current_mode = game_modes.game_modes[mode]
+        session.answerer = _Timed(agent, timer)
+
+        def produce():
+            return session.current_mode.prepare(session)
+        play = session.current_mode.new_question
+    session.prefetcher = _TimedProducer(produce, timer)
+
+    previous_backend = audio_backend._backend
+    set_backend(NullBackend(record=False))
+    stdout = sys.stdout
+    if quiet:
+        sys.stdout = _NullOutput()
+    try:
+        start = perf_counter()
+        while timer.questions < questions:
+            play(session)
+        elapsed = perf_counter() - start
+    finally:
+        sys.stdout = stdout
+        set_backend(previous_backend)
+
+    return OrderedDict([('mode', mode),
+                        ('questions', timer.questions),
+                        ('seconds', elapsed),
+                        ('questions_per_second', timer.questions / elapsed),
+                        ('score', session.score),
+                        ('stages', timer.summary())])
+
+
+def get_user_args():
+    parser = argparse.ArgumentParser(description="Simulate the game loop.")
+    parser.add_argument('--mode', default='all', choices=['all'] + MODES)
+    parser.add_argument('--questions', type=int, default=2000)
+    parser.add_argument('--accuracy', type=float, default=0.7,
+                        help="probability that the agent answers correctly")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--instrument', action='store_true',
+                        help="also print per-function timings (see "
+                             "instrument.py) in the Prometheus text format")
+    parser.add_argument('--min-qps', type=float, default=0,
+                        help="exit with an error if any mode runs slower "
+                             "than this many questions per second")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_user_args()
+    modes = MODES if args.mode == 'all' else [args.mode]
+    if args.instrument:
+        instrument.enable()
+    results = [simulate(m, args.questions,
+                        ProbabilisticAgent(args.accuracy, args.seed),
+                        args.seed)
+               for m in modes]
+    print(json.dumps(results, indent=2))
+    if args.instrument:
+        print(instrument.instruments.prometheus_text())
+    slow = [r['mode'] for r in results
+            if r['questions_per_second'] < args.min_qps]
+    if slow:
+        print("Slower than {} questions/s: {}".format(args.min_qps,
+                                                     ", ".join(slow)))
+        sys.exit(1)
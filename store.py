@@ -0,0 +1,254 @@
+"""SQLite storage for saved games and answer history.
+
+Game configurations are stored as JSON in an indexed `games` table, so the
+game menu can list saved games without loading them.  Every graded question
+is stored as a row of the `attempts` table; attempts are buffered and
+inserted in batches by a writer thread, so the game loop never waits on the
+disk (only `flush()` and the queries wait for the writes).
+
+Run `python store.py` for a benchmark with 100k saved attempts."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import os
+import json
+import shutil
+import tempfile
+import sqlite3
+import threading
+import time
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    created REAL NOT NULL,
+    config TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_by_created ON games (created, id, name);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    game_id INTEGER NOT NULL REFERENCES games (id),
+    time REAL NOT NULL,
+    mode TEXT NOT NULL,
+    key TEXT NOT NULL,
+    target TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    latency REAL
+);
+CREATE INDEX IF NOT EXISTS attempts_by_game ON attempts (game_id, time);
+"""
+
+
+def _ints2str(ints):
+    return " ".join(str(int(x)) for x in ints)
+
+
+def _str2ints(s):
+    return [int(x) for x in s.split()]
+
+
+class GameStore(object):
+    """A SQLite database (in WAL mode) of saved games and attempts.
+
+    Args:
+        path (str): the database file, or ':memory:'.
+        batch_size (int): buffered attempts are handed to the writer thread
+            once this many have accumulated (and on `flush()`/`close()`).
+    """
+    def __init__(self, path, batch_size=64):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._lock = threading.Lock()  # for the connection
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.journal_mode = self.conn.execute(
+            "PRAGMA journal_mode=WAL").fetchone()[0]  # 'memory' in memory
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        self._batches = queue.Queue()
+        self._writer = threading.Thread(target=self._write_batches,
+                                        name='GameStoreWriter')
+        self._writer.daemon = True
+        self._writer.start()
+
+    # Games ###################################################################
+
+    def save_game(self, config, name=None):
+        """Saves a game configuration (a JSON-serializable dictionary) and
+        returns its id."""
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO games (name, created, config) VALUES (?, ?, ?)",
+                (name or '', time.time(), json.dumps(config)))
+            game_id = cur.lastrowid
+            if not name:
+                self.conn.execute("UPDATE games SET name = ? WHERE id = ?",
+                                  ("save{}".format(game_id), game_id))
+            self.conn.commit()
+        return game_id
+
+    def list_games(self):
+        """Returns a list of `(id, name)` tuples, oldest first.  Only the
+        index is read, no configurations are loaded."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT id, name FROM games INDEXED BY games_by_created "
+                "ORDER BY created, id").fetchall()
+
+    def load_game(self, game_id):
+        """Returns the configuration dictionary saved as `game_id`."""
+        with self._lock:
+            row = self.conn.execute("SELECT config FROM games WHERE id = ?",
+                                    (game_id,)).fetchone()
+        if row is None:
+            raise KeyError("No saved game with id {}".format(game_id))
+        return json.loads(row[0])
+
+    # Attempts ################################################################
+
+    def record_attempt(self, game_id, mode, key, target, answer, correct,
+                       latency=None, timestamp=None):
+        """Buffers an attempt.  `target` and `answer` are lists of ints."""
+        row = (game_id, time.time() if timestamp is None else timestamp,
+               mode, key, _ints2str(target), _ints2str(answer), int(correct),
+               latency)
+        with self._pending_lock:
+            self._pending.append(row)
+            if len(self._pending) < self.batch_size:
+                return
+            batch, self._pending = self._pending, []
+        self._batches.put(batch)
+
+    def _write_batches(self):
+        while True:
+            batch = self._batches.get()
+            try:
+                if batch is None:
+                    return
+                with self._lock:
+                    self.conn.executemany(
+                        "INSERT INTO attempts (game_id, time, mode, key, "
+                        "target, answer, correct, latency) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                    self.conn.commit()
+            except sqlite3.Error as e:
+                print("Couldn't save {} attempts: {}".format(len(batch), e))
+            finally:
+                self._batches.task_done()
+
+    def flush(self):
+        """Writes any buffered attempts, and waits until they're written."""
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if batch and self._writer.is_alive():
+            self._batches.put(batch)
+        self._batches.join()
+
+    def attempts(self, game_id):
+        """Returns a list of attempt dictionaries for `game_id`, oldest
+        first."""
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT time, mode, key, target, answer, correct, latency "
+                "FROM attempts WHERE game_id = ? ORDER BY time",
+                (game_id,)).fetchall()
+        return [{'time': t, 'mode': m, 'key': k, 'target': _str2ints(tg),
+                 'answer': _str2ints(a), 'correct': bool(c), 'latency': l}
+                for t, m, k, tg, a, c, l in rows]
+
+    def score(self, game_id):
+        """Returns `(number correct, number of attempts)` for `game_id`."""
+        self.flush()
+        with self._lock:
+            correct, count = self.conn.execute(
+                "SELECT TOTAL(correct), COUNT(*) FROM attempts "
+                "WHERE game_id = ?", (game_id,)).fetchone()
+        return int(correct), count
+
+    def recorder(self, game_id):
+        """Returns an object suitable for `Session.recorders` that records
+        attempts under `game_id`."""
+        return _GameRecorder(self, game_id)
+
+    def close(self):
+        self.flush()
+        if self._writer.is_alive():
+            self._batches.put(None)
+            self._writer.join()
+        self.conn.close()
+
+
+class _GameRecorder(object):
+    def __init__(self, store, game_id):
+        self.store = store
+        self.game_id = game_id
+
+    def record_attempt(self, mode, key, target, answer, correct,
+                       latency=None):
+        self.store.record_attempt(self.game_id, mode, key, target, answer,
+                                  correct, latency)
+
+
+def benchmark(n_attempts=100000, n_games=100, path=None):
+    """Times saving, listing and scoring with `n_attempts` saved attempts.
+    Returns a dictionary of timings in seconds.  By default the database is
+    a file in a temporary directory (so it's in WAL mode, as a saved game
+    database is; ':memory:' databases can't be), deleted afterwards."""
+    import random
+    if path is None:
+        directory = tempfile.mkdtemp()
+        try:
+            return benchmark(n_attempts, n_games,
+                             os.path.join(directory, 'games.db'))
+        finally:
+            shutil.rmtree(directory)
+    store = GameStore(path, batch_size=256)
+    results = {}
+
+    start = time.time()
+    ids = [store.save_game({'key': 'C', 'bpm': 40, 'notes_per_phrase': 3})
+           for _ in range(n_games)]
+    results['save_game'] = (time.time() - start) / n_games
+
+    start = time.time()
+    for k in range(n_attempts):
+        target = [random.randint(40, 96) for _ in range(3)]
+        store.record_attempt(ids[k % n_games], 'random_notes', 'C', target,
+                             target, random.random() < 0.7, 1.5)
+    store.flush()
+    results['record_attempt'] = (time.time() - start) / n_attempts
+
+    start = time.time()
+    games = store.list_games()
+    results['list_games'] = time.time() - start
+
+    start = time.time()
+    store.load_game(games[-1][0])
+    results['load_game'] = time.time() - start
+
+    start = time.time()
+    store.score(ids[0])
+    results['score'] = time.time() - start
+
+    start = time.time()
+    store.attempts(ids[0])
+    results['attempts'] = time.time() - start
+    store.close()
+    return results
+
+
+if __name__ == '__main__':
+    for k, v in sorted(benchmark().items()):
+        print("{:>15}: {:.3f}ms".format(k, 1000 * v))
@@ -0,0 +1,12 @@
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import os
+import sys
+
+# the game's modules are top-level modules in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# `test_interval.py` is a python 2 script (print statements)
+collect_ignore = ['test_interval.py'] if sys.version_info[0] >= 3 else []
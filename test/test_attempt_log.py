@@ -0,0 +1,60 @@
+"""Recording attempts and statistics in `attempt_log`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Internal Dependencies
+from attempt_log import AttemptLog, MODES, stats, key2pitch_class
+
+# External Dependencies
+import numpy as np
+
+
+def test_key2pitch_class():
+    assert key2pitch_class('C') == (0, False)
+    assert key2pitch_class('Eb') == (3, False)
+    assert key2pitch_class('f#') == (6, True)
+
+
+def test_record_and_load_across_chunks(tmp_path):
+    log = AttemptLog(str(tmp_path), chunk_rows=4)
+    for k in range(10):
+        log.record_attempt('interval', 'D', [50, 54], [50, 54 + k % 2],
+                           k % 2 == 0, latency=0.5, timestamp=k)
+    assert len(log) == 10
+    columns = log.load()
+    assert columns['time'].tolist() == list(range(10))
+    assert (columns['mode'] == MODES.index('interval')).all()
+    assert (columns['key'] == 2).all()
+    assert columns['answer'][1, :3].tolist() == [50, 55, -1]
+    log.close()
+
+    reopened = AttemptLog(str(tmp_path), chunk_rows=4)
+    reopened.record_attempt('random_notes', 'C', [48], [48], True)
+    assert len(reopened) == 11
+    assert reopened.load()['mode'][-1] == MODES.index('random_notes')
+
+
+def test_stats_aligns_answers(tmp_path):
+    log = AttemptLog(str(tmp_path))
+    # C major: do mi so, answered with a missed note, a wrong note, and
+    # a skipped note plus an extra one (which doesn't shift the rest)
+    log.record_attempt('random_notes', 'C', [48, 52, 55], [48, 55], False)
+    log.record_attempt('random_notes', 'C', [48, 52, 55], [48, 53, 55],
+                       False)
+    log.record_attempt('random_notes', 'C', [48, 52, 55, 59],
+                       [52, 55, 59, 60], False)
+    log.record_attempt('interval', 'G', [55, 59], [55, 59], True)
+    s = stats(log.load())
+
+    mode = MODES.index('random_notes')
+    assert s['mode_attempts'][mode] == 3 and s['mode_correct'][mode] == 0
+    assert s['missed'][mode] == 2 and s['extra'][mode] == 1
+    assert s['mode_correct'][MODES.index('interval')] == 1
+
+    # degree 3 (E): missed, wrong (answered 4), correct
+    assert s['degree_attempts'][4] == 3 + 1  # and B in G major
+    assert s['degree_correct'][4] == 1 + 1
+    assert s['confusion'][4, 5] == 1
+    assert s['confusion'][0].sum() == 3  # the skipped tonic isn't answered
+    assert np.sum(s['interval_attempts']) == 2 + 2 + 3 + 1
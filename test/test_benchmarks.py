@@ -0,0 +1,34 @@
+"""Baseline comparison in `benchmarks`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Internal Dependencies
+from benchmarks import compare, run_benchmarks
+
+
+def _results(relative, median, machine='x86_64'):
+    return {'machine': machine, 'cpu': 'cpu', 'python': '3', 'numpy': '2',
+            'benchmarks': {'a': {'relative': relative, 'median': median}}}
+
+
+def test_compares_relative_times():
+    baseline = _results(2., 1e-3)
+    # the whole machine is twice as slow: not a regression
+    assert compare(_results(2., 2e-3), baseline) == []
+    regressions = compare(_results(3., 1e-3), baseline, threshold=0.25)
+    assert regressions == [('a', 1e-3, 1e-3, 1.5)]
+
+
+def test_warns_about_another_machines_baseline(capsys):
+    compare(_results(2., 1e-3), _results(2., 1e-3))
+    assert 'Warning' not in capsys.readouterr().out
+    compare(_results(2., 1e-3), _results(2., 1e-3, machine='arm64'))
+    assert 'regenerate' in capsys.readouterr().out
+
+
+def test_results_have_relative_times():
+    result = run_benchmarks(['chordname'], repeat=2, min_time=0.001)
+    timing = result['benchmarks']['chordname']
+    assert timing['relative'] > 0 and timing['min'] <= timing['median']
+    assert set(result) >= {'machine', 'cpu', 'python', 'numpy'}
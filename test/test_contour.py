@@ -0,0 +1,96 @@
+"""Pitch tracking and scoring of sung phrases in `contour`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Internal Dependencies
+from contour import (ContourRecorder, Contour, yin, score_contour,
+                     synthetic_singing, YIN_WINDOW)
+from mic_listen import NoiseGate, FRAME_SIZE, FSAMP, number_to_freq
+
+# External Dependencies
+import numpy as np
+import pytest
+
+
+BPM = 120
+PHRASE = [60, 62, 64, 65, 67, 65, 64, 62]  # MIDI numbers
+
+
+def _record(audio, recorder=None):
+    if recorder is None:
+        recorder = ContourRecorder(48, 84)
+    for k in range(0, len(audio), FRAME_SIZE):
+        recorder.process(audio[k:k + FRAME_SIZE])
+    return recorder.contour()
+
+
+def _targets(midi_notes):
+    return [n - 12 for n in midi_notes]  # note ints
+
+
+def test_yin_finds_the_fundamental():
+    t = np.arange(YIN_WINDOW + 600) / FSAMP
+    frames = [sum(np.sin(2 * np.pi * k * f * t) / k for k in (1, 2, 3))
+              for f in (number_to_freq(57), 196., 523.25)]
+    freqs, confidence = yin(frames, FSAMP, YIN_WINDOW, 20, 600)
+    np.testing.assert_allclose(freqs, [220., 196., 523.25], rtol=2e-3)
+    assert (confidence > 0.9).all()
+
+
+def test_a_well_sung_phrase_scores_full_marks():
+    contour = _record(synthetic_singing(PHRASE, BPM))
+    assert len(contour) and not contour.failed
+    score = score_contour(contour, _targets(PHRASE), BPM)
+    assert score.correct and score.accuracy == 1.
+    assert score.cents_error < 20
+    assert score.timing_deviation < 0.1
+    assert score.tempo == pytest.approx(1., abs=0.1)
+    firsts = [k for k, _ in score.frames]
+    assert firsts == sorted(firsts) and score.frames[-1][1] == len(
+        contour.voiced()) - 1
+
+
+def test_a_wrong_note_is_found():
+    sung = list(PHRASE)
+    sung[3] += 1
+    score = score_contour(_record(synthetic_singing(sung, BPM)),
+                          _targets(PHRASE), BPM)
+    assert [k for k, ok in enumerate(score.credit) if not ok] == [3]
+    assert score.cents[3] == pytest.approx(100, abs=30)
+
+
+def test_octaves_are_forgiven():
+    sung = [n - 12 for n in PHRASE]
+    score = score_contour(_record(synthetic_singing(sung, BPM)),
+                          _targets(PHRASE), BPM)
+    assert score.correct
+
+
+def test_the_band_does_not_change_a_good_alignment():
+    contour = _record(synthetic_singing(PHRASE, BPM))
+    banded = score_contour(contour, _targets(PHRASE), BPM)
+    full = score_contour(contour, _targets(PHRASE), BPM, band=None)
+    assert banded.frames == full.frames
+
+
+def test_too_little_singing_gives_no_score():
+    assert score_contour(Contour([], [], []), _targets(PHRASE), BPM) is None
+    contour = _record(synthetic_singing(PHRASE[:1], BPM))
+    assert score_contour(contour, _targets(PHRASE * 20), BPM) is None
+
+
+@pytest.mark.parametrize('calibrated', [True, False])
+def test_singing_straight_away_is_heard(calibrated):
+    audio = synthetic_singing(PHRASE, BPM)
+    lead = int(0.5 * FSAMP) // 256 * 256  # of room noise
+    start = lead + int(0.1 * FSAMP)  # the first note has started
+    recorder = ContourRecorder(48, 84, gate=NoiseGate())
+    if calibrated:
+        recorder.gate.calibrate(audio[:lead].reshape(-1, 256))
+    contour = _record(audio[start:], recorder)
+    score = score_contour(contour, _targets(PHRASE), BPM)
+    if calibrated:
+        assert score.correct
+    else:  # the first note became the floor until the first breath
+        assert score.credit[1:] == [True] * (len(PHRASE) - 1)
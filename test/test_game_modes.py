@@ -0,0 +1,66 @@
+"""Menu commands of the chord game modes change only their own session."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Internal Dependencies
+import audio_backend
+from audio_backend import NullBackend, set_backend
+import game_modes
+from game_modes import (mode_settings, set_key, set_bpm, toggle_triads7ths,
+                        toggle_many_octaves, prepare_single_chord,
+                        prepare_progression)
+from session import Session
+from simulate import apply_game_mode_defaults, ScriptedAgent
+import settings as st
+
+# External Dependencies
+import pytest
+
+
+@pytest.fixture
+def sessions():
+    apply_game_mode_defaults()
+    previous = audio_backend._backend
+    set_backend(NullBackend(record=False))
+    sessions = []
+    for _ in range(2):
+        session = Session(mode=game_modes.game_modes['single_chord'])
+        session.answerer = ScriptedAgent(['a'])
+        sessions.append(session)
+    yield sessions
+    set_backend(previous)
+
+
+def test_settings_start_from_the_defaults(sessions):
+    gst = mode_settings(sessions[0])
+    assert (gst.KEY, gst.BPM, list(gst.NUMERALS)) == (st.KEY, st.BPM,
+                                                      list(st.NUMERALS))
+    assert mode_settings(sessions[0]) is gst
+    assert mode_settings() is st
+
+
+def test_menu_commands_change_only_their_session(sessions, capsys):
+    changed, other = sessions
+    changed.answerer = ScriptedAgent(['Eb', '90'])
+    set_key(changed)
+    set_bpm(changed)
+    toggle_triads7ths(changed)
+    toggle_many_octaves(changed)
+    assert 'KEY: Eb Maj' in capsys.readouterr().out
+
+    gst = mode_settings(changed)
+    assert (gst.KEY, gst.BPM, gst.I, gst.MANY_OCTAVES) == ('Eb', 90., 'I7',
+                                                           not st.MANY_OCTAVES)
+    assert gst.NUMERALS[4] == 'V7'
+    untouched = mode_settings(other)
+    assert (untouched.KEY, untouched.BPM, untouched.I) == (st.KEY, st.BPM,
+                                                           st.I)
+    assert (st.KEY, st.I) == ('C', 'I')
+
+    q_info = prepare_single_chord(changed)
+    assert q_info['numeral'].endswith('7') and len(q_info['chord']) == 4
+    assert q_info['timeline'].bpm == 90.
+    q_info = prepare_progression(other)
+    assert all(not x.endswith('7') for x in q_info['prog'])
+    assert q_info['timeline'].bpm == st.BPM
@@ -0,0 +1,77 @@
+"""The background `getch.KeyboardReader`, reading from a pipe."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import os
+import time
+
+# Internal Dependencies
+import getch
+from getch import KeyboardReader
+
+# External Dependencies
+import pytest
+
+
+@pytest.fixture
+def pipe():
+    read, write = os.pipe()
+    yield read, write
+    for fd in (read, write):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def _wait_for(condition, timeout=2.):
+    start = time.time()
+    while not condition() and time.time() - start < timeout:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_keys_typed_early_are_kept(pipe):
+    read, write = pipe
+    with KeyboardReader(fd=read) as keyboard:
+        assert getch._reader is keyboard
+        os.write(write, b'ab')
+        assert keyboard.getch(timeout=2) == 'a'
+        assert keyboard.getch(timeout=2) == 'b'
+        assert keyboard.getch(timeout=0.01) is None
+    assert getch._reader is None
+
+
+def test_readline_handles_backspace(pipe, capsys):
+    read, write = pipe
+    with KeyboardReader(fd=read) as keyboard:
+        os.write(write, b'cx\x7fd\n')
+        assert keyboard.readline("Answer: ") == 'cd'
+    assert capsys.readouterr().out.startswith("Answer: ")
+
+
+def test_hotkeys_set_the_interrupt_until_read(pipe):
+    read, write = pipe
+    with KeyboardReader(hotkeys='x', fd=read) as keyboard:
+        os.write(write, b'cx')
+        assert _wait_for(keyboard.interrupt.is_set)
+        assert keyboard.getch(timeout=2) == 'c'
+        assert keyboard.interrupt.is_set()  # 'x' is still queued
+        assert keyboard.getch(timeout=2) == 'x'
+        assert not keyboard.interrupt.is_set()
+
+        os.write(write, b'x')
+        assert _wait_for(keyboard.interrupt.is_set)
+        keyboard.clear()
+        assert not keyboard.interrupt.is_set()
+        assert keyboard.getch(timeout=0.01) is None
+
+
+def test_end_of_input(pipe):
+    read, write = pipe
+    with KeyboardReader(fd=read) as keyboard:
+        os.close(write)
+        assert keyboard.getch(timeout=2) == ''
+        assert keyboard.getch() == ''
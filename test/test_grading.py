@@ -0,0 +1,133 @@
+"""Alignment scores from `grading`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Internal Dependencies
+from grading import align, align_batch, StreamingGrader
+
+# External Dependencies
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('target, answer, credit, distance, ins, dels, subs', [
+    ([48, 52, 55], [48, 52, 55], [True, True, True], 0, 0, 0, 0),
+    ([48, 52, 55], [60, 64, 67], [True, True, True], 0, 0, 0, 0),  # octave
+    ([48, 52, 55], [48, 53, 55], [True, False, True], 1, 0, 0, 1),
+    ([48, 52, 55], [48, 55], [True, False, True], 1, 0, 1, 0),
+    ([48, 52, 55], [48, 50, 52, 55], [True, True, True], 1, 1, 0, 0),
+    # a skipped note and an extra note at the end don't shift the rest
+    ([48, 52, 55, 59], [52, 55, 59, 60], [False, True, True, True], 2, 1,
+     1, 0),
+    ([48, -1, 55], [48, 50, 55], [True, False, True], 1, 0, 0, 1),
+    ([48, 52], [], [False, False], 2, 0, 2, 0),
+])
+def test_align(target, answer, credit, distance, ins, dels, subs):
+    alignment = align(target, answer)
+    assert alignment.credit == credit
+    assert (alignment.distance, alignment.insertions, alignment.deletions,
+            alignment.substitutions) == (distance, ins, dels, subs)
+    assert alignment.correct == (distance == 0)
+
+
+def _random_attempts(rows, seed):
+    rng = np.random.RandomState(seed)
+    target = np.full((rows, 8), -1, dtype=np.int16)
+    answer = np.full((rows, 7), -1, dtype=np.int16)
+    for r in range(rows):
+        m = rng.randint(0, 6)
+        n = max(0, m + rng.randint(-2, 3))
+        target[r, :m] = rng.randint(40, 46, m)
+        answer[r, :n] = rng.randint(40, 46, n)
+        if m and rng.random_sample() < 0.4:  # at most one wrong note
+            answer[r, :m] = target[r, :m]
+            answer[r, rng.randint(m)] += rng.randint(0, 2)
+            answer[r, m:] = -1
+        if m > 1 and rng.random_sample() < 0.05:
+            target[r, rng.randint(m)] = -1
+    return target, answer
+
+
+def _length(row):
+    known = np.flatnonzero(row >= 0)
+    return known[-1] + 1 if len(known) else 0
+
+
+def test_align_batch_agrees_with_align():
+    target, answer = _random_attempts(3000, seed=0)
+    out = align_batch(target, answer, batch_rows=256)
+    assert out['credit'].shape == out['partners'].shape == target.shape
+    for r in range(len(target)):
+        m = _length(target[r])
+        alignment = align(list(target[r, :m]),
+                          list(answer[r, :_length(answer[r])]))
+        assert list(out['credit'][r, :m]) == alignment.credit
+        assert not out['credit'][r, m:].any()
+        partners = [p if p >= 0 else None for p in out['partners'][r, :m]]
+        assert partners == alignment.partners
+        assert (out['distance'][r], out['insertions'][r],
+                out['deletions'][r], out['substitutions'][r]) == (
+            alignment.distance, alignment.insertions, alignment.deletions,
+            alignment.substitutions)
+
+
+def test_align_batch_shifted_answer_of_equal_length():
+    out = align_batch([[48, 52, 55, 59]], [[52, 55, 59, 60]])
+    assert out['credit'].tolist() == [[False, True, True, True]]
+    assert out['partners'].tolist() == [[-1, 0, 1, 2]]
+    assert out['distance'].tolist() == [2]
+
+
+def _stream(target, answer, max_misses=2):
+    grader = StreamingGrader(target, max_misses)
+    for note in answer:
+        if grader.feed(note):
+            break
+    return grader
+
+
+def test_streaming_grader_hears_a_correct_answer_out():
+    grader = _stream([48, 52, 55, 59], [48, 52, 55, 59])
+    assert grader.done and not grader.stopped_early
+    assert grader.misses == 0
+    assert grader.alignment().correct
+
+
+def test_streaming_grader_isnt_thrown_by_a_skipped_note():
+    # positionally every note after the skip would be wrong
+    grader = _stream([48, 52, 55, 59, 60], [48, 55, 59, 60])
+    assert grader.misses == 1
+    assert not grader.stopped_early and len(grader.heard) == 4
+    assert grader.alignment().credit == [True, False, True, True, True]
+
+
+def test_streaming_grader_isnt_thrown_by_an_extra_note():
+    grader = _stream([48, 52, 55, 59], [48, 50, 52, 55, 59])
+    assert grader.done and len(grader.heard) == 4
+    assert grader.misses == 1 and grader.covered == 3
+    assert grader.alignment().credit == [True, True, True]
+
+
+def test_streaming_grader_stops_once_the_answer_is_too_far_off():
+    grader = _stream([48, 52, 55, 59, 60], [49, 53, 56, 58, 61])
+    assert grader.stopped_early and len(grader.heard) == 2
+    assert grader.misses == 2 and grader.covered == 2
+
+
+def test_streaming_grader_agrees_with_align():
+    target, answer = _random_attempts(500, seed=1)
+    for t, a in zip(target, answer):
+        t, a = list(t[:_length(t)]), list(a[:_length(a)])
+        grader = _stream(t, a, max_misses=0)
+        heard = grader.heard
+        # the fewest errors any continuation can end with
+        assert grader.misses == min(align(t[:k], heard).distance
+                                    for k in range(len(t) + 1))
+        assert grader.alignment() == align(t[:grader.covered], heard)
+        assert grader.alignment().distance == grader.misses
+
+
+def test_streaming_grader_max_misses_zero_never_stops_early():
+    grader = _stream([48, 52, 55], [61, 62, 63], max_misses=0)
+    assert not grader.stopped_early and grader.misses == 3
@@ -0,0 +1,74 @@
+"""`Deadline`, `CancelToken` and `ListenResult` from `listening`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Internal Dependencies
+from listening import (Deadline, CancelToken, ListenResult, POLL, COMPLETE,
+                       STOPPED, TIMEOUT, IDLE, CANCELLED, ERROR)
+
+# External Dependencies
+import pytest
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.
+
+    def __call__(self):
+        return self.now
+
+
+def test_nothing_set_never_expires():
+    clock = Clock()
+    deadline = Deadline(clock=clock)
+    clock.now += 1e6
+    assert deadline.expired() is None
+    assert deadline.remaining() is None
+    assert deadline.wait_time() == POLL
+
+
+def test_timeout_and_idle_timeout():
+    clock = Clock()
+    deadline = Deadline(timeout=10, idle_timeout=3, clock=clock)
+    clock.now += 2
+    assert deadline.expired() is None
+    assert deadline.remaining() == pytest.approx(1)
+    deadline.heard()  # restarts only the idle timeout
+    clock.now += 2.5
+    assert deadline.expired() is None
+    clock.now += 0.5
+    assert deadline.expired() == IDLE
+    deadline.heard()
+    clock.now += 2
+    assert deadline.remaining() == pytest.approx(1)
+    clock.now += 1
+    deadline.heard()
+    clock.now += 2
+    assert deadline.expired() == TIMEOUT
+    assert deadline.remaining() == 0.
+    assert deadline.wait_time() == 0.001
+
+
+def test_cancel_comes_first():
+    clock = Clock()
+    token = CancelToken()
+    deadline = Deadline(timeout=1, cancel=token, clock=clock)
+    token.cancel()
+    clock.now += 5
+    assert token.cancelled and deadline.expired() == CANCELLED
+    token.reset()
+    assert not token.is_set() and deadline.expired() == TIMEOUT
+
+
+def test_result_is_a_list_with_a_status():
+    result = ListenResult([1, 2])
+    assert result == [1, 2] and result.status == COMPLETE
+    assert not (result.partial or result.timed_out or result.failed)
+    assert not ListenResult(status=STOPPED).partial
+    for status in (TIMEOUT, IDLE):
+        assert ListenResult(status=status).timed_out
+    assert ListenResult(status=CANCELLED).cancelled
+    failed = ListenResult([1], ERROR, IOError('unplugged'))
+    assert failed.failed and failed.partial
+    assert 'error' in repr(failed)
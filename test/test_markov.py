@@ -0,0 +1,79 @@
+"""Progression statistics from `markov`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import random
+
+# Internal Dependencies
+from markov import (MarkovProgression, markov_sampler, adaptive_progression,
+                    FUNCTIONAL_HARMONY)
+
+# External Dependencies
+import numpy as np
+
+
+NUMERALS = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII']
+
+
+def _transition_frequencies(progressions):
+    counts = np.zeros((7, 7))
+    for prog in progressions:
+        for a, b in zip(prog[:-1], prog[1:]):
+            counts[NUMERALS.index(a), NUMERALS.index(b)] += 1
+    return counts / counts.sum(axis=1, keepdims=True)
+
+
+def test_batch_transitions_match_the_matrix():
+    generator = MarkovProgression(NUMERALS, seed=0)
+    chords = generator.generate(4000, 8)
+    freqs = np.zeros((7, 7))
+    np.add.at(freqs, (chords[:, :-1].ravel(), chords[:, 1:].ravel()), 1)
+    freqs /= freqs.sum(axis=1, keepdims=True)
+    assert np.allclose(freqs, generator.transitions, atol=0.02)
+    assert not np.any(chords[:, 1:] == chords[:, :-1])
+
+
+def test_strums_add_up():
+    generator = MarkovProgression(NUMERALS, seed=1)
+    for prog, prog_strums in generator.progressions(200, 7, (1, 2, 3)):
+        assert len(prog_strums) == 7
+        collapsed = [x for k, x in enumerate(prog_strums)
+                     if not k or prog_strums[k - 1] != x]
+        assert collapsed == prog
+
+
+def test_from_corpus_learns_transitions():
+    corpus = [['I', 'IV', 'V', 'I'], ['I', 'I', 'V', 'I']] * 50
+    generator = MarkovProgression.from_corpus(corpus, NUMERALS, smoothing=0)
+    assert generator.transitions[4, 0] == 1
+    assert generator.transitions[0, 3] == generator.transitions[0, 4] == 0.5
+
+
+def test_adaptive_progression_follows_sampler_weights():
+    random.seed(2)
+    sampler = markov_sampler(NUMERALS)
+    sampler.rng = random.Random(2)
+    progs = []
+    for _ in range(3000):
+        prog, prog_strums, items = adaptive_progression(sampler, 0, 6)
+        assert prog_strums == prog and len(prog) == 6
+        assert [x[2] for x in items] == prog
+        assert [x[1] for x in items] == [None] + prog[:-1]
+        progs.append(prog)
+    expected = FUNCTIONAL_HARMONY / FUNCTIONAL_HARMONY.sum(axis=1,
+                                                           keepdims=True)
+    assert np.allclose(_transition_frequencies(progs), expected, atol=0.03)
+
+
+def test_adaptive_progression_favours_missed_chords():
+    sampler = markov_sampler(NUMERALS)
+    sampler.rng = random.Random(3)
+    for _ in range(4):
+        sampler.update((0, 'V', 'VI'), False)
+    follows_v = [items[1][2] for items in
+                 (adaptive_progression(sampler, 0, 2)[2] for _ in range(6000))
+                 if items[0][2] == 'V']
+    # 3 of 13 before, 3*16 of (10 + 3*16) after four misses
+    assert abs(follows_v.count('VI') / len(follows_v) - 48 / 58) < 0.05
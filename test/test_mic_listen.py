@@ -0,0 +1,151 @@
+"""The `NoiseGate` of `mic_listen` and its calibration."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Internal Dependencies
+import mic_listen
+from mic_listen import (NoiseGate, PitchDetector, MicListener, calibrate_gate,
+                        synthetic_audio, FRAME_SIZE, FSAMP, CALIBRATION_HOPS,
+                        MIN_FLOOR)
+from contour import ContourRecorder
+
+# External Dependencies
+import numpy as np
+import pytest
+
+
+def _noise(hops, scale=150, seed=0):
+    rng = np.random.RandomState(seed)
+    return (scale * rng.randn(hops * FRAME_SIZE)).astype(np.int16)
+
+
+def _hops(samples):
+    return np.asarray(samples).reshape(-1, FRAME_SIZE)
+
+
+def _heard(detector, samples):
+    """Returns the MIDI number heard on each hop (None where nothing was)."""
+    out = []
+    for hop in _hops(samples):
+        detected = detector.process(hop)
+        out.append(None if detected is None else int(round(detected[1])))
+    return out
+
+
+class FakeStream(object):
+    def __init__(self, samples):
+        self.samples = np.asarray(samples, dtype=np.int16)
+        self.position = 0
+        self.closed = False
+        self.overflow = False  # as if the input overflowed before each read
+
+    def start_stream(self):
+        pass
+
+    def is_active(self):
+        return not self.closed
+
+    def read(self, chunk, exception_on_overflow=True):
+        if exception_on_overflow and self.overflow:
+            raise IOError("Input overflowed")
+        out = self.samples[self.position:self.position + chunk]
+        self.position += chunk
+        return out.tobytes()
+
+    def close(self):
+        self.closed = True
+
+
+class FakePyAudio(object):
+    """Stands in for the `pyaudio` module, with a microphone that captures
+    `samples`."""
+    paInt16 = 8
+
+    def __init__(self, samples):
+        self.stream = FakeStream(samples)
+
+    def PyAudio(self):
+        return self
+
+    def get_default_input_device_info(self):
+        return {'defaultSampleRate': FSAMP}
+
+    def open(self, **kwargs):
+        return self.stream
+
+    def terminate(self):
+        pass
+
+
+def test_gate_measures_the_floor_on_its_first_hops():
+    gate = NoiseGate()
+    quiet = _hops(_noise(CALIBRATION_HOPS))
+    assert not any(gate(hop) for hop in quiet)
+    assert gate.floor == pytest.approx(150, rel=0.1)
+    assert gate(_hops(synthetic_audio([60], hops_per_note=1))[0])
+    assert not gate(_hops(_noise(1, seed=1))[0])
+
+
+def test_calibrate_sets_the_floor_and_recalibrate_forgets_it():
+    gate = NoiseGate()
+    assert gate.calibrate(_hops(_noise(CALIBRATION_HOPS))) == gate.floor
+    assert gate.floor == pytest.approx(150, rel=0.1)
+    assert gate.calibrate([np.zeros(FRAME_SIZE, np.int16)]) == MIN_FLOOR
+    gate.recalibrate()
+    assert gate.floor is None and not gate.is_open
+
+
+def test_floor_learnt_while_singing_falls_at_the_first_pause():
+    detector = PitchDetector(gate=NoiseGate())
+    audio = np.concatenate([synthetic_audio([60], hops_per_note=24),
+                            _noise(3),
+                            synthetic_audio([67], hops_per_note=24)])
+    heard = _heard(detector, audio)
+    assert not any(heard[:27])  # the singing became the floor
+    assert detector.gate.floor == pytest.approx(150, rel=0.2)
+    assert heard[-8:] == [67] * 8
+
+
+def test_singing_right_after_calibration_is_heard():
+    gate = NoiseGate()
+    gate.calibrate(_hops(_noise(CALIBRATION_HOPS)))
+    heard = _heard(PitchDetector(gate=gate), synthetic_audio([64]))
+    assert heard[15:] == [64] * (len(heard) - 15)
+
+
+@pytest.mark.parametrize('calibrate', [
+    lambda gate: calibrate_gate(gate, prompt=False),
+    lambda gate: ContourRecorder(48, 84, gate=gate).calibrate(prompt=False),
+])
+def test_calibrate_gate_reads_quiet_from_the_microphone(monkeypatch, calibrate):
+    mic = FakePyAudio(_noise(2 * CALIBRATION_HOPS))
+    monkeypatch.setattr(mic_listen, 'pyaudio', mic)
+    gate = NoiseGate()
+    assert calibrate(gate) == pytest.approx(150, rel=0.1)
+    assert gate.floor == pytest.approx(150, rel=0.1)
+    assert mic.stream.closed
+
+
+def test_listen_hears_singing_right_after_calibration(monkeypatch, capsys):
+    listener = MicListener()
+    monkeypatch.setattr(mic_listen, 'pyaudio',
+                        FakePyAudio(_noise(2 * CALIBRATION_HOPS)))
+    listener.calibrate()
+    assert 'quiet' in capsys.readouterr().out
+
+    monkeypatch.setattr(mic_listen, 'pyaudio',
+                        FakePyAudio(synthetic_audio([62, 65])))
+    heard = listener.listen([62, 65])
+    assert [int(x) + 12 for x in heard] == [62, 65]
+
+
+def test_input_overflows_are_not_errors(monkeypatch):
+    listener = MicListener()
+    listener.gate.calibrate(_hops(_noise(CALIBRATION_HOPS)))
+    mic = FakePyAudio(synthetic_audio([62, 65]))
+    mic.stream.overflow = True
+    monkeypatch.setattr(mic_listen, 'pyaudio', mic)
+    heard = listener.listen([62, 65])
+    assert not heard.failed
+    assert [int(x) + 12 for x in heard] == [62, 65]
@@ -0,0 +1,101 @@
+"""The shared-memory `AudioRing` and the analysis loop of `mic_process`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+# Internal Dependencies
+from mic_listen import synthetic_audio, FRAME_SIZE, CALIBRATION_HOPS
+from mic_process import AudioRing, analyze, _READ, _WRITTEN
+
+# External Dependencies
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def ring():
+    ring = AudioRing(slots=64)
+    yield ring
+    ring.close()
+
+
+class UntilDrained(object):
+    """Stops `analyze()` once it has read every hop written."""
+    def __init__(self, ring):
+        self.ring = ring
+
+    def is_set(self):
+        header = self.ring.header
+        return header[_READ] == header[_WRITTEN]
+
+
+def _write(ring, samples):
+    for hop in np.asarray(samples).reshape(-1, FRAME_SIZE):
+        ring.write(hop)
+
+
+def _noise(hops):
+    rng = np.random.RandomState(0)
+    return (150 * rng.randn(hops * FRAME_SIZE)).astype(np.int16)
+
+
+def _events(ring):
+    events = queue.Queue()
+    stop = UntilDrained(ring)
+    analyze(ring, stop, events, poll=0)
+    out = []
+    while not events.empty():
+        out.append(events.get())
+    return out
+
+
+def test_ring_reads_in_order_and_counts_overflows():
+    ring = AudioRing(slots=4, hop=2)
+    try:
+        for k in range(3):
+            ring.write([k, k])
+        assert ring.read()[0] == 0
+        for k in range(3, 8):
+            ring.write([k, k])
+        index, _, samples = ring.read()
+        assert index == 5 and list(samples) == [5, 5]  # 1..4 overwritten
+        assert ring.overflows == 4
+        assert [ring.read()[0] for _ in range(2)] == [6, 7]
+        assert ring.read() is None
+    finally:
+        ring.close()
+
+
+def test_hops_from_before_begin_are_not_heard(ring):
+    _write(ring, _noise(CALIBRATION_HOPS))
+    first = ring.begin()
+    _write(ring, synthetic_audio([60], hops_per_note=20))
+    second = ring.begin(48, 84)  # before the analysis caught up
+    start = ring.start
+    _write(ring, synthetic_audio([67], hops_per_note=24))
+
+    events = _events(ring)
+    assert not [e for e in events if e[0] == first]
+    heard = [e for e in events if e[0] == second]
+    assert heard
+    assert all(e[1] >= start for e in heard)
+    assert all(round(e[5]) == 67 for e in heard)
+
+
+def test_calibrating_begin_measures_the_floor_before_singing(ring):
+    _write(ring, synthetic_audio([60], hops_per_note=8))  # not quiet
+    generation = ring.begin(calibrate=True)
+    assert ring.floor is None
+    _write(ring, _noise(CALIBRATION_HOPS))
+    _write(ring, synthetic_audio([64], hops_per_note=24))
+
+    events = _events(ring)
+    assert ring.floor == pytest.approx(150, rel=0.1)
+    heard = [e for e in events if e[0] == generation]
+    assert heard and all(round(e[5]) == 64 for e in heard)
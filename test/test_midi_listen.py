@@ -0,0 +1,82 @@
+"""`MidiListener.listen()` with events fed to a stand-in MIDI port."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import threading
+
+# Internal Dependencies
+from midi_listen import MidiListener
+from listening import COMPLETE, STOPPED, TIMEOUT, CANCELLED, CancelToken
+
+# External Dependencies
+import pytest
+
+
+class FakeMidiIn(object):
+    def set_callback(self, callback):
+        self.callback = callback
+
+    def press(self, *notes):
+        for note in notes:
+            self.callback(([0x90, note, 100], 0.01))
+            self.callback(([0x80, note, 0], 0.01))
+
+    def hold(self, note):
+        self.callback(([0x90, note, 100], 0.01))
+
+    def close_port(self):
+        pass
+
+
+@pytest.fixture
+def port():
+    return FakeMidiIn()
+
+
+def _later(fcn, *args):
+    timer = threading.Timer(0.05, fcn, args)
+    timer.start()
+    return timer
+
+
+def test_notes_played_before_listening_are_ignored(port):
+    listener = MidiListener('fake', midiin=port)
+    port.hold(60)  # e.g. the end of the previous answer, still held down
+    heard = []
+    _later(port.press, 62, 64)
+    result = listener.listen(num_notes=2, timeout=5, on_note=heard.append)
+    assert result.status == COMPLETE
+    assert heard == [62, 64]
+    assert [x.note for x in result if x.velocity] == [62, 64]
+
+
+def test_wait_for_key_release(port):
+    listener = MidiListener('fake', midiin=port)
+    port.press(60)
+    _later(port.press, 62, 64)
+    result = listener.listen(num_notes=2, wait_for_key_release=True,
+                             timeout=5)
+    assert [x.note for x in result if x.velocity] == [62, 64]
+
+
+def test_on_note_can_stop_listening(port):
+    listener = MidiListener('fake', midiin=port)
+    heard = []
+
+    def on_note(note):
+        heard.append(note)
+        return note == 64
+    _later(port.press, 62, 64, 65)
+    result = listener.listen(num_notes=3, timeout=5, on_note=on_note)
+    assert result.status == STOPPED
+    assert heard == [62, 64]
+
+
+def test_timeouts_and_cancel(port):
+    listener = MidiListener('fake', midiin=port)
+    assert listener.listen(num_notes=1, timeout=0.05).status == TIMEOUT
+    cancel = CancelToken()
+    cancel.cancel()
+    assert listener.listen(num_notes=1, cancel=cancel).status == CANCELLED
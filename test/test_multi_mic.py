@@ -0,0 +1,79 @@
+"""`ChannelListener`s of one `MultiMicListener` hear only their channel."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import threading
+
+# Internal Dependencies
+from multi_mic import MultiMicListener, synthetic_channels
+from listening import COMPLETE, ERROR
+
+# External Dependencies
+import pytest
+
+
+CHANNELS = 3
+
+
+class GatedSource(object):
+    """Feeds `hops` once `go` is set (then ends the stream)."""
+    def __init__(self, hops):
+        self.hops = iter(hops)
+        self.go = threading.Event()
+
+    def __call__(self):
+        self.go.wait()
+        return next(self.hops, None)
+
+
+def _distinct(notes):
+    """`notes` without repeats, as a listener reports them."""
+    return [x for k, x in enumerate(notes) if k == 0 or x != notes[k - 1]]
+
+
+@pytest.fixture
+def mics():
+    notes, hops = synthetic_channels(CHANNELS, notes_per_channel=3,
+                                     hops_per_note=24, seed=1)
+    source = GatedSource(hops)
+    mics = MultiMicListener(CHANNELS, source=source)
+    mics.notes, mics.source_gate = notes, source.go
+    yield mics
+    source.go.set()
+    mics.close()
+
+
+def test_each_channel_hears_only_its_own_notes(mics):
+    expected = [_distinct(list(row)) for row in mics.notes]
+    assert len(set(map(tuple, expected))) == CHANNELS  # all different
+    mics.queues[0].put((0, 440., 69))  # left over from before: ignored
+    mics.start()
+
+    results = [None] * CHANNELS
+
+    def listen(channel):
+        results[channel] = mics.channel(channel).listen(
+            expected[channel], timeout=10)
+    threads = [threading.Thread(target=listen, args=(k,))
+               for k in range(CHANNELS)]
+    for t in threads:
+        t.start()
+    while mics.generations != [1] * CHANNELS:  # every listen() has begun
+        threads[0].join(0.001)
+    mics.source_gate.set()
+    for t in threads:
+        t.join()
+
+    for channel, heard in enumerate(results):
+        assert heard.status == COMPLETE
+        assert [int(x) + 12 for x in heard] == expected[channel]
+
+
+def test_listening_after_the_stream_ends_is_an_error(mics):
+    mics.source_gate.set()
+    mics.start()
+    mics._thread.join()
+    heard = mics.channel(1).listen([60], timeout=5)
+    assert heard.status == ERROR and list(heard) == []
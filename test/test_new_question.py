@@ -0,0 +1,109 @@
+"""Random notes questions answered through a stand-in listener."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import os
+
+# Internal Dependencies
+import audio_backend
+from audio_backend import NullBackend, set_backend
+from getch import KeyboardReader
+from listening import ListenResult, CANCELLED
+from musictools import parse2note
+from new_question import new_question_rn, RN_HOTKEYS
+from session import Session
+from simulate import rn_settings
+
+# External Dependencies
+import pytest
+
+
+class Listener(object):
+    """Answers every question correctly."""
+    def __init__(self):
+        self.calls = 0
+
+    def listen(self, notes, instrument_range=None, on_note=None, cancel=None,
+               **kwargs):
+        self.calls += 1
+        heard = ListenResult()
+        if cancel is not None and cancel.is_set():
+            heard.status = CANCELLED
+            return heard
+        for note in notes:
+            heard.append(parse2note(note))
+            if on_note is not None and on_note(heard[-1]):
+                break
+        return heard
+
+
+@pytest.fixture
+def session():
+    previous = audio_backend._backend
+    set_backend(NullBackend(record=False))
+    read, write = os.pipe()
+    session = Session(rn_settings(listener=Listener()))
+    # not started: keys are put on its queue by hand
+    session.keyboard = KeyboardReader(RN_HOTKEYS, fd=read)
+    yield session
+    set_backend(previous)
+    os.close(read)
+    os.close(write)
+
+
+def test_answering_moves_on(session):
+    new_question_rn(session)
+    first = session.current_q_info
+    assert session.score == 1 and session.new_question
+    new_question_rn(session)
+    assert session.current_q_info is not first and session.count == 2
+
+
+def test_hotkey_replays_the_question(session):
+    session.keyboard._put('q')  # not a hotkey
+    session.keyboard._put('r')
+    new_question_rn(session)
+    first = session.current_q_info
+    assert not session.keyboard.interrupt.is_set()
+    assert session.keyboard.keys.empty()
+    assert not session.new_question
+    new_question_rn(session)
+    assert session.current_q_info is first and session.count == 1
+
+
+def test_stats_hotkey(session, capsys):
+    session.keyboard._put('a')
+    new_question_rn(session)
+    assert "No answers have been logged" in capsys.readouterr().out
+    assert not session.keyboard.interrupt.is_set()
+
+
+def test_quit_hotkey(session):
+    session.keyboard._put('x')
+    with pytest.raises(SystemExit):
+        new_question_rn(session)
+
+
+def test_cancelled_question_is_asked_again(session, capsys):
+    session.keyboard._put('a')  # cancels listening, then shows statistics
+    new_question_rn(session)
+    first = session.current_q_info
+    assert session.settings.listener.calls == 1
+    assert session.score == 0 and not session.new_question
+    assert not session.keyboard.interrupt.is_set()
+    assert "No answers have been logged" in capsys.readouterr().out
+
+    new_question_rn(session)
+    assert session.current_q_info is first
+    assert session.score == 1 and session.count == 1
+
+
+def test_cancel_without_a_pending_key_doesnt_loop(session):
+    session.keyboard.interrupt.set()  # its key was already taken
+    new_question_rn(session)
+    assert not session.new_question
+    assert not session.keyboard.interrupt.is_set()
+    new_question_rn(session)
+    assert session.score == 1
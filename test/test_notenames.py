@@ -0,0 +1,45 @@
+"""The note name tables of `notenames` agree with mingus."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Internal Dependencies
+from notenames import (SPELLINGS, pitch_class, note_int, make_note, name,
+                       degree, DEFAULT_OCTAVE)
+
+# External Dependencies
+from mingus.containers import Note
+
+
+def test_every_spelling_matches_mingus():
+    for spelling, (mingus_name, octave) in SPELLINGS.items():
+        if octave is None:
+            octave = DEFAULT_OCTAVE
+        expected = int(Note(mingus_name, octave))
+        assert note_int(spelling) == expected, spelling
+        assert pitch_class(spelling) == expected % 12, spelling
+        note = make_note(spelling)
+        assert (note.name, note.octave) == (mingus_name, octave), spelling
+
+
+def test_parsing():
+    assert note_int('c-4') == note_int('C4') == 48
+    assert note_int(' Eb ') == 51
+    assert note_int('60') == note_int(60) == 60
+    assert note_int(Note('A', 3)) == int(Note('A', 3))
+    assert note_int('H') is None and note_int('Q-4', -1) == -1
+    assert pitch_class('B#') == 0 and pitch_class('X') is None
+    assert make_note('x') is None
+
+
+def test_formatting():
+    note = make_note(61)
+    assert (note.name, note.octave) == ('C#', 5)
+    assert int(note) == int(Note('C#', 5))
+    assert make_note('61').name == 'C#'
+    assert [name(x) for x in (0, 13, 47)] == ['C', 'C#', 'B']
+
+
+def test_degrees():
+    assert [degree(str(k)) for k in range(1, 8)] == list(range(1, 8))
+    assert degree('8') is None and degree(' 3\n') == 3
@@ -0,0 +1,94 @@
+"""The background `QuestionPrefetcher`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import time
+import threading
+
+# Internal Dependencies
+from prefetch import QuestionPrefetcher
+
+# External Dependencies
+import pytest
+
+
+class Producer(object):
+    """Numbers its questions, and checks it's never called on two threads
+    at once."""
+    def __init__(self, delay=0.):
+        self.delay = delay
+        self.count = 0
+        self.busy = threading.Lock()
+        self.overlaps = 0
+
+    def __call__(self):
+        if not self.busy.acquire(False):
+            self.overlaps += 1
+            self.busy.acquire()
+        try:
+            time.sleep(self.delay)
+            self.count += 1
+            return {'number': self.count}
+        finally:
+            self.busy.release()
+
+
+def _wait_until_full(prefetcher, depth):
+    end = time.time() + 5
+    while prefetcher._queue.qsize() < depth and time.time() < end:
+        time.sleep(0.001)
+    assert prefetcher._queue.qsize() == depth
+
+
+@pytest.fixture
+def prefetcher():
+    prefetchers = []
+
+    def make(*args, **kwargs):
+        prefetchers.append(QuestionPrefetcher(*args, **kwargs))
+        return prefetchers[-1]
+    yield make
+    for p in prefetchers:
+        p.close()
+
+
+def test_questions_come_in_order_from_the_queue(prefetcher):
+    p = prefetcher(Producer(), depth=2)
+    _wait_until_full(p, 2)
+    assert [p.get()['number'] for _ in range(2)] == [1, 2]
+    assert (p.hits, p.misses) == (2, 0)
+
+
+def test_invalidate_discards_prepared_questions(prefetcher):
+    produce = Producer()
+    p = prefetcher(produce, depth=2)
+    _wait_until_full(p, 2)
+    p.invalidate()
+    assert p.generation == 1
+    assert p.get()['number'] > 2
+    # one prepared (by the background thread) before `invalidate()` and
+    # queued after it would be from the old generation, and is skipped too
+    p._queue.put((0, {'number': -1}))
+    assert p.get()['number'] > 0
+
+
+def test_a_miss_prepares_on_the_calling_thread(prefetcher):
+    produce = Producer(delay=0.01)
+    p = prefetcher(produce, depth=1)
+    numbers = []
+    for _ in range(10):
+        p.invalidate()  # nothing is ready
+        numbers.append(p.get()['number'])
+    assert p.misses >= 1
+    assert numbers == sorted(set(numbers))
+    assert produce.overlaps == 0  # waited for the background thread
+
+
+def test_render_and_close(prefetcher):
+    p = prefetcher(lambda: {'timeline': 'tl'}, depth=1,
+                   render=lambda tl: tl.upper())
+    assert p.get()['audio'] == 'TL'
+    p.close()
+    assert not p._thread.is_alive()
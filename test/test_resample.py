@@ -0,0 +1,67 @@
+"""`PolyphaseResampler` keeps pitches, removes aliases and streams."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Internal Dependencies
+from resample import PolyphaseResampler
+
+# External Dependencies
+import numpy as np
+import pytest
+
+
+def _tone(freq, rate, seconds=0.5, amplitude=3000.):
+    t = np.arange(int(seconds * rate)) / rate
+    return amplitude * np.sin(2 * np.pi * freq * t)
+
+
+def _peak(x, rate):
+    """Returns the frequency and amplitude of the strongest component."""
+    spectrum = np.abs(np.fft.rfft(x * np.hanning(len(x))))
+    k = spectrum.argmax()
+    return k * rate / len(x), 2 * spectrum[k] / np.hanning(len(x)).sum()
+
+
+@pytest.mark.parametrize('rate_in', [44100, 48000, 96000, 16000])
+def test_tones_keep_their_pitch_and_level(rate_in):
+    resampler = PolyphaseResampler(rate_in, 22050)
+    out = resampler.process(_tone(440., rate_in))
+    assert len(out) == pytest.approx(resampler.output_length(rate_in // 2),
+                                     abs=resampler.up)
+    freq, amplitude = _peak(out[len(out) // 4:], 22050)  # past the delay
+    assert freq == pytest.approx(440., abs=5.)
+    assert amplitude == pytest.approx(3000., rel=0.02)
+
+
+def test_tones_above_the_new_nyquist_are_filtered_out():
+    out = PolyphaseResampler(48000, 22050).process(_tone(15000., 48000))
+    assert np.abs(out[len(out) // 4:]).max() < 30  # -40dB
+
+
+def test_chunks_give_the_same_output_as_one_call():
+    x = _tone(300., 44100, 0.2) + _tone(2000., 44100, 0.2)
+    whole = PolyphaseResampler(44100, 22050).process(x)
+    resampler = PolyphaseResampler(44100, 22050)
+    parts = [resampler.process(c) for c in np.array_split(x, 17)]
+    np.testing.assert_allclose(np.concatenate(parts), whole, atol=1e-2)
+
+
+def test_hops_are_whole_and_in_order():
+    resampler = PolyphaseResampler(48000, 22050)
+    x = _tone(440., 48000, 0.5)
+    whole = PolyphaseResampler(48000, 22050).process(x)
+    hops = []
+    for chunk in np.array_split(x, 9):
+        hops.extend(resampler.hops(chunk, 1024))
+    assert all(len(h) == 1024 for h in hops)
+    assert len(hops) == len(whole) // 1024
+    np.testing.assert_allclose(np.concatenate(hops), whole[:len(hops) * 1024],
+                               atol=1e-2)
+
+
+def test_same_rate_passes_through():
+    resampler = PolyphaseResampler(22050, 22050)
+    x = np.arange(-5, 5, dtype=np.int16)
+    assert resampler.passthrough and resampler.delay == 0.
+    np.testing.assert_array_equal(resampler.process(x), x)
@@ -0,0 +1,84 @@
+"""Mixing notes from a `SampleBank`, offline and block by block."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Internal Dependencies
+from samplebank import SampleBank, SampleBankBackend
+from timeline import Timeline
+from notenames import make_note
+
+# External Dependencies
+import numpy as np
+from mingus.containers import NoteContainer
+import pytest
+
+
+RATE = 1000
+LENGTH = 2000  # frames per sample
+
+
+@pytest.fixture
+def bank():
+    """Notes 60-71, each a constant level: (MIDI number - 59) / 100."""
+    levels = (np.arange(60, 72) - 59) / 100.
+    return SampleBank(np.ones((12, LENGTH)) * levels[:, None], RATE, 60)
+
+
+def _level(midi):
+    return (midi - 59) / 100.
+
+
+def test_notes_outside_the_bank_keep_their_pitch_class(bank):
+    assert bank.sample(64)[0] == pytest.approx(_level(64))
+    assert bank.sample(64 - 24)[0] == pytest.approx(_level(64))
+    assert bank.sample(64 + 12)[0] == pytest.approx(_level(64))
+    assert bank.note_max == 71
+
+
+def test_mix_length_and_release(bank):
+    tl = Timeline(bpm=60, velocity=127).add(make_note(62 - 12))  # 1s
+    out = bank.mix(tl, tail=0.5)
+    assert len(out) == 1500
+    hold, release = RATE, bank.release_frames
+    assert release == 50
+    np.testing.assert_allclose(out[:hold], _level(62))
+    fade = out[hold:hold + release]
+    assert fade[0] == pytest.approx(_level(62))
+    assert (np.diff(fade) < 0).all()  # fading out...
+    assert fade[-1] < _level(62) / release * 1.5
+    assert not out[hold + release:].any()  # ...and then silent
+
+
+def test_mix_adds_chords_and_cuts_at_the_end(bank):
+    chord = NoteContainer([make_note(60 - 12), make_note(64 - 12)])
+    out = bank.mix(Timeline(bpm=60, velocity=127).add(chord), tail=0)
+    assert len(out) == RATE
+    np.testing.assert_allclose(out, _level(60) + _level(64))
+
+    out = bank.render(Timeline(bpm=15).add(make_note(60 - 12)), tail=0)
+    assert out.dtype == np.int16 and len(out) == 4 * RATE  # a 4s note
+    assert out[0] == int(_level(60) * 100 / 127 * 32767)
+    assert not out[LENGTH:].any()  # the sample ran out before the note
+
+
+def test_backend_fades_stopped_voices_and_retires_them(bank):
+    backend = SampleBankBackend(bank, block=30, output=False)
+    backend.init()
+    backend.play_Note(make_note(60 - 12), velocity=127)
+    backend.play_Note(make_note(64 - 12), velocity=127)
+    np.testing.assert_allclose(backend.mix(), _level(60) + _level(64))
+    assert len(backend.voices) == 2
+
+    backend.stop_Note(make_note(64 - 12))
+    released = np.concatenate([backend.mix() for _ in range(2)])  # 60
+    fade = released[:bank.release_frames] - _level(60)
+    assert fade[0] == pytest.approx(_level(64))
+    assert (np.diff(fade) < 0).all()
+    np.testing.assert_allclose(released[bank.release_frames:], _level(60))
+    assert list(backend.voices) == [(1, 60)]  # the stopped voice is gone
+
+    while backend.voices:  # until the sample runs out
+        backend.mix()
+    assert backend.voices == {}
+    assert not backend.mix().any()
@@ -0,0 +1,79 @@
+"""Fenwick-tree weights and draws in `sampler`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import random
+
+# Internal Dependencies
+from sampler import SumTree, AdaptiveSampler, key_index
+
+# External Dependencies
+import numpy as np
+import pytest
+
+
+def test_prefix_sums_follow_updates():
+    tree = SumTree([1, 2, 3, 4, 5])
+    assert [tree.prefix(k) for k in range(6)] == [0, 1, 3, 6, 10, 15]
+    tree.set(2, 10)
+    assert tree.prefix(3) == 13
+    assert tree.total == 22
+    with pytest.raises(ValueError):
+        tree.set(0, -1)
+
+
+def test_draws_are_proportional_to_weight():
+    weights = [1, 0, 3, 6]
+    tree = SumTree(weights)
+    rng = random.Random(0)
+    n = 20000
+    counts = np.bincount([tree.draw(rng=rng) for _ in range(n)], minlength=4)
+    assert counts[1] == 0
+    assert np.allclose(counts / n, np.array(weights) / 10, atol=0.015)
+
+
+def test_draws_stay_in_range():
+    tree = SumTree([5, 1, 1, 1, 5])
+    rng = random.Random(1)
+    draws = set(tree.draw(1, 4, rng) for _ in range(2000))
+    assert draws == {1, 2, 3}
+    with pytest.raises(ValueError):
+        SumTree([1, 0, 0, 1]).draw(1, 3, rng)
+
+
+def test_sampler_respects_prefix_and_bounds():
+    sampler = AdaptiveSampler([['a', 'b'], [1, 2, 3, 4]],
+                              rng=random.Random(2))
+    for _ in range(200):
+        item = sampler.sample(('b',), low=2, high=3)
+        assert item[0] == 'b' and 2 <= item[1] <= 3
+    for index in range(len(sampler)):
+        assert sampler.index(sampler.item(index)) == index
+
+
+def test_misses_raise_and_hits_lower_probability():
+    sampler = AdaptiveSampler([[0, 1, 2]], rng=random.Random(3))
+    sampler.update((0,), False)
+    sampler.update((2,), True)
+    assert sampler.weight((0,)) == 2
+    assert sampler.weight((2,)) == pytest.approx(0.7)
+    n = 20000
+    counts = np.bincount([sampler.sample()[0] for _ in range(n)], minlength=3)
+    assert np.allclose(counts / n, np.array([2, 1, 0.7]) / 3.7, atol=0.015)
+
+
+def test_factors_are_bounded():
+    sampler = AdaptiveSampler([[0, 1]], min_factor=0.5, max_factor=4)
+    for _ in range(10):
+        sampler.update((0,), False)
+        sampler.update((1,), True)
+    assert sampler.weight((0,)) == 4
+    assert sampler.weight((1,)) == 0.5
+
+
+def test_key_index():
+    assert key_index('C') == 0
+    assert key_index('Eb') == 3
+    assert key_index('c#') == 13
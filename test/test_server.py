@@ -0,0 +1,102 @@
+"""A student's session with `server.QuestionServer` over a socket."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import asyncio
+import threading
+
+# Internal Dependencies
+import server as server_module
+from server import QuestionServer, default_settings, _encode, _recv, \
+    LINE_LIMIT
+from notenames import note_int
+
+
+def _session(messages):
+    """Sends each of `messages` (callables taking the last question's
+    notes) to a new server and returns the replies."""
+    async def run():
+        server = QuestionServer(default_settings())
+        tcp = await server.start('127.0.0.1', 0)
+        port = tcp.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port,
+                                                       limit=LINE_LIMIT)
+        replies = []
+        try:
+            for message in messages:
+                msg = message(server)
+                writer.write(_encode(msg))
+                await writer.drain()
+                reply = await _recv(reader)
+                while reply['type'] == 'audio':
+                    reply = await _recv(reader)
+                replies.append(reply)
+        finally:
+            writer.write(_encode({'type': 'bye'}))
+            writer.close()
+            tcp.close()
+            await tcp.wait_closed()
+        return replies
+    return asyncio.run(run())
+
+
+def _right_answer(server):
+    session, = server.sessions
+    notes = session.current_q_info['notes']
+    return {'type': 'answer', 'notes': [note_int(x) + 12 for x in notes]}
+
+
+def question(server):
+    return {'type': 'question'}
+
+
+def test_question_then_right_answer_scores():
+    replies = _session([question, _right_answer,
+                        lambda s: {'type': 'score'}])
+    assert replies[0]['type'] == 'question'
+    assert replies[0]['num_notes'] == 3
+    assert replies[1]['type'] == 'feedback' and replies[1]['correct']
+    assert replies[2] == {'type': 'score', 'score': 1, 'count': 1}
+
+
+def test_answering_twice_is_rejected():
+    replies = _session([question, _right_answer, _right_answer,
+                        lambda s: {'type': 'repeat'}, _right_answer,
+                        lambda s: {'type': 'score'}])
+    assert replies[1]['correct']
+    assert replies[2]['type'] == 'error'
+    assert replies[4]['type'] == 'error'  # repeating doesn't reopen it
+    assert replies[5]['score'] == 1 and replies[5]['count'] == 1
+
+
+def test_next_question_can_be_answered():
+    replies = _session([question, _right_answer, question, _right_answer,
+                        lambda s: {'type': 'score'}])
+    assert replies[3]['type'] == 'feedback'
+    assert replies[4] == {'type': 'score', 'score': 2, 'count': 2}
+
+
+def test_wrong_answer_and_bad_messages():
+    replies = _session([lambda s: {'type': 'answer', 'notes': [60]},
+                        question,
+                        lambda s: {'type': 'answer', 'notes': ['H#']},
+                        lambda s: {'type': 'dance'}])
+    assert replies[0]['type'] == 'error'  # no question yet
+    assert replies[2]['type'] == 'error'
+    assert replies[3]['type'] == 'error'
+
+
+def test_questions_are_prepared_off_the_event_loop(monkeypatch):
+    threads = []
+    prepare = server_module.prepare_rn
+
+    def prepare_rn(gst, previous_note=None):
+        threads.append(threading.current_thread())
+        return prepare(gst, previous_note)
+    monkeypatch.setattr(server_module, 'prepare_rn', prepare_rn)
+    replies = _session([question, _right_answer, question])
+    assert replies[1]['correct'] and replies[2]['count'] == 2
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads  # the loop's thread
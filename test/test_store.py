@@ -0,0 +1,72 @@
+"""Saved games and attempts in `store.GameStore`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import os
+
+# Internal Dependencies
+from store import GameStore
+
+# External Dependencies
+import pytest
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = GameStore(str(tmp_path / 'games.db'), batch_size=4)
+    yield store
+    store.close()
+
+
+def test_on_disk_database_uses_wal(store):
+    assert store.journal_mode == 'wal'
+
+
+def test_save_list_and_load_games(store):
+    first = store.save_game({'key': 'C', 'bpm': 40})
+    second = store.save_game({'key': 'g', 'bpm': 60}, name='minor')
+    assert store.list_games() == [(first, 'save{}'.format(first)),
+                                  (second, 'minor')]
+    assert store.load_game(second) == {'key': 'g', 'bpm': 60}
+    with pytest.raises(KeyError):
+        store.load_game(second + 1)
+
+
+def test_attempts_are_batched_and_flushed(store):
+    game = store.save_game({})
+    for k in range(6):
+        store.record_attempt(game, 'random_notes', 'C', [60, 62], [60, k],
+                             k == 2, latency=0.5, timestamp=k)
+    assert len(store._pending) == 2  # one batch of 4 written
+    assert store.score(game) == (1, 6)
+    attempts = store.attempts(game)
+    assert [a['answer'] for a in attempts] == [[60, k] for k in range(6)]
+    assert attempts[2]['correct'] and not attempts[3]['correct']
+    assert attempts[0]['target'] == [60, 62]
+
+
+def test_attempts_persist(tmp_path):
+    path = str(tmp_path / 'games.db')
+    store = GameStore(path)
+    game = store.save_game({'key': 'D'})
+    store.recorder(game).record_attempt('interval', 'D', [50], [50], True)
+    store.close()
+    assert os.path.exists(path)
+
+    store = GameStore(path)
+    try:
+        assert store.score(game) == (1, 1)
+        assert store.load_game(game) == {'key': 'D'}
+    finally:
+        store.close()
+
+
+def test_recording_does_not_wait_on_the_disk(store):
+    game = store.save_game({})
+    with store._lock:  # as if the writer were stuck in a slow commit
+        for k in range(10):
+            store.record_attempt(game, 'interval', 'C', [60], [60], True)
+        assert len(store._pending) == 2  # two batches handed to the writer
+    assert store.score(game) == (10, 10)
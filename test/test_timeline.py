@@ -0,0 +1,86 @@
+"""Scheduling and playback of a `Timeline` on the `NullBackend`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import threading
+
+# Internal Dependencies
+from audio_backend import NullBackend
+from timeline import Timeline, duration2seconds, _wait_until
+
+# External Dependencies
+from mingus.containers import Note, NoteContainer
+import pytest
+
+
+def _phrase():
+    return Timeline(bpm=60).add_phrase([Note('C', 4), Note('E', 4)]).rest()
+
+
+def test_durations_follow_the_tempo():
+    assert duration2seconds(4, 60) == 1.
+    assert duration2seconds(8, 120) == 0.25
+    assert _phrase().duration == 3.
+
+
+def test_events_play_at_their_times_without_drift():
+    backend = NullBackend()
+    report = _phrase().play(backend)
+    assert [(e.time, e.on, e.note) for e in backend.events] == [
+        (0., True, 60), (1., False, 60), (1., True, 64), (2., False, 64)]
+    assert backend.clock == 3.  # waited out the rest
+    assert report.summary()['events'] == 4
+    assert report.summary()['max_ms'] == 0.
+
+
+def test_extend_offsets_and_transpose_keeps_pairs():
+    tl = _phrase().extend(_phrase()).transpose(2)
+    assert tl.duration == 6.
+    backend = NullBackend()
+    tl.play(backend, wait_for_end=False)
+    assert backend.notes_played() == [62, 66, 62, 66]
+    assert backend.notes_played(since=3.) == [62, 66]
+    assert backend.clock == 5.
+    ons = sum(e.on for e in backend.events)
+    assert ons == len(backend.events) - ons  # every note was stopped
+
+
+def test_chords_start_and_stop_together():
+    backend = NullBackend()
+    Timeline(bpm=60).add(NoteContainer(['C-4', 'G-4'])).play(backend)
+    assert sorted((e.time, e.on, e.note) for e in backend.events) == [
+        (0., True, 60), (0., True, 67), (1., False, 60), (1., False, 67)]
+
+
+def test_interrupt_stops_sounding_notes():
+    backend = NullBackend()
+    interrupt = threading.Event()
+
+    def sleep(seconds):  # a key is pressed during the first note
+        backend.sleep(seconds / 2)
+        interrupt.set()
+
+    report = _phrase().play(backend, sleep=sleep, interrupt=interrupt)
+    assert [(e.on, e.note) for e in backend.events] == [(True, 60),
+                                                        (False, 60)]
+    assert backend.clock == 0.5
+    assert report.summary()['events'] == 1
+
+
+def test_wait_until_spins_the_last_stretch():
+    clock = [0.]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    def now():
+        clock[0] += 0.0005  # each look at the clock takes a while
+        return clock[0]
+
+    assert _wait_until(0.01, now, sleep, spin=0.002)
+    assert sleeps == [pytest.approx(0.0075)]
+    assert 0.01 <= clock[0] < 0.0115
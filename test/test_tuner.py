@@ -0,0 +1,92 @@
+"""Tuner readings, and drawing them in the terminal."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import io
+
+# Internal Dependencies
+from tuner import (Tuner, TerminalRenderer, Snapshot, peak_frequency,
+                   cents_error, run, synthetic_source, NEEDLE_WIDTH)
+from resample import PolyphaseResampler
+from mic_listen import FSAMP
+
+# External Dependencies
+import numpy as np
+import pytest
+
+
+def test_peak_frequency_between_bins():
+    rate, size = 8000, 1024
+    freq = 440.3  # between bins 56 and 57
+    t = np.arange(size) / rate
+    spectrum = np.abs(np.fft.rfft(np.hanning(size) *
+                                  np.sin(2 * np.pi * freq * t)))
+    step = rate / size
+    assert peak_frequency(spectrum, step, 10, 200) == \
+        pytest.approx(freq, abs=0.05 * step)
+
+
+def test_cents_error():
+    assert cents_error() < 1.  # about 0.16 cents
+
+
+def test_analyze_publishes_snapshots():
+    tuner = Tuner()
+    source = synthetic_source([69.25], hops_per_note=24, speed=np.inf)
+    resampler = PolyphaseResampler(FSAMP, tuner.detector.samplerate)
+    samples = source()
+    while samples is not None:
+        for hop in resampler.hops(samples, tuner.detector.frame_size):
+            snapshot = tuner.analyze(hop)
+        samples = source()
+    assert tuner.latest is snapshot and snapshot.index == tuner.hops
+    assert snapshot.cents == pytest.approx(25, abs=1)
+    assert round(snapshot.midi) == 69
+    assert snapshot.spectrum.argmax() == 69 - tuner.detector.note_min
+
+
+def _snapshot(midi):
+    if midi is None:
+        return Snapshot(1, 0., 0., 0., None, None, None, None)
+    return Snapshot(1, 0., 0., 1., 440 * 2 ** ((midi - 69) / 12), midi,
+                    100 * (midi - round(midi)), None)
+
+
+def test_terminal_needle():
+    stream = io.StringIO()
+    renderer = TerminalRenderer(stream=stream)
+    renderer.render(_snapshot(69.1))
+    out = stream.getvalue()
+    assert out.startswith('\r  A4  +10.0 cents [')
+    bar = out[out.index('[') + 1:out.index(']')]
+    assert len(bar) == NEEDLE_WIDTH and bar.index('|') == NEEDLE_WIDTH // 2
+    assert bar.index('^') == NEEDLE_WIDTH // 2 + 4  # 10 cents a char...
+    assert out.endswith('442.55 Hz')
+
+    renderer.render(_snapshot(None))  # silence overwrites the whole line
+    assert len(stream.getvalue()) == 2 * len(out)
+    renderer.close()
+    assert stream.getvalue().endswith('\n')
+
+
+def test_terminal_trace():
+    stream = io.StringIO()
+    renderer = TerminalRenderer(note_min=60, note_max=72, trace=True,
+                                stream=stream)
+    renderer.render(_snapshot(64.2))
+    renderer.render(_snapshot(None))
+    renderer.render(_snapshot(80))  # out of range: drawn at the edge
+    assert stream.getvalue().split('\n') == ['  E4 .   *       .',
+                                             '     .           .',
+                                             ' G#5 .           *', '']
+
+
+def test_run_draws_until_the_tuner_stops():
+    tuner = Tuner(source=synthetic_source([60, 67], speed=np.inf)).start()
+    stream = io.StringIO()
+    latencies = run(tuner, TerminalRenderer(stream=stream), max_fps=1000)
+    tuner.close()
+    assert latencies and tuner.hops > 0
+    assert stream.getvalue().count('\r') == len(latencies)
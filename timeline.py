@@ -0,0 +1,201 @@
+"""Sample-accurate sequencing of whole questions.
+
+A `Timeline` collects note-on/note-off events (and the gaps between them) for
+everything that should be heard in one go -- e.g. cadence, phrase and
+resolution -- and then dispatches them against a monotonic clock.  Each event
+is scheduled relative to the start of the timeline rather than relative to
+the previous event, so Python overhead and sleep overshoot never accumulate
+into drift.  The achieved timing jitter is returned as a `TimingReport`."""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+from collections import namedtuple
+
+# Internal Dependencies
+from audio_backend import get_backend
+from instrument import timed
+from musictools import transpose
+
+# External Dependencies
+from mingus.containers import NoteContainer, Note
+
+
+DEFAULT_BPM = 120  # same default as `fluidsynth.play_Bar`
+SPIN_THRESHOLD = 0.002  # busy-wait (instead of sleep) for the last 2ms
+TOLERANCE = 1e-9  # events this close to their target time count as on time
+
+
+def duration2seconds(duration, bpm=None):
+    """Converts a mingus-style duration (4 for a quarter note, 8 for an
+    eighth, etc.) to seconds at the given BPM."""
+    if bpm is None:
+        bpm = DEFAULT_BPM
+    return (60.0 / bpm) * (4.0 / duration)
+
+
+class Event(namedtuple('Event', 'time on notes velocity')):
+    """A note-on (`on=True`) or note-off event, `time` seconds after the
+    start of the timeline."""
+    __slots__ = ()
+
+
+class TimingReport(object):
+    """The lateness (in seconds) of every event dispatched by
+    `Timeline.play()`."""
+    def __init__(self, lateness):
+        self.lateness = list(lateness)
+
+    def summary(self):
+        """Returns a dictionary of jitter statistics in milliseconds."""
+        if not self.lateness:
+            return {'events': 0, 'mean_ms': 0., 'max_ms': 0., 'p99_ms': 0.}
+        ordered = sorted(self.lateness)
+        p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+        return {'events': len(ordered),
+                'mean_ms': 1000 * sum(ordered) / len(ordered),
+                'max_ms': 1000 * ordered[-1],
+                'p99_ms': 1000 * p99}
+
+    def __str__(self):
+        return ("{events} events, jitter mean {mean_ms:.3f}ms, "
+                "p99 {p99_ms:.3f}ms, max {max_ms:.3f}ms"
+                "".format(**self.summary()))
+
+
+class Timeline(object):
+    """A list of timed note events built up from chords, phrases and gaps.
+
+    Example:
+        >>> tl = Timeline(bpm=60)
+        >>> tl.add_phrase(chords)   # one chord per beat
+        >>> tl.rest()               # a beat of silence
+        >>> tl.add(tone)
+        >>> report = tl.play()
+    """
+    def __init__(self, bpm=None, velocity=100):
+        self.bpm = bpm if bpm is not None else DEFAULT_BPM
+        self.velocity = velocity
+        self.cursor = 0.  # seconds, where the next added item will start
+        self.events = []
+
+    @property
+    def duration(self):
+        """Length of the timeline in seconds."""
+        return self.cursor
+
+    def add(self, notes, duration=4, bpm=None, velocity=None):
+        """Appends `notes` (a `Note`, `NoteContainer` or `None` for silence)
+        held for `duration` (mingus-style, 4 is a quarter note)."""
+        seconds = duration2seconds(duration, bpm or self.bpm)
+        if notes is not None:
+            if isinstance(notes, Note):
+                notes = NoteContainer([notes])
+            if velocity is None:
+                velocity = self.velocity
+            self.events.append(Event(self.cursor, True, notes, velocity))
+            self.events.append(Event(self.cursor + seconds, False, notes, 0))
+        self.cursor += seconds
+        return self
+
+    def add_phrase(self, notes, durations=None, bpm=None):
+        """Appends each of `notes` in turn, like `musictools.easy_play()`."""
+        if durations is None:
+            durations = [4] * len(notes)
+        for x, d in zip(notes, durations):
+            self.add(x, d, bpm)
+        return self
+
+    def rest(self, duration=4, bpm=None):
+        """Appends a gap, the replacement for `musictools.play_wait()`."""
+        return self.add(None, duration, bpm)
+
+    def extend(self, other):
+        """Appends all events of another `Timeline`."""
+        offset = self.cursor
+        self.events.extend(Event(e.time + offset, e.on, e.notes, e.velocity)
+                           for e in other.events)
+        self.cursor += other.cursor
+        return self
+
+    def transpose(self, semitones):
+        """Returns a copy of the timeline moved up by `semitones`, e.g. to
+        reuse a question voiced in one key in another."""
+        tl = Timeline(self.bpm, self.velocity)
+        tl.cursor = self.cursor
+        transposed = {}  # keeps each note-on and its note-off paired
+        for e in self.events:
+            if id(e.notes) not in transposed:
+                transposed[id(e.notes)] = transpose(e.notes, semitones)
+            tl.events.append(Event(e.time, e.on, transposed[id(e.notes)],
+                                   e.velocity))
+        return tl
+
+    def sorted_events(self):
+        """Returns events ordered by time, note-offs before note-ons."""
+        return sorted(self.events, key=lambda e: (e.time, e.on))
+
+    @timed('synthesize')
+    def play(self, backend=None, channel=1, clock=None, sleep=None,
+             wait_for_end=True, interrupt=None):
+        """Dispatches the timeline and returns a `TimingReport`.
+
+        Args:
+            backend: an `audio_backend.AudioBackend`.  Defaults to the current
+                backend, see `audio_backend.get_backend()`.
+            clock (callable): monotonic clock returning seconds.  Defaults to
+                `backend.now`.
+            sleep (callable): used to wait between events.  Defaults to
+                `backend.sleep`.
+            wait_for_end (bool): if True, return only once the final gap has
+                elapsed (as `play_wait` would).
+            interrupt (threading.Event, optional): if set during playback,
+                any sounding notes are stopped and `play` returns at once
+                (e.g. `getch.KeyboardReader.interrupt`)."""
+        if backend is None:
+            backend = get_backend()
+        if clock is None:
+            clock = backend.now
+        if sleep is None:
+            sleep = backend.sleep
+            if interrupt is not None and backend.realtime:
+                sleep = interrupt.wait  # wakes as soon as it's set
+        spin = SPIN_THRESHOLD if backend.realtime else 0.
+
+        lateness = []
+        sounding = []
+        start = clock()
+        for event in self.sorted_events():
+            if not _wait_until(start + event.time, clock, sleep, spin,
+                               interrupt):
+                for notes in sounding:
+                    backend.stop_NoteContainer(notes, channel)
+                break
+            if event.on:
+                backend.play_NoteContainer(event.notes, channel,
+                                           event.velocity)
+                sounding.append(event.notes)
+            else:
+                backend.stop_NoteContainer(event.notes, channel)
+                sounding.remove(event.notes)
+            lateness.append(clock() - start - event.time)
+        else:
+            if wait_for_end:
+                _wait_until(start + self.cursor, clock, sleep, spin,
+                            interrupt)
+        return TimingReport(lateness)
+
+
+def _wait_until(target, clock, sleep, spin=SPIN_THRESHOLD, interrupt=None):
+    """Sleeps until `target` (in `clock` time), finishing with a busy-wait of
+    up to `spin` seconds so that sleep overshoot doesn't make events late.
+    Returns False if `interrupt` was set first."""
+    remaining = target - clock()
+    while remaining > TOLERANCE:
+        if interrupt is not None and interrupt.is_set():
+            return False
+        if remaining > spin:
+            sleep(remaining - spin)
+        remaining = target - clock()
+    return not (interrupt is not None and interrupt.is_set())
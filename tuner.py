@@ -0,0 +1,451 @@
+"""A real-time tuner: how far the note being sung or played is from the
+nearest note, in cents, with its spectrum and pitch trace.
+
+A `Tuner` reads and analyses the microphone on a background thread and,
+after every hop, publishes a `Snapshot` (a new tuple, never modified) by
+replacing `Tuner.latest`.  Replacing an attribute is atomic, so the analysis
+never waits for the display, nor the display for the analysis: `run()` just
+draws whatever `latest` is, whenever it's new, at up to `max_fps` frames a
+second, with either
+
+    `TerminalRenderer`: a needle showing the cents (or, with `trace=True`,
+        a pitch trace scrolling down the terminal), or
+    `PlotRenderer`: the spectrum and pitch trace in matplotlib, blitted
+        (the axes are drawn once and saved, and each frame only restores
+        them and redraws the bars, trace and label).
+
+Usage:
+    $ python tuner.py                 # needle in the terminal
+    $ python tuner.py --trace         # pitch trace in the terminal
+    $ python tuner.py --plot          # spectrum and trace (needs matplotlib)
+    $ python tuner.py --benchmark     # headless, with synthetic audio
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+
+# Standard Library Dependencies
+import io
+import sys
+import time
+import argparse
+import threading
+from functools import partial
+from collections import namedtuple, deque
+
+# Internal Dependencies
+from mic_listen import (PitchDetector, NoiseGate, synthetic_audio,
+                        freq_to_number, number_to_freq, analysis_rate,
+                        device_rate, NOTE_MIN, NOTE_MAX, NOTE_NAMES, FSAMP,
+                        FRAME_SIZE, CALIBRATION_HOPS)
+from resample import PolyphaseResampler
+
+# External Dependencies
+import numpy as np
+try:
+    import pyaudio
+except ImportError:  # only needed to open the microphone
+    pyaudio = None
+
+try:
+    monotonic = time.monotonic
+except AttributeError:  # python 2
+    monotonic = time.time
+
+
+MAX_FPS = 60  # redraws per second at most
+TRACE_SECONDS = 8  # of pitch trace plotted
+NEEDLE_WIDTH = 41  # characters, from -50 to +50 cents
+
+# What the tuner heard in one hop.  `captured` and `published` are
+# `monotonic()` times; `frequency`, `midi` (fractional), `cents` (off the
+# nearest note) and `spectrum` (the peak magnitude within a quarter tone of
+# each note in range) are None while nothing's loud enough to analyse.
+Snapshot = namedtuple('Snapshot', 'index captured published level frequency '
+                                  'midi cents spectrum')
+
+
+def name(n):
+    """Returns the name of MIDI note `n`, e.g. 'C#4'."""
+    return NOTE_NAMES[n % 12] + str(n // 12 - 1)
+
+
+def peak_frequency(spectrum, freq_step, lo, hi):
+    """Returns the frequency of the largest peak of `spectrum` (an FFT's
+    magnitudes, `freq_step` Hz apart) between bins `lo` and `hi`, to a
+    fraction of a bin: the vertex of the parabola through the log magnitudes
+    of the largest bin and its neighbours."""
+    k = lo + int(spectrum[lo:hi].argmax())
+    a, b, c = np.log(spectrum[k - 1:k + 2] + 1e-12)
+    curvature = a - 2 * b + c
+    offset = 0.5 * (a - c) / curvature if curvature < 0 else 0.
+    return (k + offset) * freq_step
+
+
+class Tuner(object):
+    """Analyses the microphone on a background thread, publishing a
+    `Snapshot` as `latest` after every hop.
+
+    Args:
+        note_min, note_max (int): the MIDI notes to detect.
+        input_device_index (int, optional): the pyaudio input device.
+        source (callable, optional): if given, called for each chunk of
+            int16 audio at `rate` Hz instead of reading the device (None
+            ends the stream), e.g. `synthetic_source()`.
+        rate (int): the sample rate of `source`.
+    """
+    def __init__(self, note_min=NOTE_MIN, note_max=NOTE_MAX,
+                 input_device_index=None, source=None, rate=FSAMP):
+        self.detector = PitchDetector(note_min, note_max,
+                                      samplerate=analysis_rate(note_max),
+                                      gate=NoiseGate())
+        # the FFT bins nearer each note in range than any other
+        step = self.detector.freq_step
+        edges = np.ceil(number_to_freq(np.arange(note_min, note_max + 2) -
+                                       0.5) / step).astype(int)
+        self._edges = np.clip(edges, 1, self.detector.samples_per_fft // 2)
+        self.input_device_index = input_device_index
+        self.source = source
+        self.rate = rate
+        self.latest = None
+        self.hops = 0
+        self.analysis_times = deque(maxlen=1000)  # seconds per hop
+        self.error = None  # what stopped the stream, if it failed
+        self._audio = self._stream = self._thread = None
+        self._chunk = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        source = self.source
+        if source is None:
+            self._audio = pyaudio.PyAudio()
+            self.rate = device_rate(self._audio, self.input_device_index)
+            self._chunk = int(round(self.detector.frame_size * self.rate /
+                                    self.detector.samplerate))
+            self._stream = self._audio.open(
+                format=pyaudio.paInt16, channels=1, rate=self.rate,
+                input=True, frames_per_buffer=self._chunk,
+                input_device_index=self.input_device_index)
+            self._stream.start_stream()
+            source = self._read
+        resampler = PolyphaseResampler(self.rate, self.detector.samplerate)
+        self._thread = threading.Thread(target=self._run,
+                                        args=(source, resampler))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._stream is not None:
+            self._stream.close()
+            self._audio.terminate()
+            self._stream = self._audio = None
+
+    def _read(self):
+        return np.frombuffer(
+            self._stream.read(self._chunk, exception_on_overflow=False),
+            np.int16)
+
+    def _run(self, source, resampler):
+        while not self._stop.is_set():
+            try:
+                samples = source()
+            except (IOError, OSError) as e:  # e.g. the device was unplugged
+                self.error = e
+                break
+            if samples is None:
+                break
+            captured = monotonic()
+            for hop in resampler.hops(samples, self.detector.frame_size):
+                self.analyze(hop, captured)
+
+    def analyze(self, hop, captured=None):
+        """Runs pitch detection on the next hop (of `detector.frame_size`
+        samples), publishes its `Snapshot` as `latest` and returns it."""
+        start = monotonic()
+        detector = self.detector
+        detected = detector.process(hop)
+        x = np.asarray(hop, dtype=np.float32)
+        level = float(np.sqrt(np.dot(x, x) / len(x)))
+        freq = midi = cents = spectrum = None
+        if detected is not None:
+            edges = self._edges
+            freq = float(peak_frequency(detector.spectrum, detector.freq_step,
+                                        edges[0], edges[-1]))
+            midi = float(freq_to_number(freq))
+            cents = 100 * (midi - round(midi))
+            spectrum = np.maximum.reduceat(detector.spectrum, edges)[:-1]
+        self.hops += 1
+        now = monotonic()
+        self.analysis_times.append(now - start)
+        self.latest = Snapshot(self.hops, start if captured is None
+                               else captured, now, level, freq, midi, cents,
+                               spectrum)
+        return self.latest
+
+
+class TerminalRenderer(object):
+    """Draws each snapshot as a needle, on one line, showing how many cents
+    the note is off the nearest one -- or, with `trace=True`, as a line of a
+    pitch trace (a column per note, from `note_min` to `note_max`) scrolling
+    down the terminal."""
+    def __init__(self, note_min=NOTE_MIN, note_max=NOTE_MAX, trace=False,
+                 stream=None, width=NEEDLE_WIDTH):
+        self.note_min = note_min
+        self.note_max = note_max
+        self.trace = trace
+        self.stream = sys.stdout if stream is None else stream
+        self.width = width
+        # the trace's empty row, marking each C
+        self._row = ''.join('.' if n % 12 == 0 else ' '
+                            for n in range(note_min, note_max + 1))
+
+    def needle(self, snapshot):
+        if snapshot.midi is None:
+            return '{:<{}}'.format('  --', self.width + 32)
+        n0 = int(round(snapshot.midi))
+        bar = ['-'] * self.width
+        bar[self.width // 2] = '|'
+        bar[int(round((snapshot.cents + 50) / 100 * (self.width - 1)))] = '^'
+        return '{:>4} {:+6.1f} cents [{}] {:8.2f} Hz'.format(
+            name(n0), snapshot.cents, ''.join(bar), snapshot.frequency)
+
+    def trace_line(self, snapshot):
+        if snapshot.midi is None:
+            return '     ' + self._row
+        n0 = int(round(snapshot.midi))
+        k = min(max(n0, self.note_min), self.note_max) - self.note_min
+        return '{:>4} {}*{}'.format(name(n0), self._row[:k],
+                                    self._row[k + 1:])
+
+    def render(self, snapshot):
+        if self.trace:
+            self.stream.write(self.trace_line(snapshot) + '\n')
+        else:
+            self.stream.write('\r' + self.needle(snapshot))
+        self.stream.flush()
+
+    def idle(self):
+        pass
+
+    def close(self):
+        if not self.trace:
+            self.stream.write('\n')
+
+
+class PlotRenderer(object):
+    """Draws the spectrum of each snapshot (a bar per note) and the last
+    `trace_seconds` of pitch trace with matplotlib.
+
+    The figure is drawn once (and again whenever matplotlib redraws it, e.g.
+    on resizing) with the bars, trace and label left out, and saved; each
+    frame restores it and draws just those, then blits the figure."""
+    def __init__(self, note_min=NOTE_MIN, note_max=NOTE_MAX,
+                 trace_seconds=TRACE_SECONDS):
+        import matplotlib.pyplot as plt
+        self.plt = plt
+        self.trace_seconds = trace_seconds
+        self.trace = deque()  # (captured, midi) of recent snapshots
+        notes = np.arange(note_min, note_max + 1)
+
+        self.fig, (ax_spectrum, ax_trace) = plt.subplots(2, 1,
+                                                         figsize=(8, 6))
+        self.bars = ax_spectrum.bar(notes, np.zeros(len(notes)),
+                                    animated=True)
+        self.label = ax_spectrum.text(0.02, 0.88, '', animated=True,
+                                      transform=ax_spectrum.transAxes)
+        ax_spectrum.set_xlim(note_min - 1, note_max + 1)
+        ax_spectrum.set_ylim(0, 1)
+        ax_spectrum.set_xlabel('MIDI note')
+        self.line, = ax_trace.plot([], [], animated=True)
+        ax_trace.set_xlim(-trace_seconds, 0)
+        ax_trace.set_ylim(note_min, note_max)
+        ax_trace.set_xlabel('seconds')
+        ax_trace.set_ylabel('MIDI note')
+
+        self.canvas = self.fig.canvas
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        plt.show(block=False)
+        plt.pause(0.1)  # draws the figure, saving the background
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for bar in self.bars:
+            self.fig.draw_artist(bar)
+        self.fig.draw_artist(self.line)
+        self.fig.draw_artist(self.label)
+
+    def render(self, snapshot):
+        trace = self.trace
+        trace.append((snapshot.captured,
+                      np.nan if snapshot.midi is None else snapshot.midi))
+        while trace[0][0] < snapshot.captured - self.trace_seconds:
+            trace.popleft()
+        t, midi = np.array(trace).T
+        self.line.set_data(t - snapshot.captured, midi)
+
+        if snapshot.spectrum is None:
+            heights = np.zeros(len(self.bars))
+            self.label.set_text('')
+        else:
+            heights = snapshot.spectrum / max(snapshot.spectrum.max(), 1e-12)
+            self.label.set_text('{} {:+.0f} cents'.format(
+                name(int(round(snapshot.midi))), snapshot.cents))
+        for bar, height in zip(self.bars, heights):
+            bar.set_height(height)
+
+        if self.background is not None:
+            self.canvas.restore_region(self.background)
+            self._draw_artists()
+            self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+
+    def idle(self):
+        self.canvas.flush_events()
+
+    def close(self):
+        self.plt.close(self.fig)
+
+
+def run(tuner, renderer, max_fps=MAX_FPS, seconds=None):
+    """Draws each new snapshot of `tuner` with `renderer`, checking at most
+    `max_fps` times a second, until `seconds` have passed, the tuner stops
+    or Ctrl-C is pressed.  Returns the update latencies: the seconds from
+    each snapshot drawn being published to its having been drawn."""
+    period = 1. / max_fps
+    latencies = []
+    last = None
+    start = next_frame = monotonic()
+    try:
+        while tuner.running or tuner.latest is not last:
+            if seconds is not None and monotonic() - start >= seconds:
+                break
+            snapshot = tuner.latest
+            if snapshot is not None and snapshot is not last:
+                renderer.render(snapshot)
+                latencies.append(monotonic() - snapshot.published)
+                last = snapshot
+            else:
+                renderer.idle()
+            next_frame += period
+            delay = next_frame - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:  # drawing's too slow for `max_fps`; don't catch up
+                next_frame = monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        renderer.close()
+    return latencies
+
+
+def synthetic_source(midi_notes, hops_per_note=8, speed=1., lateness=None):
+    """Returns a `Tuner` source giving synthetic audio of `midi_notes` (which
+    may be fractional, i.e. out of tune) at `speed` times real time, after
+    enough quiet noise to calibrate the `NoiseGate`.  If given, `lateness`
+    is appended how late (in seconds) each hop was asked for."""
+    noise = np.random.RandomState(0).randn(CALIBRATION_HOPS * FRAME_SIZE)
+    audio = np.concatenate([(150 * noise).astype(np.int16),
+                            synthetic_audio(midi_notes, hops_per_note)])
+    period = FRAME_SIZE / FSAMP / speed
+
+    def hops():
+        due = monotonic()
+        for hop in audio.reshape(-1, FRAME_SIZE):
+            due += period
+            delay = due - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if lateness is not None:
+                lateness.append(max(0., -delay))
+            yield hop
+    return partial(next, hops(), None)
+
+
+def cents_error(midi_notes=(57.3, 60., 64.42, 69.15, 45.8, 76.67),
+                hops_per_note=24):
+    """Returns the largest error, in cents, of the tuner's reading at the end
+    of each of `midi_notes` (held for `hops_per_note` hops)."""
+    tuner = Tuner(rate=FSAMP)
+    source = synthetic_source(midi_notes, hops_per_note, speed=np.inf)
+    resampler = PolyphaseResampler(FSAMP, tuner.detector.samplerate)
+    readings = []
+    for k in range(CALIBRATION_HOPS + len(midi_notes) * hops_per_note):
+        for hop in resampler.hops(source(), tuner.detector.frame_size):
+            tuner.analyze(hop)
+        if k >= CALIBRATION_HOPS and (k - CALIBRATION_HOPS + 1) % \
+                hops_per_note == 0:
+            readings.append(tuner.latest.midi)
+    return max(100 * abs(r - n) for r, n in zip(readings, midi_notes))
+
+
+def benchmark(seconds=3., max_fps=MAX_FPS, speed=1.):
+    """Runs a `Tuner` on synthetic, out of tune notes in real time, drawing
+    with a `TerminalRenderer` into a string (so no terminal or display is
+    needed).  Returns the update latency (publication to drawn: mean, 99th
+    percentile and max, in ms), the analysis time per hop (ms), the frames
+    drawn per second, the most any hop's capture was delayed (ms) and the
+    tuner's largest error (cents)."""
+    rng = np.random.RandomState(0)
+    notes = rng.uniform(NOTE_MIN + 12, NOTE_MAX - 12, 64)
+    lateness = []
+    tuner = Tuner(source=synthetic_source(notes, speed=speed,
+                                          lateness=lateness)).start()
+    renderer = TerminalRenderer(stream=io.StringIO())
+    latencies = run(tuner, renderer, max_fps, seconds)
+    tuner.close()
+    latencies = 1000 * np.array(latencies)
+    return {'update_latency_ms': float(latencies.mean()),
+            'update_latency_p99_ms': float(np.percentile(latencies, 99)),
+            'update_latency_max_ms': float(latencies.max()),
+            'analysis_ms': 1000 * float(np.mean(tuner.analysis_times)),
+            'frames_per_second': len(latencies) / seconds,
+            'capture_delay_max_ms': 1000 * max(lateness),
+            'cents_error': cents_error()}
+
+
+def get_user_args():
+    parser = argparse.ArgumentParser(description="A real-time tuner.")
+    parser.add_argument('--trace', action='store_true',
+                        help="Show a pitch trace instead of a needle.")
+    parser.add_argument('--plot', action='store_true',
+                        help="Plot the spectrum and trace with matplotlib.")
+    parser.add_argument('--device', type=int, default=None,
+                        help="The pyaudio input device index.")
+    parser.add_argument('--fps', type=float, default=MAX_FPS,
+                        help="Redraws per second at most.")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="Measure latency, headless, on synthetic audio.")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_user_args()
+    if args.benchmark:
+        for k, v in sorted(benchmark(max_fps=args.fps).items()):
+            print("{:<24} {:8.3f}".format(k, v))
+    else:
+        tuner = Tuner(input_device_index=args.device).start()
+        if args.plot:
+            renderer = PlotRenderer()
+        else:
+            renderer = TerminalRenderer(trace=args.trace)
+        try:
+            run(tuner, renderer, args.fps)
+        finally:
+            tuner.close()